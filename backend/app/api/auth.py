@@ -3,18 +3,18 @@ Authentication and authorization endpoints
 """
 from fastapi import APIRouter, Depends, HTTPException, Form, status
 from fastapi.security import OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.database import get_db
+from app.core.database import get_async_db
 from app.core.models import User
 from app.core.schemas import Token
 from app.utils.auth import (
     get_current_active_user,
     create_access_token,
     create_refresh_token,
-    save_refresh_token
+    save_refresh_token_async
 )
-from app.utils.users import authenticate_user
+from app.utils.users import authenticate_user_async
 from app.utils.vk import vk_login, vk_callback
 
 router = APIRouter()
@@ -23,9 +23,9 @@ router = APIRouter()
 @router.post("/token", response_model=Token)
 async def login_for_access_token(
     form_data: OAuth2PasswordRequestForm = Depends(),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user = authenticate_user(db, form_data.username, form_data.password)
+    user = await authenticate_user_async(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=400, detail="Неверное имя пользователя/email или пароль")
@@ -35,7 +35,7 @@ async def login_for_access_token(
     refresh_token = create_refresh_token(
         data={"sub": user.username, "role": user.role})
 
-    save_refresh_token(db, user.id, refresh_token)
+    await save_refresh_token_async(db, user.id, refresh_token)
 
     return Token(
         access_token=access_token,
@@ -47,7 +47,7 @@ async def login_for_access_token(
 @router.post("/refresh", response_model=Token)
 async def refresh_access_token(
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     access_token = create_access_token(
         data={"sub": current_user.username, "role": current_user.role}
@@ -56,7 +56,7 @@ async def refresh_access_token(
         data={"sub": current_user.username, "role": current_user.role}
     )
 
-    save_refresh_token(db, current_user.id, refresh_token)
+    await save_refresh_token_async(db, current_user.id, refresh_token)
 
     return Token(
         access_token=access_token,
@@ -69,9 +69,9 @@ async def refresh_access_token(
 async def login_with_username_or_email(
     username_or_email: str = Form(...),
     password: str = Form(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    user = authenticate_user(db, username_or_email, password)
+    user = await authenticate_user_async(db, username_or_email, password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -84,7 +84,7 @@ async def login_with_username_or_email(
     refresh_token = create_refresh_token(
         data={"sub": user.username, "role": user.role})
 
-    save_refresh_token(db, user.id, refresh_token)
+    await save_refresh_token_async(db, user.id, refresh_token)
 
     return Token(
         access_token=access_token,
@@ -99,5 +99,5 @@ async def login_vk_route():
 
 
 @router.get("/vk-callback")
-async def vk_callback_route(code: str, db: Session = Depends(get_db)):
+async def vk_callback_route(code: str, db: AsyncSession = Depends(get_async_db)):
     return await vk_callback(code, db)
@@ -1,46 +1,69 @@
 """
 API endpoints for courses management
 """
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, Query, status, Path, UploadFile, File, Form
-from sqlalchemy.orm import Session, joinedload
+from typing import List, Optional, Union
+from fastapi import APIRouter, Depends, HTTPException, Query, status, Path, UploadFile, File, Form, Request
+from sqlalchemy.orm import Session, selectinload
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import desc
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy import select
+from pydantic import ValidationError
 
-from app.core.database import get_db
-from app.core.models import Course, Category, CourseEnrollment, User, Lesson
+from app.core.database import get_db, get_async_db
+from app.core.models import Course, Category, CourseEnrollment, User, Lesson, LessonCompletion
 from app.core.schemas import (
     CategoryCreate, CategoryOut, CourseCreate, CourseOut, CourseUpdate,
     EnrollmentCreate, EnrollmentOut, EnrollmentUpdate,
     EnrollmentWithCourse, CoursesResponse, CategoriesResponse,
-    LessonCreate, LessonOut, LessonUpdate, CourseWithLessons,
-    CourseWithProgress, MyCoursesResponse, CourseEditResponse
+    LessonCreate, LessonOut, LessonUpdate, LessonReorder, LessonPosition, CourseWithLessons,
+    CourseSyllabus,
+    CourseWithProgress, MyCoursesResponse, CourseEditResponse,
+    BulkEnrollmentRequest, BulkEnrollmentReport
 )
-from app.utils.auth import get_current_user, get_optional_current_user
+from app.utils.queries import query_budget
+from app.utils.auth import get_current_user, get_optional_current_user, RoleChecker
 from app.utils.courses import (
-    get_filtered_courses_query, get_paginated_courses, is_enrolled,
-    get_user_course_progress, update_course_access_time,
-    get_popular_courses, get_recent_courses, enroll_user_to_course,
-    get_user_enrolled_courses, get_recommended_courses,
-    get_course_by_id, check_course_owner, reorder_lessons
+    get_course_by_id, check_course_owner,
+    ensure_sequential_lesson_order, shift_lessons, move_lesson, set_lesson_order,
+    get_lesson_positions, get_lesson_summaries_async, get_lesson_by_id_async,
+    get_lesson_stored_field_async,
+    get_paginated_courses_async, get_user_course_progress_async,
+    set_lesson_completed_async, refresh_course_progress,
+    get_popular_courses_async, get_recent_courses_async,
+    upsert_enrollment_async, get_user_enrolled_courses_async,
+    get_recommended_courses_async, get_author_courses_async,
+    get_course_by_id_async, get_course_with_lessons_by_id_async,
+    unenroll_user_from_course_async, get_courses_by_cursor_async,
+    get_author_courses_by_cursor_async, get_user_enrolled_courses_by_cursor_async
 )
 from app.utils.file_storage import save_course_image, delete_course_image
+from app.utils.search import index_course, remove_course_from_index
+from app.utils.response_cache import response_cache, POPULAR, RECENT, CATEGORIES
+from app.utils.recommendations import recommendation_engine
+from app.utils.access_times import access_time_buffer
+from app.utils.compression import stored_content_response
+from app.utils.bulk_enrollment import import_enrollments, rows_from_csv_stream, rows_from_items
 
 router = APIRouter(prefix="/courses")
 
 
 # Категории курсов
 @router.get("/categories", response_model=CategoriesResponse)
+@query_budget(3)
 async def list_categories(
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Получение списка всех категорий курсов"""
-    try:
-        categories = db.query(Category).all()
+    async def load():
+        result = await db.execute(select(Category))
+        categories = [CategoryOut.model_validate(c) for c in result.scalars().all()]
         return {
             "items": categories,
             "total": len(categories),
         }
+
+    try:
+        return await response_cache.get_or_load(CATEGORIES, "all", load)
     except SQLAlchemyError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -49,7 +72,7 @@ async def list_categories(
 
 
 @router.post("/categories", response_model=CategoryOut, status_code=status.HTTP_201_CREATED)
-async def create_category(
+def create_category(
     category: CategoryCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -74,6 +97,7 @@ async def create_category(
         db_category = Category(**category.model_dump())
         db.add(db_category)
         db.commit()
+        response_cache.invalidate(CATEGORIES)
         db.refresh(db_category)
         return db_category
     except SQLAlchemyError as e:
@@ -87,12 +111,11 @@ async def create_category(
 @router.get("/categories/{category_id}", response_model=CategoryOut)
 async def get_category(
     category_id: int = Path(..., title="ID категории"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Получение информации о конкретной категории"""
     try:
-        category = db.query(Category).filter(
-            Category.id == category_id).first()
+        category = await db.get(Category, category_id)
         if not category:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -108,6 +131,7 @@ async def get_category(
 
 # Курсы - статические пути
 @router.get("", response_model=CoursesResponse)
+@query_budget(4)
 async def list_courses(
     page: int = Query(1, ge=1, description="Номер страницы"),
     size: int = Query(10, ge=1, le=100,
@@ -119,19 +143,45 @@ async def list_courses(
     difficulties: Optional[List[str]] = Query(
         None, description="Фильтр по нескольким уровням сложности"),
     search: Optional[str] = Query(
-        None, description="Поиск только по названию и описанию"),
+        None, description="Полнотекстовый поиск по курсам и названиям уроков (с учетом префиксов)"),
     category_names: Optional[List[str]] = Query(
         None, description="Фильтр по названиям категорий"),
     author: Optional[str] = Query(None, description="Фильтр по автору"),
     sort_by: Optional[str] = Query(
-        "created_at", description="Поле для сортировки"),
+        "created_at", description="Поле для сортировки или relevance для сортировки по релевантности поиска"),
     sort_order: Optional[str] = Query(
         "desc", description="Порядок сортировки (asc/desc)"),
-    db: Session = Depends(get_db)
+    cursor: Optional[str] = Query(
+        None, description="Курсор следующей страницы; пустое значение включает пагинацию по курсору с первой страницы"),
+    include_total: bool = Query(
+        False, description="Вернуть общее количество элементов при пагинации по курсору"),
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Получение списка курсов с возможностью фильтрации и сортировки"""
     try:
-        courses, total, pages = get_paginated_courses(
+        if cursor is not None:
+            courses, next_cursor, total = await get_courses_by_cursor_async(
+                db,
+                cursor=cursor,
+                size=size,
+                sort_by=sort_by,
+                sort_order=sort_order,
+                include_total=include_total,
+                category_id=category_id,
+                difficulty=difficulty,
+                difficulties=difficulties,
+                search=search,
+                category_names=category_names,
+                author=author
+            )
+            return {
+                "items": courses,
+                "total": total,
+                "size": size,
+                "next_cursor": next_cursor
+            }
+
+        courses, total, pages = await get_paginated_courses_async(
             db, page, size,
             sort_by=sort_by,
             sort_order=sort_order,
@@ -158,13 +208,18 @@ async def list_courses(
 
 
 @router.get("/popular", response_model=List[CourseOut])
+@query_budget(3)
 async def list_popular_courses(
     limit: int = Query(5, ge=1, le=20, description="Количество курсов"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Получение списка самых популярных курсов"""
+    async def load():
+        courses = await get_popular_courses_async(db, limit)
+        return [CourseOut.model_validate(course) for course in courses]
+
     try:
-        return get_popular_courses(db, limit)
+        return await response_cache.get_or_load(POPULAR, limit, load)
     except SQLAlchemyError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -173,13 +228,18 @@ async def list_popular_courses(
 
 
 @router.get("/recent", response_model=List[CourseOut])
+@query_budget(3)
 async def list_recent_courses(
     limit: int = Query(5, ge=1, le=20, description="Количество курсов"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Получение списка недавно добавленных курсов"""
+    async def load():
+        courses = await get_recent_courses_async(db, limit)
+        return [CourseOut.model_validate(course) for course in courses]
+
     try:
-        return get_recent_courses(db, limit)
+        return await response_cache.get_or_load(RECENT, limit, load)
     except SQLAlchemyError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -187,15 +247,32 @@ async def list_recent_courses(
         )
 
 
+@router.get("/cache-stats")
+async def get_response_cache_stats(
+    _: bool = Depends(RoleChecker(allowed_roles=["admin"]))
+):
+    """Статистика кэша ответов по ключам (только для администраторов)"""
+    return response_cache.stats()
+
+
+@router.get("/recommendation-stats")
+async def get_recommendation_stats(
+    _: bool = Depends(RoleChecker(allowed_roles=["admin"]))
+):
+    """Состояние индекса рекомендаций (только для администраторов)"""
+    return recommendation_engine.stats()
+
+
 @router.get("/recommended", response_model=List[CourseOut])
+@query_budget(8)
 async def list_recommended_courses(
     limit: int = Query(5, ge=1, le=20, description="Количество курсов"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Получение списка рекомендуемых курсов для текущего пользователя"""
     try:
-        return get_recommended_courses(db, current_user.id, limit)
+        return await get_recommended_courses_async(db, current_user.id, limit)
     except SQLAlchemyError as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -204,11 +281,16 @@ async def list_recommended_courses(
 
 
 @router.get("/created-by-me", response_model=CoursesResponse)
+@query_budget(5)
 async def get_my_created_courses(
     page: int = Query(1, ge=1, description="Номер страницы"),
     size: int = Query(10, ge=1, le=100,
                       description="Количество элементов на странице"),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(
+        None, description="Курсор следующей страницы; пустое значение включает пагинацию по курсору с первой страницы"),
+    include_total: bool = Query(
+        False, description="Вернуть общее количество элементов при пагинации по курсору"),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Получение списка курсов, созданных текущим пользователем"""
@@ -223,23 +305,19 @@ async def get_my_created_courses(
                 "pages": 0
             }
 
-        # Получаем курсы, где автор - текущий пользователь
-        query = db.query(Course).filter(
-            Course.author == current_user.username
-        ).options(
-            joinedload(Course.categories)
-        ).order_by(
-            desc(Course.created_at)
-        )
-
-        # Подсчет общего количества записей
-        total = query.count()
-
-        # Применение пагинации
-        courses = query.offset((page - 1) * size).limit(size).all()
+        if cursor is not None:
+            courses, next_cursor, total = await get_author_courses_by_cursor_async(
+                db, current_user.username, cursor, size, include_total)
+            return {
+                "items": courses,
+                "total": total,
+                "size": size,
+                "next_cursor": next_cursor
+            }
 
-        # Расчет общего количества страниц
-        pages = (total + size - 1) // size if total > 0 else 0
+        # Получаем курсы, где автор - текущий пользователь
+        courses, total, pages = await get_author_courses_async(
+            db, current_user.username, page, size)
 
         return {
             "items": courses,
@@ -256,16 +334,31 @@ async def get_my_created_courses(
 
 
 @router.get("/my-courses", response_model=MyCoursesResponse)
+@query_budget(5)
 async def get_my_courses(
     page: int = Query(1, ge=1, description="Номер страницы"),
     size: int = Query(10, ge=1, le=100,
                       description="Количество элементов на странице"),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(
+        None, description="Курсор следующей страницы; пустое значение включает пагинацию по курсору с первой страницы"),
+    include_total: bool = Query(
+        False, description="Вернуть общее количество элементов при пагинации по курсору"),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Получение списка курсов пользователя с пагинацией и прогрессом"""
     try:
-        courses, total, pages = get_user_enrolled_courses(
+        if cursor is not None:
+            courses, next_cursor, total = await get_user_enrolled_courses_by_cursor_async(
+                db, current_user.id, cursor, size, include_total)
+            return {
+                "items": courses,
+                "total": total,
+                "size": size,
+                "next_cursor": next_cursor
+            }
+
+        courses, total, pages = await get_user_enrolled_courses_async(
             db, current_user.id, page, size)
 
         return {
@@ -283,7 +376,7 @@ async def get_my_courses(
 
 
 @router.post("", response_model=CourseOut, status_code=status.HTTP_201_CREATED)
-async def create_course(
+def create_course(
     course: CourseCreate,
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -323,8 +416,12 @@ async def create_course(
         db_course.categories = categories
 
         db.add(db_course)
+        db.flush()
+        index_course(db, db_course.id)
         db.commit()
+        response_cache.invalidate(RECENT, CATEGORIES)
         db.refresh(db_course)
+        recommendation_engine.update_course(db_course.id, [c.id for c in db_course.categories])
         return db_course
     except SQLAlchemyError as e:
         db.rollback()
@@ -335,7 +432,7 @@ async def create_course(
 
 
 @router.post("/form", response_model=CourseOut, status_code=status.HTTP_201_CREATED)
-async def create_course_form(
+def create_course_form(
     title: str = Form(...),
     description: str = Form(...),
     longdescription: str = Form(...),
@@ -395,8 +492,12 @@ async def create_course_form(
         db_course.categories = categories
 
         db.add(db_course)
+        db.flush()
+        index_course(db, db_course.id)
         db.commit()
+        response_cache.invalidate(RECENT, CATEGORIES)
         db.refresh(db_course)
+        recommendation_engine.update_course(db_course.id, [c.id for c in db_course.categories])
         return db_course
     except SQLAlchemyError as e:
         db.rollback()
@@ -410,39 +511,38 @@ async def create_course_form(
 @router.post("/enroll", response_model=EnrollmentOut, status_code=status.HTTP_201_CREATED)
 async def enroll_in_course(
     enrollment: EnrollmentCreate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Запись пользователя на курс"""
     try:
         # Проверка существования курса
-        course = db.query(Course).filter(
-            Course.id == enrollment.course_id).first()
+        course = await db.get(Course, enrollment.course_id)
         if not course:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail=f"Курс с ID {enrollment.course_id} не найден"
             )
 
-        # Используем функцию is_enrolled для проверки
-        if is_enrolled(db, current_user.id, enrollment.course_id):
+        # Одна вставка с ON CONFLICT: повторная запись не создает дубликат
+        db_enrollment, created = await upsert_enrollment_async(
+            db, current_user.id, enrollment.course_id)
+        if created is False:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail="Вы уже записаны на этот курс"
             )
-
-        # Используем вспомогательную функцию для записи на курс
-        db_enrollment = enroll_user_to_course(
-            db, current_user.id, enrollment.course_id)
         if not db_enrollment:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="Ошибка при записи на курс"
             )
 
+        # Изменился счетчик студентов, от которого зависит список популярных курсов
+        response_cache.invalidate(POPULAR)
         return db_enrollment
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Ошибка при записи на курс: {str(e)}"
@@ -450,17 +550,24 @@ async def enroll_in_course(
 
 
 @router.get("/enrollments", response_model=List[EnrollmentWithCourse])
+@query_budget(5)
 async def get_user_enrollments(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Получение списка курсов, на которые записан текущий пользователь"""
     try:
-        enrollments = db.query(CourseEnrollment).filter(
-            CourseEnrollment.user_id == current_user.id
-        ).order_by(
-            CourseEnrollment.last_accessed_at.desc()
-        ).all()
+        result = await db.execute(
+            select(CourseEnrollment).where(
+                CourseEnrollment.user_id == current_user.id
+            ).options(
+                selectinload(CourseEnrollment.course).selectinload(
+                    Course.categories)
+            ).order_by(
+                CourseEnrollment.last_accessed_at.desc()
+            )
+        )
+        enrollments = result.scalars().all()
         return enrollments
     except SQLAlchemyError as e:
         raise HTTPException(
@@ -469,35 +576,70 @@ async def get_user_enrollments(
         )
 
 
+@router.post("/enrollments/bulk", response_model=BulkEnrollmentReport)
+async def bulk_enroll(
+    request: Request,
+    errors_only: bool = Query(False, description="Возвращать только строки с ошибками"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user),
+    _: bool = Depends(RoleChecker(allowed_roles=["admin", "teacher"]))
+):
+    """
+    Массовая запись пользователей на курсы.
+    Принимает JSON {"items": [{"user_id" | "username", "course_id"}]} или
+    CSV (Content-Type: text/csv) с заголовком user_id или username и course_id;
+    CSV читается потоком. Преподаватель может записывать только на свои курсы.
+    Повторная запись не считается ошибкой и возвращает статус already_enrolled.
+    """
+    content_type = request.headers.get("content-type", "")
+    if content_type.startswith("text/csv"):
+        rows = rows_from_csv_stream(request.stream())
+    else:
+        try:
+            payload = BulkEnrollmentRequest.model_validate_json(await request.body())
+        except ValidationError as e:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=e.errors(include_url=False, include_context=False)
+            )
+        rows = rows_from_items(payload.items)
+
+    report = await import_enrollments(db, rows, current_user, errors_only)
+    if report["enrolled"]:
+        response_cache.invalidate(POPULAR)
+    return report
+
+
 # Курсы - параметризованные пути
-@router.get("/{course_id}/with-lessons", response_model=CourseWithLessons)
+@router.get("/{course_id}/with-lessons", response_model=Union[CourseWithLessons, CourseSyllabus])
+@query_budget(4)
 async def get_course_with_lessons(
     course_id: int = Path(..., title="ID курса"),
-    db: Session = Depends(get_db),
+    summary: bool = Query(False, description="Только программа курса: уроки без содержимого"),
+    db: AsyncSession = Depends(get_async_db),
     current_user: Optional[User] = Depends(get_optional_current_user)
 ):
-    """Получение подробной информации о курсе со всеми уроками"""
+    """
+    Получение подробной информации о курсе со всеми уроками.
+    С summary=true уроки возвращаются без content и scene_data, с их размерами;
+    полное содержимое урока - GET /{course_id}/lessons/{lesson_id}
+    """
     try:
-        course = db.query(Course).filter(Course.id == course_id).first()
-        if not course:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Курс с ID {course_id} не найден"
-            )
+        if summary:
+            course = await get_course_by_id_async(db, course_id)
+            lessons = await get_lesson_summaries_async(db, course_id)
+        else:
+            course = await get_course_with_lessons_by_id_async(db, course_id)
 
-        # Получаем уроки
-        lessons = db.query(Lesson).filter(
-            Lesson.course_id == course_id).order_by(Lesson.order).all()
-
-        # Если пользователь авторизован, обновляем время доступа
+        # Время доступа записывается в базу пакетом в фоне
         if current_user:
-            if is_enrolled(db, current_user.id, course_id):
-                update_course_access_time(db, current_user.id, course_id)
+            access_time_buffer.touch(current_user.id, course_id)
+
+        if summary:
+            return CourseSyllabus(**CourseOut.model_validate(course).model_dump(), lessons=lessons)
 
         # Создаем объект CourseWithLessons
         course_with_lessons = CourseWithLessons.from_orm(course)
-        course_with_lessons.lessons = lessons
-
         return course_with_lessons
     except SQLAlchemyError as e:
         raise HTTPException(
@@ -507,15 +649,16 @@ async def get_course_with_lessons(
 
 
 @router.get("/{course_id}/progress", response_model=dict)
+@query_budget(5)
 async def get_course_progress(
     course_id: int = Path(..., title="ID курса"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Получение информации о прогрессе пользователя по курсу"""
     try:
         # Проверяем существование курса
-        course = db.query(Course).filter(Course.id == course_id).first()
+        course = await db.get(Course, course_id)
         if not course:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -523,7 +666,7 @@ async def get_course_progress(
             )
 
         # Получаем прогресс пользователя
-        progress = get_user_course_progress(db, current_user.id, course_id)
+        progress = await get_user_course_progress_async(db, current_user.id, course_id)
         if not progress:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -539,7 +682,7 @@ async def get_course_progress(
 
 
 @router.post("/{course_id}/upload-image", response_model=dict)
-async def upload_course_image(
+def upload_course_image(
     course_id: int,
     image: UploadFile = File(...),
     db: Session = Depends(get_db),
@@ -560,6 +703,7 @@ async def upload_course_image(
         # Обновляем курс
         course.image_url = image_url
         db.commit()
+        response_cache.invalidate(POPULAR, RECENT)
 
         # Удаляем старое изображение, если оно существовало
         if old_image_url:
@@ -576,7 +720,7 @@ async def upload_course_image(
 
 # Уроки
 @router.post("/{course_id}/lessons", response_model=LessonOut, status_code=status.HTTP_201_CREATED)
-async def create_lesson(
+def create_lesson(
     lesson: LessonCreate,
     course_id: int = Path(..., title="ID курса"),
     db: Session = Depends(get_db),
@@ -588,21 +732,29 @@ async def create_lesson(
         course = get_course_by_id(db, course_id)
         check_course_owner(course, current_user)
 
+        # Освобождаем позицию для урока, сдвигая следующие уроки одним запросом
+        total = ensure_sequential_lesson_order(db, course_id)
+        position = max(1, min(total + 1, lesson.order))
+        shift_lessons(db, course_id, position, None, 1)
+
         # Создаем урок
         db_lesson = Lesson(
             course_id=course_id,
             title=lesson.title,
             content=lesson.content,
-            order=lesson.order,
+            order=position,
             scene_data=lesson.scene_data
         )
 
         db.add(db_lesson)
 
-        # Обновляем количество уроков в курсе
+        # Обновляем количество уроков в курсе и прогресс записей с пройденными уроками
         course.lessons_count += 1
+        refresh_course_progress(db, course_id, course.lessons_count)
 
+        index_course(db, course_id)
         db.commit()
+        response_cache.invalidate(POPULAR, RECENT)
         db.refresh(db_lesson)
         return db_lesson
     except SQLAlchemyError as e:
@@ -613,8 +765,112 @@ async def create_lesson(
         )
 
 
+@router.get("/{course_id}/lessons/{lesson_id}", response_model=LessonOut)
+async def get_lesson(
+    course_id: int = Path(..., title="ID курса"),
+    lesson_id: int = Path(..., title="ID урока"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """Получение урока со всем содержимым"""
+    try:
+        return await get_lesson_by_id_async(db, course_id, lesson_id)
+    except SQLAlchemyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при получении урока: {str(e)}"
+        )
+
+
+@router.get("/{course_id}/lessons/{lesson_id}/content")
+async def get_lesson_content(
+    request: Request,
+    course_id: int = Path(..., title="ID курса"),
+    lesson_id: int = Path(..., title="ID урока"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Получение текста урока (HTML). Сжатый при хранении текст отдается
+    клиентам, поддерживающим gzip, без распаковки
+    """
+    try:
+        data = await get_lesson_stored_field_async(db, course_id, lesson_id, "content")
+        return stored_content_response(data, "text/html; charset=utf-8", request.headers)
+    except SQLAlchemyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при получении урока: {str(e)}"
+        )
+
+
+@router.get("/{course_id}/lessons/{lesson_id}/scene")
+async def get_lesson_scene(
+    request: Request,
+    course_id: int = Path(..., title="ID курса"),
+    lesson_id: int = Path(..., title="ID урока"),
+    db: AsyncSession = Depends(get_async_db)
+):
+    """
+    Получение JSON интерактивной сцены урока. Сжатые при хранении данные
+    отдаются клиентам, поддерживающим gzip, без распаковки
+    """
+    try:
+        data = await get_lesson_stored_field_async(db, course_id, lesson_id, "scene_data")
+        if data is None or data in (b"", b"null"):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"У урока с ID {lesson_id} нет интерактивной сцены"
+            )
+        return stored_content_response(data, "application/json", request.headers)
+    except SQLAlchemyError as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при получении урока: {str(e)}"
+        )
+
+
+@router.put("/{course_id}/lessons/order", response_model=List[LessonPosition])
+def reorder_course_lessons(
+    reorder: LessonReorder,
+    course_id: int = Path(..., title="ID курса"),
+    db: Session = Depends(get_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Изменение порядка уроков курса: полный новый порядок или перемещение
+    одного урока. Возвращает итоговые позиции всех уроков.
+    """
+    try:
+        course = get_course_by_id(db, course_id)
+        check_course_owner(course, current_user)
+
+        if reorder.lesson_ids is not None:
+            set_lesson_order(db, course_id, reorder.lesson_ids)
+        else:
+            db_lesson = db.query(Lesson).filter(
+                Lesson.id == reorder.lesson_id,
+                Lesson.course_id == course_id
+            ).first()
+
+            if not db_lesson:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail=f"Урок с ID {reorder.lesson_id} не найден"
+                )
+
+            move_lesson(db, course_id, db_lesson, reorder.order)
+
+        db.commit()
+        return get_lesson_positions(db, course_id)
+    except SQLAlchemyError as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при изменении порядка уроков: {str(e)}"
+        )
+
+
 @router.put("/{course_id}/lessons/{lesson_id}", response_model=LessonOut)
-async def update_lesson(
+def update_lesson(
     lesson_update: LessonUpdate,
     course_id: int = Path(..., title="ID курса"),
     lesson_id: int = Path(..., title="ID урока"),
@@ -641,16 +897,20 @@ async def update_lesson(
 
         # Обновляем поля урока
         update_data = lesson_update.model_dump(exclude_unset=True)
+        new_order = update_data.pop("order", None)
         for key, value in update_data.items():
             setattr(db_lesson, key, value)
 
-        db.commit()
-        db.refresh(db_lesson)
+        # Изменение порядка сдвигает соседние уроки в той же транзакции
+        if new_order is not None:
+            db.flush()
+            move_lesson(db, course_id, db_lesson, new_order)
 
-        # Если изменили порядок уроков, пересортируем их
-        if "order" in update_data:
-            reorder_lessons(db, course_id)
+        if "title" in update_data:
+            index_course(db, course_id)
 
+        db.commit()
+        db.refresh(db_lesson)
         return db_lesson
     except SQLAlchemyError as e:
         db.rollback()
@@ -661,7 +921,7 @@ async def update_lesson(
 
 
 @router.delete("/{course_id}/lessons/{lesson_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_lesson(
+def delete_lesson(
     course_id: int = Path(..., title="ID курса"),
     lesson_id: int = Path(..., title="ID урока"),
     db: Session = Depends(get_db),
@@ -685,17 +945,24 @@ async def delete_lesson(
                 detail=f"Урок с ID {lesson_id} не найден"
             )
 
-        # Удаляем урок
-        db.delete(db_lesson)
-
-        # Обновляем количество уроков в курсе
+        # Обновляем количество уроков в курсе, снимаем отметки урока
+        # и пересчитываем прогресс записей с пройденными уроками. Это делается
+        # до удаления урока: при включенных внешних ключах каскад удалит
+        # отметки вместе с уроком, и уменьшить счетчики будет не по чему
         course.lessons_count -= 1
+        refresh_course_progress(db, course_id, course.lessons_count, removed_lesson_id=lesson_id)
 
-        db.commit()
-
-        # Пересортируем оставшиеся уроки
-        reorder_lessons(db, course_id)
+        # Удаляем урок и сдвигаем следующие за ним уроки одним запросом
+        ensure_sequential_lesson_order(db, course_id)
+        db.refresh(db_lesson, ["order"])
+        deleted_order = db_lesson.order
+        db.delete(db_lesson)
+        db.flush()
+        shift_lessons(db, course_id, deleted_order + 1, None, -1)
 
+        index_course(db, course_id)
+        db.commit()
+        response_cache.invalidate(POPULAR, RECENT)
         return None
     except SQLAlchemyError as e:
         db.rollback()
@@ -705,26 +972,76 @@ async def delete_lesson(
         )
 
 
+@router.post("/{course_id}/lessons/{lesson_id}/complete", response_model=EnrollmentOut)
+@query_budget(6)
+async def complete_lesson(
+    course_id: int = Path(..., title="ID курса"),
+    lesson_id: int = Path(..., title="ID урока"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    Отметка урока пройденным. Прогресс записи на курс пересчитывается
+    по числу пройденных уроков, повторная отметка ничего не меняет
+    """
+    try:
+        enrollment = await set_lesson_completed_async(
+            db, current_user.id, course_id, lesson_id, completed=True)
+        if not enrollment:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Ошибка при обновлении прогресса"
+            )
+        return enrollment
+    except SQLAlchemyError as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при обновлении прогресса: {str(e)}"
+        )
+
+
+@router.delete("/{course_id}/lessons/{lesson_id}/complete", response_model=EnrollmentOut)
+@query_budget(6)
+async def uncomplete_lesson(
+    course_id: int = Path(..., title="ID курса"),
+    lesson_id: int = Path(..., title="ID урока"),
+    db: AsyncSession = Depends(get_async_db),
+    current_user: User = Depends(get_current_user)
+):
+    """Снятие отметки о прохождении урока"""
+    try:
+        enrollment = await set_lesson_completed_async(
+            db, current_user.id, course_id, lesson_id, completed=False)
+        if not enrollment:
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Ошибка при обновлении прогресса"
+            )
+        return enrollment
+    except SQLAlchemyError as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при обновлении прогресса: {str(e)}"
+        )
+
+
 # Курсы - параметризованные пути
 @router.get("/{course_id}", response_model=CourseOut)
+@query_budget(3)
 async def get_course(
     course_id: int = Path(..., title="ID курса"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: Optional[User] = Depends(get_optional_current_user)
 ):
     """Получение подробной информации о конкретном курсе"""
     try:
-        course = db.query(Course).filter(Course.id == course_id).first()
-        if not course:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail=f"Курс с ID {course_id} не найден"
-            )
+        course = await get_course_by_id_async(db, course_id)
 
-        # Если пользователь авторизован, обновляем время доступа
+        # Время доступа записывается в базу пакетом в фоне
         if current_user:
-            if is_enrolled(db, current_user.id, course_id):
-                update_course_access_time(db, current_user.id, course_id)
+            access_time_buffer.touch(current_user.id, course_id)
 
         return course
     except SQLAlchemyError as e:
@@ -735,7 +1052,7 @@ async def get_course(
 
 
 @router.put("/{course_id}", response_model=CourseOut)
-async def update_course(
+def update_course(
     course_update: CourseUpdate,
     course_id: int = Path(..., title="ID курса"),
     db: Session = Depends(get_db),
@@ -788,8 +1105,11 @@ async def update_course(
         for key, value in update_data.items():
             setattr(db_course, key, value)
 
+        index_course(db, db_course.id)
         db.commit()
+        response_cache.invalidate(POPULAR, RECENT, CATEGORIES)
         db.refresh(db_course)
+        recommendation_engine.update_course(db_course.id, [c.id for c in db_course.categories])
         return db_course
     except SQLAlchemyError as e:
         db.rollback()
@@ -800,7 +1120,7 @@ async def update_course(
 
 
 @router.delete("/{course_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_course(
+def delete_course(
     course_id: int = Path(..., title="ID курса"),
     db: Session = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -826,9 +1146,23 @@ async def delete_course(
         if db_course.image_url:
             delete_course_image(db_course.image_url)
 
+        # Удаление отметок уроков и записей на курс без загрузки строк в сессию
+        course_enrollment_ids = db.query(CourseEnrollment.id).filter(
+            CourseEnrollment.course_id == course_id
+        )
+        db.query(LessonCompletion).filter(
+            LessonCompletion.enrollment_id.in_(course_enrollment_ids.scalar_subquery())
+        ).delete(synchronize_session=False)
+        db.query(CourseEnrollment).filter(
+            CourseEnrollment.course_id == course_id
+        ).delete(synchronize_session=False)
+
         # Удаление курса
+        remove_course_from_index(db, course_id)
         db.delete(db_course)
         db.commit()
+        response_cache.invalidate(POPULAR, RECENT, CATEGORIES)
+        recommendation_engine.remove_course(course_id)
         return None
     except SQLAlchemyError as e:
         db.rollback()
@@ -841,23 +1175,17 @@ async def delete_course(
 @router.get("/{course_id}/edit", response_model=CourseEditResponse)
 async def get_course_for_edit(
     course_id: int = Path(..., title="ID курса"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Получение курса для редактирования с уроками (только для владельца или админа)"""
     try:
         # Проверяем существование курса и права пользователя
-        course = get_course_by_id(db, course_id)
+        course = await get_course_with_lessons_by_id_async(db, course_id)
         check_course_owner(course, current_user)
 
-        # Получаем уроки
-        lessons = db.query(Lesson).filter(
-            Lesson.course_id == course_id).order_by(Lesson.order).all()
-
         # Создаем объект CourseEditResponse
         course_with_lessons = CourseEditResponse.from_orm(course)
-        course_with_lessons.lessons = lessons
-
         return course_with_lessons
     except SQLAlchemyError as e:
         raise HTTPException(
@@ -871,16 +1199,19 @@ async def get_course_for_edit(
 async def update_enrollment(
     enrollment_update: EnrollmentUpdate,
     enrollment_id: int = Path(..., title="ID записи на курс"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Обновление информации о прогрессе прохождения курса"""
     try:
         # Поиск записи
-        db_enrollment = db.query(CourseEnrollment).filter(
-            CourseEnrollment.id == enrollment_id,
-            CourseEnrollment.user_id == current_user.id
-        ).first()
+        result = await db.execute(
+            select(CourseEnrollment).where(
+                CourseEnrollment.id == enrollment_id,
+                CourseEnrollment.user_id == current_user.id
+            )
+        )
+        db_enrollment = result.scalars().first()
 
         if not db_enrollment:
             raise HTTPException(
@@ -891,6 +1222,12 @@ async def update_enrollment(
         # Обновление только предоставленных полей
         update_data = enrollment_update.model_dump(exclude_unset=True)
 
+        # Прогресс курса с уроками считается по отмеченным урокам
+        course = await db.get(Course, db_enrollment.course_id)
+        if course and course.lessons_count > 0:
+            update_data.pop("progress", None)
+            update_data.pop("completed", None)
+
         # Проверка и нормализация значения прогресса если оно предоставлено
         if "progress" in update_data:
             update_data["progress"] = max(0, min(100, update_data["progress"]))
@@ -906,11 +1243,11 @@ async def update_enrollment(
         for key, value in update_data.items():
             setattr(db_enrollment, key, value)
 
-        db.commit()
-        db.refresh(db_enrollment)
+        await db.commit()
+        await db.refresh(db_enrollment)
         return db_enrollment
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Ошибка при обновлении записи: {str(e)}"
@@ -920,16 +1257,19 @@ async def update_enrollment(
 @router.delete("/enrollments/{enrollment_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def unenroll_from_course(
     enrollment_id: int = Path(..., title="ID записи на курс"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     current_user: User = Depends(get_current_user)
 ):
     """Отмена записи на курс"""
     try:
         # Поиск записи
-        db_enrollment = db.query(CourseEnrollment).filter(
-            CourseEnrollment.id == enrollment_id,
-            CourseEnrollment.user_id == current_user.id
-        ).first()
+        result = await db.execute(
+            select(CourseEnrollment).where(
+                CourseEnrollment.id == enrollment_id,
+                CourseEnrollment.user_id == current_user.id
+            )
+        )
+        db_enrollment = result.scalars().first()
 
         if not db_enrollment:
             raise HTTPException(
@@ -937,12 +1277,16 @@ async def unenroll_from_course(
                 detail=f"Запись с ID {enrollment_id} не найдена или не принадлежит вам"
             )
 
-        # Удаление записи
-        db.delete(db_enrollment)
-        db.commit()
+        # Удаление записи вместе с уменьшением счетчика студентов
+        if not await unenroll_user_from_course_async(db, db_enrollment):
+            raise HTTPException(
+                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+                detail="Ошибка при отмене записи на курс"
+            )
+        response_cache.invalidate(POPULAR)
         return None
     except SQLAlchemyError as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Ошибка при отмене записи на курс: {str(e)}"
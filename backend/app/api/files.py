@@ -1,95 +1,175 @@
 """
 File management endpoints
 """
-from fastapi import APIRouter, Depends, UploadFile, Form, status
+import time
+import anyio
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
 from typing import List, Optional
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.database import get_db
+from app.core.database import get_async_db
 from app.core.models import User
-from app.core.schemas import FileSchema, FolderSchema, FolderCreate
-from app.utils.auth import get_current_active_user
+from app.core.schemas import FileSchema, FolderSchema, FolderCreate, FileTree
+from app.utils.queries import query_budget
+from app.utils.auth import get_current_active_user, RoleChecker
 from app.utils.files import (
     get_folders, create_folder, delete_folder,
-    get_files, upload_file, delete_file,
-    download_file, read_file_content, rename_item
+    get_files, get_tree, upload_file, delete_file, run_cleanup,
+    get_user_file, download_file, read_file_content, rename_item,
+    to_file_schema, to_file_schemas
 )
+from app.utils.thumbnails import thumbnail_cache
+from app.utils.uploads import receive_upload, upload_metrics
 
 router = APIRouter()
 
+# Queries run through db.run_sync on the event loop thread; file reads, stats
+# and removals go to a worker thread so they don't block other requests
+
 
 @router.get("/folders", response_model=List[FolderSchema])
+@query_budget(3)
 async def list_folders(
     parent: Optional[int] = None,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    return get_folders(db, current_user, parent)
+    return await db.run_sync(get_folders, current_user, parent)
 
 
 @router.post("/folders", response_model=FolderSchema, status_code=status.HTTP_201_CREATED)
 async def create_new_folder(
     folder: FolderCreate,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    return create_folder(db, current_user, folder.name, folder.parent)
+    return await db.run_sync(create_folder, current_user, folder.name, folder.parent)
 
 
 @router.delete("/folders/{folder_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def remove_folder(
     folder_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    delete_folder(db, current_user, folder_id)
+    cleanup = await db.run_sync(delete_folder, current_user, folder_id)
+    await anyio.to_thread.run_sync(run_cleanup, cleanup)
     return {"status": "success"}
 
 
 @router.get("/files", response_model=List[FileSchema])
+@query_budget(3)
 async def list_files(
     folder: Optional[int] = None,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
+):
+    files = await db.run_sync(get_files, current_user, folder)
+    return await anyio.to_thread.run_sync(to_file_schemas, current_user, files)
+
+
+@router.get("/files/tree", response_model=FileTree)
+@query_budget(3)
+async def get_file_tree(
+    root: Optional[int] = None,
+    depth: Optional[int] = Query(None, ge=1, description="Levels below root to list"),
+    include_files: bool = True,
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    return get_files(db, current_user, folder)
+    """Folders and files of the user, or of the folder root, with subtree sizes and counts"""
+    return await db.run_sync(get_tree, current_user, root, depth, include_files)
 
 
-@router.post("/files", response_model=FileSchema)
+@router.get("/files/thumbnail-stats")
+async def get_thumbnail_stats(
+    _: bool = Depends(RoleChecker(allowed_roles=["admin"]))
+):
+    """Thumbnail cache hit/miss counters"""
+    return thumbnail_cache.stats()
+
+
+@router.get("/files/upload-stats")
+async def get_upload_stats(
+    _: bool = Depends(RoleChecker(allowed_roles=["admin"]))
+):
+    """Upload counters and throughput"""
+    return upload_metrics.stats()
+
+
+# The body is parsed by receive_upload, so the form is only described for the docs
+UPLOAD_FORM = {
+    "content": {
+        "multipart/form-data": {
+            "schema": {
+                "type": "object",
+                "properties": {
+                    "file": {"type": "string", "format": "binary"},
+                    "folder": {"type": "integer"},
+                },
+                "required": ["file"],
+            }
+        }
+    },
+    "required": True,
+}
+
+
+@router.post("/files", response_model=FileSchema, openapi_extra={"requestBody": UPLOAD_FORM})
 async def upload_new_file(
-    file: UploadFile,
-    folder: Optional[int] = Form(None),
+    request: Request,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    return upload_file(db, current_user, file, folder)
+    started = time.perf_counter()
+    try:
+        upload = await receive_upload(request)
+        staged = upload.staged
+        try:
+            folder = int(upload.fields["folder"]) if upload.fields.get("folder") else None
+        except ValueError:
+            staged.discard()
+            raise HTTPException(status_code=422, detail="Folder must be an integer id")
+        new_file = await db.run_sync(upload_file, current_user, staged, upload.filename, folder)
+        result = await anyio.to_thread.run_sync(to_file_schema, current_user, new_file)
+    except Exception as e:
+        upload_metrics.record_failure(
+            too_large=isinstance(e, HTTPException) and e.status_code == 413)
+        raise
+    upload_metrics.record_success(staged.size, time.perf_counter() - started)
+    return result
 
 
 @router.delete("/files/{file_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def remove_file(
     file_id: int,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    delete_file(db, current_user, file_id)
+    cleanup = await db.run_sync(delete_file, current_user, file_id)
+    await anyio.to_thread.run_sync(run_cleanup, cleanup)
     return {"status": "success"}
 
 
 @router.get("/files/{file_id}/download")
 async def download_single_file(
     file_id: int,
+    request: Request,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
-    return download_file(db, current_user, file_id)
+    file = await db.run_sync(get_user_file, current_user, file_id)
+    return await anyio.to_thread.run_sync(download_file, current_user, file, request.headers)
 
 
 @router.get("/files/{file_id}/read")
 async def read_file_contents(
     file_id: int,
-    db: Session = Depends(get_db)
+    current_user: User = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
-    return read_file_content(db, file_id)
+    file = await db.run_sync(get_user_file, current_user, file_id)
+    return await anyio.to_thread.run_sync(read_file_content, current_user, file)
 
 
 @router.put("/folders/{folder_id}/rename", response_model=FolderSchema)
@@ -97,10 +177,11 @@ async def rename_folder(
     folder_id: int,
     new_name: str,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Rename folder"""
-    return rename_item(db, current_user, folder_id, new_name, is_folder=True)
+    folder = await db.run_sync(rename_item, current_user, folder_id, new_name, True)
+    return FolderSchema(id=folder.id, name=folder.filename, parent=folder.parent_id)
 
 
 @router.put("/files/{file_id}/rename", response_model=FileSchema)
@@ -108,7 +189,8 @@ async def rename_file(
     file_id: int,
     new_name: str,
     current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Rename file"""
-    return rename_item(db, current_user, file_id, new_name, is_folder=False)
+    file = await db.run_sync(rename_item, current_user, file_id, new_name, False)
+    return await anyio.to_thread.run_sync(to_file_schema, current_user, file)
@@ -1,15 +1,27 @@
 """
 User management endpoints
 """
+import anyio
 from fastapi import APIRouter, Depends, HTTPException, Form, status
 from typing import List
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.database import get_db
+from app.core.database import get_async_db, pool_metrics
 from app.core.models import User
 from app.core.schemas import UserOut, UserCreate
-from app.utils.auth import get_current_active_user, RoleChecker
-from app.utils.users import get_user_by_username, create_user, get_users
+from app.utils.auth import (
+    get_current_active_user, RoleChecker,
+    verify_password_async, get_password_hash_async
+)
+from app.utils.hashing import password_hasher
+from app.utils.principals import Principal, principal_cache
+from app.utils.response_cache import response_cache, POPULAR
+from app.utils.users import get_user_by_username_async, create_user_async, get_users_async
+from app.utils.courses import release_user_enrollments_async
+from app.utils.recommendations import recommendation_engine
+from app.utils.files import delete_user_files
+from app.utils.blobs import remove_released_blobs
+from app.utils.compression import compression_metrics
 from pydantic import BaseModel
 from app.core.schemas import UserUpdate
 
@@ -23,28 +35,34 @@ async def create_new_user(
     email: str = Form(...),
     password: str = Form(...),
     role: str = Form("user"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     user = UserCreate(username=username, email=email,
                       password=password, role=role)
-    db_user = get_user_by_username(db, username=user.username)
+    db_user = await get_user_by_username_async(db, username=user.username)
     if db_user:
         raise HTTPException(
             status_code=400, detail="Username already registered")
-    return create_user(db=db, user=user)
+    return await create_user_async(db=db, user=user)
 
 
 @router.get("/users/me", response_model=UserOut)
-async def read_users_me(current_user: User = Depends(get_current_active_user)):
-    return current_user
+async def read_users_me(
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
+):
+    user = await db.get(User, current_user.id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+    return user
 
 
 @router.get("/users", response_model=List[UserOut])
 async def read_all_users(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     _: bool = Depends(RoleChecker(allowed_roles=["admin"]))
 ):
-    return get_users(db)
+    return await get_users_async(db)
 
 class PasswordChangeRequest(BaseModel):
     current_password: str
@@ -54,37 +72,68 @@ class PasswordChangeRequest(BaseModel):
 @router.put("/users/me/password", response_model=UserOut)
 async def change_user_password(
     password_data: PasswordChangeRequest,
-    current_user: User = Depends(get_current_active_user),
-    db: Session = Depends(get_db)
+    current_user: Principal = Depends(get_current_active_user),
+    db: AsyncSession = Depends(get_async_db)
 ):
+    user = await db.get(User, current_user.id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
     # Проверяем старый пароль
-    from app.utils.auth import verify_password
-    if not verify_password(password_data.current_password, current_user.hashed_password):
+    if not await verify_password_async(password_data.current_password, user.hashed_password):
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
             detail="Неверный текущий пароль"
         )
     
     # Хэшируем и устанавливаем новый пароль
-    from app.utils.auth import get_password_hash
-    current_user.hashed_password = get_password_hash(password_data.new_password)
-    db.commit()
-    db.refresh(current_user)
-    return current_user
+    user.hashed_password = await get_password_hash_async(password_data.new_password)
+    await db.commit()
+    await db.refresh(user)
+    principal_cache.invalidate(user.username)
+    return user
 
 class UserUpdate(BaseModel):
     email: str | None = None
     role: str | None = None
     is_active: bool | None = None
 
+# Метрики пула хэширования паролей (до /users/{user_id}, чтобы не перехватывался им)
+@router.get("/users/password-hash-stats")
+async def read_password_hash_stats(
+    _: bool = Depends(RoleChecker(allowed_roles=["admin"]))
+):
+    return password_hasher.stats()
+
+# Статистика кэша аутентифицированных пользователей
+@router.get("/users/principal-cache-stats")
+async def read_principal_cache_stats(
+    _: bool = Depends(RoleChecker(allowed_roles=["admin"]))
+):
+    return principal_cache.stats()
+
+# Состояние пулов соединений с базой данных
+@router.get("/users/db-pool-stats")
+async def read_db_pool_stats(
+    _: bool = Depends(RoleChecker(allowed_roles=["admin"]))
+):
+    return {name: metrics.stats() for name, metrics in pool_metrics.items()}
+
+# Статистика сжатия ответов
+@router.get("/users/compression-stats")
+async def read_compression_stats(
+    _: bool = Depends(RoleChecker(allowed_roles=["admin"]))
+):
+    return compression_metrics.stats()
+
 # Эндпоинт для получения пользователя по ID
 @router.get("/users/{user_id}", response_model=UserOut)
 async def read_user(
     user_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     _: bool = Depends(RoleChecker(allowed_roles=["admin"]))
 ):
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
@@ -94,10 +143,10 @@ async def read_user(
 async def update_user(
     user_id: int,
     user_update: UserUpdate,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     _: bool = Depends(RoleChecker(allowed_roles=["admin"]))
 ):
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -109,21 +158,31 @@ async def update_user(
     if user_update.is_active is not None:
         user.is_active = user_update.is_active
     
-    db.commit()
-    db.refresh(user)
+    await db.commit()
+    await db.refresh(user)
+    principal_cache.invalidate(user.username)
     return user
 
 # Эндпоинт для удаления пользователя
 @router.delete("/users/{user_id}")
 async def delete_user(
     user_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     _: bool = Depends(RoleChecker(allowed_roles=["admin"]))
 ):
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
-    db.delete(user)
-    db.commit()
+    # Уменьшаем счетчики студентов курсов, на которые был записан пользователь
+    await release_user_enrollments_async(db, user.id)
+    # Освобождаем блобы файлов пользователя, файлы блобов удаляются после коммита
+    released = await db.run_sync(delete_user_files, user)
+    await db.delete(user)
+    await db.commit()
+    await anyio.to_thread.run_sync(remove_released_blobs, released)
+    principal_cache.invalidate(user.username)
+    response_cache.invalidate(POPULAR)
+    # Записи пользователя удалены вместе с ним, индекс рекомендаций перестраивается
+    recommendation_engine.invalidate()
     return {"message": "User deleted successfully"}
\ No newline at end of file
@@ -0,0 +1,79 @@
+"""
+Скрипт для сжатия содержимого уроков, записанного до появления CompressedText.
+Перезаписывает content и scene_data уроков, хранящиеся без сжатия или без
+заполненных размеров, по правилам LESSON_COMPRESS_MIN_BYTES.
+Запуск: python -m app.core.compress_lessons
+"""
+
+from sqlalchemy import Text, type_coerce
+
+from app.core.config import LESSON_COMPRESS_MIN_BYTES
+from app.core.database import SessionLocal
+from app.core.migrate import upgrade_database
+from app.core.models import Lesson
+from app.core.types import is_gzip, stored_bytes, compress_text, decompress_text
+
+# Количество уроков, обрабатываемых в одной транзакции
+BATCH_SIZE = 100
+
+
+def needs_rewrite(data) -> bool:
+    """Хранимое значение не сжато, хотя должно быть"""
+    data = stored_bytes(data)
+    return data is not None and not is_gzip(data) and len(data) >= LESSON_COMPRESS_MIN_BYTES
+
+
+def stored_size(data) -> int:
+    return len(stored_bytes(data) or b"")
+
+
+def compress_lessons():
+    """Сжатие содержимого уроков"""
+    upgrade_database()
+    db = SessionLocal()
+    rewritten = saved = 0
+    last_id = 0
+    try:
+        while True:
+            # Значения читаются как есть, без обработки CompressedText
+            rows = db.query(
+                Lesson.id,
+                type_coerce(Lesson.content, Text),
+                type_coerce(Lesson.scene_data, Text),
+                Lesson.content_size,
+                Lesson.scene_size
+            ).filter(Lesson.id > last_id).order_by(Lesson.id).limit(BATCH_SIZE).all()
+            if not rows:
+                break
+
+            for lesson_id, content, scene_data, content_size, scene_size in rows:
+                if content_size is not None and scene_size is not None \
+                        and not needs_rewrite(content) and not needs_rewrite(scene_data):
+                    continue
+
+                before = stored_size(content) + stored_size(scene_data)
+                content = decompress_text(content)
+                scene_data = decompress_text(scene_data)
+                db.query(Lesson).filter(Lesson.id == lesson_id).update({
+                    Lesson.content: content,
+                    Lesson.scene_data: scene_data,
+                    Lesson.content_size: Lesson.measure_content(content),
+                    Lesson.scene_size: Lesson.measure_scene(scene_data),
+                }, synchronize_session=False)
+
+                saved += before - stored_size(compress_text(content))
+                if scene_data is not None:
+                    saved -= stored_size(compress_text(scene_data))
+                rewritten += 1
+
+            db.commit()
+            last_id = rows[-1][0]
+
+        return rewritten, saved
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    rewritten, saved = compress_lessons()
+    print(f"Перезаписано уроков: {rewritten}, освобождено байт: {saved}")
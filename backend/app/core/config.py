@@ -10,8 +10,39 @@ load_dotenv()
 # Environment settings
 ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
 
+# Prometheus /metrics endpoint, off in production like the API docs unless enabled explicitly
+METRICS_ENABLED = os.getenv(
+    "METRICS_ENABLED", "false" if ENVIRONMENT == "production" else "true"
+).lower() in ("1", "true", "yes")
+
+# Per-request SQL statement logging: requests running more statements than
+# QUERY_LOG_THRESHOLD (0 disables) or repeating one statement
+# QUERY_REPEAT_THRESHOLD times are logged; X-Query-Count header is off in production
+QUERY_LOG_THRESHOLD = int(os.getenv("QUERY_LOG_THRESHOLD", "30"))
+QUERY_REPEAT_THRESHOLD = int(os.getenv("QUERY_REPEAT_THRESHOLD", "5"))
+QUERY_COUNT_HEADER = os.getenv(
+    "QUERY_COUNT_HEADER", "false" if ENVIRONMENT == "production" else "true"
+).lower() in ("1", "true", "yes")
+
 # Database settings
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./educational_platform.db")
+# By default the async driver is derived from DATABASE_URL (aiosqlite / asyncpg)
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL", "")
+# Apply pending migrations when the app starts; disable to run python -m app.core.migrate separately
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+
+# Connection pool settings, applied to both engines (seconds for timeout and recycle)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+
+# SQLite pragmas set on every new connection (empty value keeps the SQLite default)
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
 
 # Security settings
 SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-key-CHANGE-THIS-IN-PRODUCTION")
@@ -19,11 +50,77 @@ ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
 REFRESH_TOKEN_EXPIRE_MINUTES = int(os.getenv("REFRESH_TOKEN_EXPIRE_MINUTES", "10080"))
 
+# Cache of authenticated principals: seconds to live and max entries, TTL 0 disables
+PRINCIPAL_CACHE_TTL = float(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+
+# Password hashing settings
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "64"))
+
+# Course search settings: "fts" (SQLite FTS5 / PostgreSQL tsvector) or "like"
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "fts")
+SEARCH_TS_CONFIG = os.getenv("SEARCH_TS_CONFIG", "russian")
+
+# Cached total counts for cursor pagination, seconds
+COURSE_COUNT_CACHE_TTL = int(os.getenv("COURSE_COUNT_CACHE_TTL", "30"))
+
+# Response cache TTLs for read-mostly course lists, seconds (0 disables caching);
+# after TTL an entry is served stale for RESPONSE_CACHE_STALE_TTL while it is refreshed
+POPULAR_CACHE_TTL = float(os.getenv("POPULAR_CACHE_TTL", "60"))
+RECENT_CACHE_TTL = float(os.getenv("RECENT_CACHE_TTL", "300"))
+CATEGORIES_CACHE_TTL = float(os.getenv("CATEGORIES_CACHE_TTL", "3600"))
+RESPONSE_CACHE_STALE_TTL = float(os.getenv("RESPONSE_CACHE_STALE_TTL", "30"))
+
+# Course recommendations: similar courses kept per course, full index rebuild
+# period in seconds, and enrollments after which category affinity no longer counts
+RECOMMENDER_TOP_K = int(os.getenv("RECOMMENDER_TOP_K", "20"))
+RECOMMENDER_REFRESH_SECONDS = float(os.getenv("RECOMMENDER_REFRESH_SECONDS", "900"))
+RECOMMENDER_COLD_START_ENROLLMENTS = int(os.getenv("RECOMMENDER_COLD_START_ENROLLMENTS", "3"))
+
+# Course access times are buffered in memory and written in one batched UPDATE
+# every ACCESS_TIME_FLUSH_SECONDS, or sooner once ACCESS_TIME_MAX_PENDING pairs are waiting
+ACCESS_TIME_FLUSH_SECONDS = float(os.getenv("ACCESS_TIME_FLUSH_SECONDS", "10"))
+ACCESS_TIME_MAX_PENDING = int(os.getenv("ACCESS_TIME_MAX_PENDING", "10000"))
+
+# Lesson content and scene data at least this large are stored gzip-compressed, bytes
+LESSON_COMPRESS_MIN_BYTES = int(os.getenv("LESSON_COMPRESS_MIN_BYTES", "1024"))
+
+# Response compression: minimum body size in bytes, compressible media types,
+# gzip level (1-9) and brotli quality (0-11; brotli is used when installed)
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", "1024"))
+COMPRESSION_TYPES = os.getenv(
+    "COMPRESSION_TYPES",
+    "application/json,application/javascript,application/xml,image/svg+xml,"
+    "text/css,text/csv,text/html,text/javascript,text/plain,text/xml"
+).split(",")
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "4"))
+
 # File storage settings
 BASE_FOLDER_DIR = os.getenv("BASE_FOLDER_DIR", "/app/storage")
 THUMBNAIL_DIR = os.getenv("THUMBNAIL_DIR", "/app/thumbnails")
 BASE_URL = os.getenv("BASE_URL", "http://localhost:8000")
 
+# Upload settings: per-request byte cap and streaming chunk size
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(100 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+
+# Cache-Control policies: user downloads are private and revalidated,
+# thumbnail names change with file content so they can be cached for long
+DOWNLOAD_CACHE_CONTROL = os.getenv("DOWNLOAD_CACHE_CONTROL", "private, no-cache")
+STATIC_CACHE_CONTROL = os.getenv("STATIC_CACHE_CONTROL", "public, max-age=3600")
+THUMBNAIL_CACHE_CONTROL = os.getenv("THUMBNAIL_CACHE_CONTROL", "public, max-age=2592000, immutable")
+
+# Thumbnail cache settings
+THUMBNAIL_CACHE_MAX_BYTES = int(os.getenv("THUMBNAIL_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", "2"))
+
+# Bulk enrollment import: rows per set-based batch and max rows per request
+BULK_ENROLL_BATCH_SIZE = int(os.getenv("BULK_ENROLL_BATCH_SIZE", "1000"))
+BULK_ENROLL_MAX_ROWS = int(os.getenv("BULK_ENROLL_MAX_ROWS", "100000"))
+
 # CORS settings
 CORS_ORIGINS = os.getenv("CORS_ORIGINS", "http://localhost:5173,http://127.0.0.1:5173").split(",")
 
@@ -1,19 +1,17 @@
 """
-Скрипт для заполнения базы данных таблицами.
+Создание и обновление схемы базы данных.
+Схема ведется миграциями (app.core.migrate), модуль оставлен для
+совместимости со старыми сценариями запуска.
 Запуск: python -m app.core.create_tables
 """
 
-import logging
+from app.core.migrate import upgrade_database
 
-logging.basicConfig()
-
-from app.core.database import Base, engine
-import app.core.models
 
 def create_tables():
-    """Создание всех таблиц базы данных"""
-    Base.metadata.create_all(bind=engine)
+    """Применение всех миграций схемы"""
+    upgrade_database()
 
 if __name__ == "__main__":
     create_tables()
-    print("Таблицы успешно созданы.")
\ No newline at end of file
+    print("Таблицы успешно созданы.")
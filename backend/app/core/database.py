@@ -2,14 +2,44 @@
 Database connection settings
 """
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
-from app.core.config import DATABASE_URL
+from app.core.config import DATABASE_URL, ASYNC_DATABASE_URL
+from app.core.pool import PoolMetrics, engine_options, instrument_engine
 
-engine = create_engine(DATABASE_URL)
+# Асинхронные драйверы для поддерживаемых СУБД
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+}
+
+
+def make_async_url(url: str) -> str:
+    """Подбирает асинхронный драйвер по схеме DATABASE_URL"""
+    url_obj = make_url(url)
+    backend = url_obj.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"Async driver is not configured for '{backend}'")
+    return url_obj.set(drivername=ASYNC_DRIVERS[backend]).render_as_string(
+        hide_password=False)
+
+
+# Метрики пулов синхронного и асинхронного движков
+pool_metrics = {"sync": PoolMetrics("sync"), "async": PoolMetrics("async")}
+
+engine = create_engine(DATABASE_URL, **engine_options(DATABASE_URL, pool_metrics["sync"]))
+instrument_engine(engine, pool_metrics["sync"])
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+_async_url = ASYNC_DATABASE_URL or make_async_url(DATABASE_URL)
+async_engine = create_async_engine(_async_url, **engine_options(_async_url, pool_metrics["async"]))
+instrument_engine(async_engine.sync_engine, pool_metrics["async"])
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine, autoflush=False, expire_on_commit=False)
+
 Base = declarative_base()
 
 def get_db():
@@ -17,4 +47,9 @@ def get_db():
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
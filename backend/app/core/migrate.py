@@ -0,0 +1,107 @@
+"""
+Миграции схемы базы данных (Alembic, каталог migrations) и проверка
+расхождения моделей со схемой.
+
+Запуск:
+    python -m app.core.migrate           - обновить схему до последней версии
+    python -m app.core.migrate check     - код 1, если база отстает от миграций
+                                           или ее индексы расходятся с моделями
+Новая миграция: alembic revision --autogenerate -m "..." (из каталога backend)
+"""
+import sys
+from pathlib import Path
+from typing import List
+
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+
+from app.core.database import Base, engine
+import app.core.models  # noqa: F401 - регистрация моделей в метаданных
+from app.utils.search import ensure_search_index
+
+ALEMBIC_INI = Path(__file__).resolve().parents[2] / "alembic.ini"
+
+# Виды расхождений, которые проверяет check: состав таблиц, колонок и индексов.
+# Типы колонок не сравниваются: CompressedText хранится в TEXT на старых базах SQLite
+DRIFT_KINDS = {
+    "add_table", "remove_table", "add_column", "remove_column",
+    "add_index", "remove_index", "add_constraint", "remove_constraint",
+}
+
+
+def alembic_config() -> Config:
+    config = Config(str(ALEMBIC_INI))
+    # Логирование настраивает приложение, а не alembic.ini
+    config.attributes["configure_logger"] = False
+    return config
+
+
+def upgrade_database():
+    """Применение всех миграций и подготовка индекса поиска"""
+    command.upgrade(alembic_config(), "head")
+    ensure_search_index(engine)
+
+
+def pending_revisions() -> List[str]:
+    """Миграции, которые еще не применены к базе"""
+    script = ScriptDirectory.from_config(alembic_config())
+    with engine.connect() as connection:
+        current = set(MigrationContext.configure(connection).get_current_heads())
+    heads = set(script.get_heads())
+    if current == heads:
+        return []
+    pending = []
+    for revision in script.walk_revisions():
+        if revision.revision in current:
+            break
+        pending.append(revision.revision)
+    return pending
+
+
+def _include_object(obj, name, type_, reflected, compare_to):
+    # Таблицы вне моделей (индекс поиска, alembic_version) не сравниваются
+    return not (type_ == "table" and reflected and compare_to is None)
+
+
+def schema_drift() -> List[str]:
+    """Расхождения таблиц, колонок и индексов моделей со схемой базы"""
+    with engine.connect() as connection:
+        context = MigrationContext.configure(
+            connection, opts={"include_object": _include_object, "compare_type": False})
+        diffs = compare_metadata(context, Base.metadata)
+
+    drift = []
+    for diff in diffs:
+        # Изменения колонок приходят списком кортежей, они не проверяются
+        if isinstance(diff, tuple) and diff[0] in DRIFT_KINDS:
+            kind, obj = diff[0], diff[-1]
+            table = getattr(obj, "table", None)
+            columns = ", ".join(c.name for c in getattr(obj, "columns", []) if hasattr(c, "name"))
+            where = f" on {table.name}({columns})" if table is not None and columns else ""
+            drift.append(f"{kind} {getattr(obj, 'name', obj)}{where}")
+    return drift
+
+
+def check() -> int:
+    pending = pending_revisions()
+    drift = schema_drift()
+    if pending:
+        print(f"Не применены миграции: {', '.join(pending)}")
+    if drift:
+        print("Схема базы расходится с моделями:")
+        for item in drift:
+            print(f"  {item}")
+        print("Добавьте миграцию: alembic revision --autogenerate -m \"...\"")
+    if not pending and not drift:
+        print("Схема базы соответствует моделям")
+    return 1 if pending or drift else 0
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "check":
+        sys.exit(check())
+    upgrade_database()
+    print("Миграции применены.")
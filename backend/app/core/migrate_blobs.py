@@ -0,0 +1,61 @@
+"""
+Скрипт для переноса файлов пользователей в хранилище блобов.
+Файлы, загруженные до появления хранилища, хранятся отдельными копиями
+в BASE_FOLDER_DIR/<username>/; скрипт переносит их содержимое в блобы,
+сверяет счетчики ссылок и удаляет неиспользуемые блобы.
+Запуск: python -m app.core.migrate_blobs
+"""
+
+from pathlib import Path
+
+from app.core.database import SessionLocal
+from app.core.migrate import upgrade_database
+from app.core.models import UserFile
+from app.utils.blobs import reconcile_blob_refs, collect_orphan_blob_files
+from app.utils.files import adopt_legacy_file
+from app.utils.thumbnails import thumbnail_cache
+
+
+def get_tree_path(file: UserFile) -> str:
+    """Путь файла, построенный по цепочке родительских папок"""
+    parts = []
+    item = file
+    while item is not None:
+        parts.append(item.filename)
+        item = item.parent
+    return str(Path(*reversed(parts)))
+
+
+def migrate_blobs():
+    """Перенос старых файлов в хранилище блобов"""
+    upgrade_database()
+    db = SessionLocal()
+    moved = missing = 0
+    try:
+        legacy_files = db.query(UserFile).filter(
+            UserFile.is_folder == False,
+            UserFile.blob_id == None
+        ).all()
+
+        for file in legacy_files:
+            legacy_path = adopt_legacy_file(
+                db, file.user, file, [file.relative_path, get_tree_path(file)])
+            db.commit()
+            if legacy_path is None:
+                missing += 1
+                continue
+            thumbnail_cache.invalidate(legacy_path, file.user.username)
+            legacy_path.unlink(missing_ok=True)
+            moved += 1
+
+        fixed = reconcile_blob_refs(db)
+        removed = collect_orphan_blob_files(db)
+        return moved, missing, fixed, removed
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    moved, missing, fixed, removed = migrate_blobs()
+    print(f"Перенесено файлов: {moved}, не найдено на диске: {missing}")
+    print(f"Исправлено счетчиков ссылок: {fixed}, удалено лишних блобов: {removed}")
@@ -2,11 +2,12 @@
 SQLAlchemy ORM models
 """
 
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, DateTime, Text, Float, Table, Enum
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, ForeignKey, DateTime, Text, Float, Table, Enum, Index
+from sqlalchemy.orm import relationship, validates
 from datetime import datetime, timezone
 import enum
 from app.core.database import Base
+from app.core.types import CompressedText
 
 
 # Определение классов Enum для ограниченных значений
@@ -55,6 +56,10 @@ class RefreshToken(Base):
 
 class UserFile(Base):
     __tablename__ = "user_files"
+    # Содержимое папки выбирается по владельцу, родителю и типу
+    __table_args__ = (
+        Index("ix_user_files_user_id_parent_id_is_folder", "user_id", "parent_id", "is_folder"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey(
@@ -64,6 +69,11 @@ class UserFile(Base):
     is_folder = Column(Boolean, default=False, nullable=False)
     parent_id = Column(Integer, ForeignKey(
         "user_files.id", ondelete="CASCADE"))
+    # Размер и SHA-256 содержимого, вычисляются при загрузке
+    size = Column(BigInteger, nullable=True)
+    checksum = Column(String(64), nullable=True)
+    # Содержимое файла в хранилище блобов, пусто для папок и старых файлов
+    blob_id = Column(Integer, ForeignKey("file_blobs.id"), nullable=True, index=True)
     created_at = Column(DateTime, default=datetime.now(timezone.utc))
     updated_at = Column(DateTime, default=datetime.now(
         timezone.utc), onupdate=datetime.now(timezone.utc))
@@ -73,6 +83,19 @@ class UserFile(Base):
                           id], back_populates="children")
     children = relationship(
         "UserFile", back_populates="parent", cascade="all, delete-orphan")
+    blob = relationship("FileBlob")
+
+
+class FileBlob(Base):
+    """Содержимое файла, общее для всех UserFile с одинаковым SHA-256"""
+    __tablename__ = "file_blobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    checksum = Column(String(64), unique=True, index=True, nullable=False)
+    size = Column(BigInteger, nullable=False)
+    # Количество UserFile, ссылающихся на блоб
+    ref_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime, default=datetime.now(timezone.utc))
 
 
 # Промежуточная таблица для связи многие-ко-многим между курсами и категориями
@@ -118,7 +141,10 @@ class Course(Base):
     author = Column(String, nullable=False)
     image_url = Column(String)
     lessons_count = Column(Integer, default=0, nullable=False)
-    created_at = Column(DateTime, default=datetime.now(timezone.utc))
+    # Денормализованный счетчик записей на курс, поддерживается при записи и отписке
+    students_count = Column(Integer, default=0, server_default="0",
+                            nullable=False, index=True)
+    created_at = Column(DateTime, default=datetime.now(timezone.utc), index=True)
     updated_at = Column(DateTime, default=datetime.now(
         timezone.utc), onupdate=datetime.now(timezone.utc))
 
@@ -132,12 +158,8 @@ class Course(Base):
 
     # Связь с lessons
     lessons = relationship(
-        "Lesson", back_populates="course", cascade="all, delete-orphan")
-
-    @property
-    def students_count(self):
-        """Количество студентов на курсе"""
-        return len(self.enrollments)
+        "Lesson", back_populates="course", cascade="all, delete-orphan",
+        order_by="Lesson.order")
 
     def __repr__(self):
         return f"<Course {self.title}>"
@@ -146,6 +168,10 @@ class Course(Base):
 class CourseEnrollment(Base):
     """Модель для отслеживания записи студентов на курсы"""
     __tablename__ = "course_enrollments"
+    # Одна запись на пару пользователь-курс, индекс обслуживает проверку записи
+    __table_args__ = (
+        Index("uq_course_enrollments_user_course", "user_id", "course_id", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey(
@@ -157,6 +183,9 @@ class CourseEnrollment(Base):
     # процент завершения 0-100
     progress = Column(Float, default=0.0, nullable=False)
     completed = Column(Boolean, default=False, nullable=False)
+    # Денормализованное число пройденных уроков, progress и completed
+    # пересчитываются из него при отметке урока без обхода курса
+    completed_lessons = Column(Integer, default=0, server_default="0", nullable=False)
 
     # Дата записи и последнего доступа
     enrolled_at = Column(DateTime, default=datetime.now(timezone.utc))
@@ -173,18 +202,63 @@ class CourseEnrollment(Base):
 class Lesson(Base):
     """Модель уроков курса"""
     __tablename__ = "lessons"
+    # Уроки курса всегда выбираются в порядке order
+    __table_args__ = (
+        Index("ix_lessons_course_id_order", "course_id", "order"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     course_id = Column(Integer, ForeignKey(
         "courses.id", ondelete="CASCADE"), nullable=False)
     title = Column(String, nullable=False)
-    content = Column(Text, nullable=False)  # теоретический материал урока
+    content = Column(CompressedText, nullable=False)  # теоретический материал урока
     order = Column(Integer, nullable=False)  # порядок уроков в курсе
     # JSON данные для интерактивной сцены может быть NULL для обычных уроков
-    scene_data = Column(Text)
+    scene_data = Column(CompressedText)
+    # Размеры content и scene_data в байтах UTF-8 до сжатия (0 - сцены нет)
+    content_size = Column(Integer)
+    scene_size = Column(Integer)
     created_at = Column(DateTime, default=datetime.now(timezone.utc))
     updated_at = Column(DateTime, default=datetime.now(
         timezone.utc), onupdate=datetime.now(timezone.utc))
 
     # Связь с курсом
     course = relationship("Course", back_populates="lessons")
+
+    @staticmethod
+    def measure_content(value) -> int:
+        return len(value.encode("utf-8")) if value is not None else 0
+
+    @staticmethod
+    def measure_scene(value) -> int:
+        # Пустая строка и JSON null означают урок без сцены
+        if value is None or value in ("", "null"):
+            return 0
+        return len(value.encode("utf-8"))
+
+    @validates("content")
+    def validate_content(self, key, value):
+        self.content_size = self.measure_content(value)
+        return value
+
+    @validates("scene_data")
+    def validate_scene_data(self, key, value):
+        self.scene_size = self.measure_scene(value)
+        return value
+
+
+class LessonCompletion(Base):
+    """Модель пройденного урока в рамках записи на курс"""
+    __tablename__ = "lesson_completions"
+    # Урок отмечается один раз, индекс по уроку нужен при удалении урока
+    __table_args__ = (
+        Index("uq_lesson_completions_enrollment_lesson", "enrollment_id", "lesson_id", unique=True),
+        Index("ix_lesson_completions_lesson_id", "lesson_id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    enrollment_id = Column(Integer, ForeignKey(
+        "course_enrollments.id", ondelete="CASCADE"), nullable=False)
+    lesson_id = Column(Integer, ForeignKey(
+        "lessons.id", ondelete="CASCADE"), nullable=False)
+    completed_at = Column(DateTime, default=datetime.now(timezone.utc))
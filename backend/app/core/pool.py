@@ -0,0 +1,181 @@
+"""
+Настройка пулов соединений с базой данных и их метрики
+"""
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool
+
+from app.core.config import (
+    DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT, DB_POOL_RECYCLE, DB_POOL_PRE_PING,
+    SQLITE_JOURNAL_MODE, SQLITE_SYNCHRONOUS, SQLITE_BUSY_TIMEOUT_MS, SQLITE_MMAP_SIZE
+)
+
+
+class PoolMetrics:
+    """Ожидание соединений из пула, время их удержания и жизни"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.pool = None
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.timeouts = 0
+        self.hold_seconds_total = 0.0
+        self.hold_seconds_max = 0.0
+        self.checkins = 0
+        self.connections_opened = 0
+        self.connections_closed = 0
+        self.lifetime_seconds_total = 0.0
+        self.lifetime_seconds_max = 0.0
+
+    def record_wait(self, seconds: float, timed_out: bool = False):
+        with self._lock:
+            if timed_out:
+                self.timeouts += 1
+                return
+            self.checkouts += 1
+            self.wait_seconds_total += seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, seconds)
+
+    def record_hold(self, seconds: float):
+        with self._lock:
+            self.checkins += 1
+            self.hold_seconds_total += seconds
+            self.hold_seconds_max = max(self.hold_seconds_max, seconds)
+
+    def record_open(self):
+        with self._lock:
+            self.connections_opened += 1
+
+    def record_close(self, lifetime: Optional[float]):
+        with self._lock:
+            self.connections_closed += 1
+            if lifetime is not None:
+                self.lifetime_seconds_total += lifetime
+                self.lifetime_seconds_max = max(self.lifetime_seconds_max, lifetime)
+
+    def pool_state(self) -> Dict[str, Any]:
+        """Текущее заполнение пула (только для пулов с очередью)"""
+        pool = self.pool
+        if not isinstance(pool, QueuePool):
+            return {"pool_class": type(pool).__name__ if pool is not None else None}
+        return {
+            "pool_class": type(pool).__mro__[1].__name__,
+            "size": pool.size(),
+            "max_overflow": pool._max_overflow,
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            "overflow": max(0, pool.overflow()),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        state = self.pool_state()
+        with self._lock:
+            return dict(
+                state,
+                checkouts=self.checkouts,
+                timeouts=self.timeouts,
+                wait_seconds_avg=round(self.wait_seconds_total / self.checkouts, 6) if self.checkouts else 0.0,
+                wait_seconds_max=round(self.wait_seconds_max, 6),
+                hold_seconds_avg=round(self.hold_seconds_total / self.checkins, 6) if self.checkins else 0.0,
+                hold_seconds_max=round(self.hold_seconds_max, 6),
+                connections_opened=self.connections_opened,
+                connections_closed=self.connections_closed,
+                lifetime_seconds_avg=round(
+                    self.lifetime_seconds_total / self.connections_closed, 3) if self.connections_closed else 0.0,
+                lifetime_seconds_max=round(self.lifetime_seconds_max, 3),
+            )
+
+
+def timed_pool_class(base: type, metrics: PoolMetrics) -> type:
+    """
+    Подкласс пула с очередью, измеряющий ожидание свободного соединения.
+    Пересозданный при dispose() пул сохраняет класс, а значит и метрики
+    """
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = base._do_get(self)
+        except exc.TimeoutError:
+            metrics.record_wait(time.perf_counter() - started, timed_out=True)
+            raise
+        metrics.record_wait(time.perf_counter() - started)
+        return connection
+
+    return type(f"Timed{base.__name__}", (base,), {"_do_get": _do_get})
+
+
+def engine_options(url: str, metrics: PoolMetrics) -> Dict[str, Any]:
+    """
+    Параметры create_engine для пула соединений из настроек окружения.
+    Размеры пула задаются только для пулов с очередью: SQLite в памяти
+    работает с одним соединением (StaticPool, SingletonThreadPool)
+    """
+    url_obj = make_url(url)
+    pool_class = url_obj.get_dialect().get_pool_class(url_obj)
+    options: Dict[str, Any] = {"pool_pre_ping": DB_POOL_PRE_PING}
+    if issubclass(pool_class, QueuePool):
+        options.update(
+            poolclass=timed_pool_class(pool_class, metrics),
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+            pool_recycle=DB_POOL_RECYCLE,
+        )
+    return options
+
+
+def instrument_engine(engine: Engine, metrics: PoolMetrics):
+    """Подписка метрик на события пула и настройка соединений SQLite"""
+    metrics.pool = engine.pool
+
+    @event.listens_for(engine, "engine_disposed")
+    def on_dispose(engine):
+        metrics.pool = engine.pool
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        connection_record.info["connected_at"] = time.monotonic()
+        metrics.record_open()
+        if engine.dialect.name == "sqlite":
+            apply_sqlite_pragmas(dbapi_connection)
+
+    @event.listens_for(engine, "checkout")
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        connection_record.info["checked_out_at"] = time.monotonic()
+
+    @event.listens_for(engine, "checkin")
+    def on_checkin(dbapi_connection, connection_record):
+        checked_out_at = connection_record.info.pop("checked_out_at", None)
+        if checked_out_at is not None:
+            metrics.record_hold(time.monotonic() - checked_out_at)
+
+    @event.listens_for(engine, "close")
+    def on_close(dbapi_connection, connection_record):
+        connected_at = connection_record.info.pop("connected_at", None)
+        metrics.record_close(time.monotonic() - connected_at if connected_at is not None else None)
+
+
+def apply_sqlite_pragmas(dbapi_connection):
+    """
+    WAL позволяет читать во время записи, synchronous=NORMAL в режиме WAL
+    не теряет согласованность при сбое, busy_timeout заставляет ждать
+    блокировку вместо ошибки "database is locked"
+    """
+    cursor = dbapi_connection.cursor()
+    try:
+        if SQLITE_JOURNAL_MODE:
+            cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        if SQLITE_SYNCHRONOUS:
+            cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        cursor.execute(f"PRAGMA busy_timeout={int(SQLITE_BUSY_TIMEOUT_MS)}")
+        if SQLITE_MMAP_SIZE:
+            cursor.execute(f"PRAGMA mmap_size={int(SQLITE_MMAP_SIZE)}")
+    finally:
+        cursor.close()
@@ -0,0 +1,70 @@
+"""
+Скрипт для подготовки сжатых копий статических файлов.
+Рядом с каждым файлом сжимаемого типа (COMPRESSION_TYPES) не меньше
+COMPRESSION_MIN_BYTES создаются file.gz и, если установлен brotli, file.br.
+Монтирование /static отдает их клиентам, принимающим эти кодировки.
+Устаревшие копии пересоздаются, копии без исходного файла удаляются.
+Запуск: python -m app.core.precompress_static [каталог, по умолчанию static]
+"""
+
+import mimetypes
+import os
+import sys
+from pathlib import Path
+
+from app.core.config import COMPRESSION_MIN_BYTES
+from app.utils.compression import (
+    SUPPORTED_ENCODINGS, PRECOMPRESSED_SUFFIXES, compress_bytes, is_compressible
+)
+
+# Копия сохраняется, только если она меньше исходного файла хотя бы на 10%
+MAX_RATIO = 0.9
+
+
+def precompress_static(directory: Path):
+    """Создание сжатых копий файлов каталога"""
+    suffixes = set(PRECOMPRESSED_SUFFIXES.values())
+    written = removed = 0
+    bytes_in = bytes_out = 0
+
+    for path in sorted(directory.rglob("*")):
+        if not path.is_file() or path.suffix == ".tmp":
+            continue
+        if path.suffix in suffixes:
+            # Копия, для которой больше нет исходного файла
+            if not path.with_suffix("").exists():
+                path.unlink()
+                removed += 1
+            continue
+
+        stat = path.stat()
+        if stat.st_size < COMPRESSION_MIN_BYTES or not is_compressible(mimetypes.guess_type(path)[0]):
+            continue
+
+        data = None
+        for coding in SUPPORTED_ENCODINGS:
+            target = Path(f"{path}{PRECOMPRESSED_SUFFIXES[coding]}")
+            if target.exists() and target.stat().st_mtime >= stat.st_mtime:
+                continue
+            if data is None:
+                data = path.read_bytes()
+            compressed = compress_bytes(data, coding)
+            if len(compressed) > len(data) * MAX_RATIO:
+                target.unlink(missing_ok=True)
+                continue
+            tmp_path = target.with_name(target.name + ".tmp")
+            tmp_path.write_bytes(compressed)
+            os.replace(tmp_path, target)
+            written += 1
+            bytes_in += len(data)
+            bytes_out += len(compressed)
+
+    return written, removed, bytes_in, bytes_out
+
+
+if __name__ == "__main__":
+    directory = Path(sys.argv[1] if len(sys.argv) > 1 else "static")
+    written, removed, bytes_in, bytes_out = precompress_static(directory)
+    ratio = bytes_out / bytes_in if bytes_in else 0
+    print(f"Создано сжатых копий: {written}, удалено устаревших: {removed}")
+    print(f"Исходный размер: {bytes_in} байт, сжатый: {bytes_out} байт ({ratio:.1%})")
@@ -0,0 +1,24 @@
+"""
+Скрипт для сверки денормализованных счетчиков с фактическими данными.
+Исправляет расхождение Course.students_count с таблицей course_enrollments.
+Запуск: python -m app.core.reconcile_counters
+"""
+
+from app.core.database import SessionLocal
+from app.core.migrate import upgrade_database
+from app.utils.courses import reconcile_students_count
+
+
+def reconcile_counters() -> int:
+    """Сверка счетчиков студентов всех курсов"""
+    upgrade_database()
+    db = SessionLocal()
+    try:
+        return reconcile_students_count(db)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    fixed = reconcile_counters()
+    print(f"Счетчики студентов исправлены для курсов: {fixed}")
@@ -2,7 +2,7 @@
 Pydantic models for request/response validation
 """
 
-from pydantic import BaseModel, EmailStr, Field, validator
+from pydantic import BaseModel, EmailStr, Field, validator, model_validator
 from typing import Optional, List, Union
 from datetime import datetime
 from enum import Enum
@@ -87,11 +87,34 @@ class FileSchema(BaseModel):
     size: int
     folder: Optional[int] = None
     thumbnail: str
+    checksum: Optional[str] = None
 
     class Config:
         from_attributes = True
 
 
+class FileTreeNode(BaseModel):
+    id: int
+    name: str
+    is_folder: bool
+    parent: Optional[int] = None
+    # File size, or total size of files in the folder subtree
+    size: int = 0
+    file_count: int = 0
+    folder_count: int = 0
+    # Folder has children below the requested depth that are not listed
+    truncated: bool = False
+    children: List["FileTreeNode"] = []
+
+
+class FileTree(BaseModel):
+    root: Optional[int] = None
+    size: int
+    file_count: int
+    folder_count: int
+    items: List[FileTreeNode]
+
+
 class CategoryBase(BaseModel):
     """Базовая схема для категории курсов"""
     name: str
@@ -195,6 +218,7 @@ class EnrollmentOut(EnrollmentBase):
     user_id: int
     progress: float
     completed: bool
+    completed_lessons: int = 0
     enrolled_at: Optional[datetime]
     last_accessed_at: Optional[datetime]
 
@@ -210,6 +234,44 @@ class EnrollmentWithCourse(EnrollmentOut):
         from_attributes = True
 
 
+class BulkEnrollmentItem(BaseModel):
+    """Строка массовой записи: пользователь по ID или имени и курс"""
+    user_id: Optional[int] = None
+    username: Optional[str] = None
+    course_id: int
+
+    @model_validator(mode="after")
+    def check_user(self):
+        if self.user_id is None and not self.username:
+            raise ValueError("Укажите user_id или username")
+        return self
+
+
+class BulkEnrollmentRequest(BaseModel):
+    """Схема для массовой записи на курсы"""
+    items: List[BulkEnrollmentItem]
+
+
+class BulkEnrollmentRow(BaseModel):
+    """Результат обработки одной строки массовой записи"""
+    row: int
+    user_id: Optional[int] = None
+    username: Optional[str] = None
+    course_id: Optional[int] = None
+    status: str
+    detail: Optional[str] = None
+
+
+class BulkEnrollmentReport(BaseModel):
+    """Итог массовой записи на курсы"""
+    total: int
+    enrolled: int
+    already_enrolled: int
+    failed: int
+    truncated: bool = False
+    rows: List[BulkEnrollmentRow] = []
+
+
 class CourseWithProgress(CourseOut):
     """Схема для вывода курса с информацией о прогрессе пользователя"""
     enrollments: List[EnrollmentOut] = []
@@ -221,19 +283,23 @@ class CourseWithProgress(CourseOut):
 class MyCoursesResponse(BaseModel):
     """Схема для вывода списка курсов пользователя с прогрессом"""
     items: List[CourseWithProgress]
-    total: int
-    page: int
+    total: Optional[int] = None
+    page: Optional[int] = None
     size: int
-    pages: int
+    pages: Optional[int] = None
+    # Курсор следующей страницы при пагинации по курсору
+    next_cursor: Optional[str] = None
 
 
 class CoursesResponse(BaseModel):
     """Схема для вывода списка курсов с пагинацией"""
     items: List[CourseOut]
-    total: int
-    page: int
+    total: Optional[int] = None
+    page: Optional[int] = None
     size: int
-    pages: int
+    pages: Optional[int] = None
+    # Курсор следующей страницы при пагинации по курсору
+    next_cursor: Optional[str] = None
 
 
 class CategoriesResponse(BaseModel):
@@ -274,6 +340,45 @@ class LessonOut(LessonBase):
         from_attributes = True
 
 
+class LessonSummary(BaseModel):
+    """Схема для краткого описания урока в программе курса, без содержимого"""
+    id: int
+    course_id: int
+    title: str
+    order: int
+    content_size: int
+    scene_size: int
+    has_scene: bool
+    created_at: datetime
+    updated_at: datetime
+
+
+class LessonReorder(BaseModel):
+    """
+    Схема для изменения порядка уроков: либо полный новый порядок (lesson_ids),
+    либо перемещение одного урока (lesson_id и order)
+    """
+    lesson_ids: Optional[List[int]] = None
+    lesson_id: Optional[int] = None
+    order: Optional[int] = Field(None, ge=1)
+
+    @model_validator(mode="after")
+    def validate_mode(self):
+        is_full = self.lesson_ids is not None
+        is_move = self.lesson_id is not None or self.order is not None
+        if is_full == is_move:
+            raise ValueError("Укажите либо lesson_ids, либо lesson_id и order")
+        if is_move and (self.lesson_id is None or self.order is None):
+            raise ValueError("Для перемещения урока нужны lesson_id и order")
+        return self
+
+
+class LessonPosition(BaseModel):
+    """Схема для вывода позиции урока"""
+    id: int
+    order: int
+
+
 class CourseWithLessons(CourseOut):
     """Схема для вывода курса с уроками"""
     lessons: List[LessonOut] = []
@@ -282,6 +387,11 @@ class CourseWithLessons(CourseOut):
         from_attributes = True
 
 
+class CourseSyllabus(CourseOut):
+    """Схема для вывода курса с программой (уроки без содержимого)"""
+    lessons: List[LessonSummary] = []
+
+
 class CourseEditResponse(CourseOut):
     """Схема для получения курса для редактирования с уроками"""
     lessons: List[LessonOut] = []
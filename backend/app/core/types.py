@@ -0,0 +1,69 @@
+"""
+Пользовательские типы колонок SQLAlchemy
+"""
+import gzip
+from typing import Optional, Union
+
+from sqlalchemy import LargeBinary
+from sqlalchemy.types import TypeDecorator
+
+from app.core.config import LESSON_COMPRESS_MIN_BYTES
+
+# Первые байты потока gzip
+GZIP_MAGIC = b"\x1f\x8b"
+
+
+def is_gzip(data: bytes) -> bool:
+    return data[:2] == GZIP_MAGIC
+
+
+def compress_text(value: str, min_bytes: int = LESSON_COMPRESS_MIN_BYTES) -> bytes:
+    """
+    Кодирует текст в UTF-8 и сжимает его gzip, если он не короче min_bytes.
+    Короткие значения хранятся без сжатия: заголовок gzip их только увеличит.
+    """
+    data = value.encode("utf-8")
+    if len(data) < min_bytes:
+        return data
+    # mtime=0: одинаковый текст всегда дает одинаковые байты
+    return gzip.compress(data, compresslevel=6, mtime=0)
+
+
+def decompress_text(data: Union[bytes, str, None]) -> Optional[str]:
+    """Обратное преобразование compress_text, строки (старые данные) возвращаются как есть"""
+    if data is None or isinstance(data, str):
+        return data
+    data = bytes(data)
+    if is_gzip(data):
+        data = gzip.decompress(data)
+    return data.decode("utf-8")
+
+
+def stored_bytes(data: Union[bytes, str, None]) -> Optional[bytes]:
+    """Хранимое значение колонки CompressedText в виде байтов, без распаковки"""
+    if data is None:
+        return None
+    if isinstance(data, str):
+        return data.encode("utf-8")
+    return bytes(data)
+
+
+class CompressedText(TypeDecorator):
+    """
+    Текст, хранящийся в двоичной колонке и сжатый gzip, если он длиннее
+    LESSON_COMPRESS_MIN_BYTES. Для кода приложения колонка выглядит как обычный
+    текст. Хранимые данные - корректный поток gzip, поэтому их можно отдавать
+    клиенту с Content-Encoding: gzip без распаковки (см. stored_bytes).
+
+    Значения, записанные до перехода на этот тип как TEXT, читаются без изменений.
+    """
+    impl = LargeBinary
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        return compress_text(value)
+
+    def process_result_value(self, value, dialect):
+        return decompress_text(value)
@@ -0,0 +1,154 @@
+"""
+Отложенная запись времени последнего доступа к курсу.
+
+Просмотр курса только отмечает пару (пользователь, курс) в памяти, поэтому
+чтение остается без записи в базу. Фоновая задача раз в
+ACCESS_TIME_FLUSH_SECONDS записывает накопленные отметки одним пакетным
+UPDATE; при остановке приложения буфер сбрасывается из lifespan.
+Пары без записи на курс просто не находят строку в UPDATE, отдельная
+проверка записи на курс не нужна.
+"""
+import asyncio
+import threading
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import bindparam, or_, update
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.core.config import ACCESS_TIME_FLUSH_SECONDS, ACCESS_TIME_MAX_PENDING
+from app.core.models import CourseEnrollment
+
+_enrollments = CourseEnrollment.__table__
+
+# Время доступа меняется только в сторону увеличения
+_UPDATE = update(_enrollments).where(
+    _enrollments.c.user_id == bindparam("b_user_id"),
+    _enrollments.c.course_id == bindparam("b_course_id"),
+    or_(_enrollments.c.last_accessed_at.is_(None),
+        _enrollments.c.last_accessed_at < bindparam("b_accessed_at")),
+).values(last_accessed_at=bindparam("b_accessed_at"))
+
+
+class AccessTimeBuffer:
+    """Последнее время доступа по парам (user_id, course_id) до записи в базу"""
+
+    def __init__(self, flush_seconds: float, max_pending: int):
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self._lock = threading.Lock()
+        self._pending: Dict[Tuple[int, int], datetime] = {}
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self.touches = 0
+        self.flushes = 0
+        self.flushed_rows = 0
+        self.errors = 0
+
+    def touch(self, user_id: int, course_id: int, accessed_at: Optional[datetime] = None):
+        """Отмечает доступ пользователя к курсу"""
+        accessed_at = accessed_at or datetime.now(timezone.utc)
+        key = (user_id, course_id)
+        with self._lock:
+            previous = self._pending.get(key)
+            if previous is None or previous < accessed_at:
+                self._pending[key] = accessed_at
+            self.touches += 1
+            overflow = len(self._pending) >= self.max_pending
+        if overflow and self._wakeup is not None:
+            # Буфер заполнен раньше срока, будим фоновую задачу
+            self._wakeup.set()
+
+    def _drain(self) -> Dict[Tuple[int, int], datetime]:
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return pending
+
+    def _restore(self, pending: Dict[Tuple[int, int], datetime]):
+        """Возвращает в буфер отметки, которые не удалось записать"""
+        with self._lock:
+            for key, accessed_at in pending.items():
+                current = self._pending.get(key)
+                if current is None or current < accessed_at:
+                    self._pending[key] = accessed_at
+
+    def flush(self, db: Session) -> int:
+        """
+        Записывает накопленные отметки одним пакетным UPDATE
+
+        Args:
+            db: Сессия базы данных
+
+        Returns:
+            Количество обработанных пар
+        """
+        pending = self._drain()
+        if not pending:
+            return 0
+        try:
+            db.connection().execute(_UPDATE, [
+                {"b_user_id": user_id, "b_course_id": course_id, "b_accessed_at": accessed_at}
+                for (user_id, course_id), accessed_at in pending.items()
+            ])
+            db.commit()
+        except SQLAlchemyError as e:
+            print(f"Database error in AccessTimeBuffer.flush: {str(e)}")
+            db.rollback()
+            self._restore(pending)
+            with self._lock:
+                self.errors += 1
+            return 0
+        except BaseException:
+            # Отмена фоновой задачи во время записи не должна терять отметки
+            self._restore(pending)
+            raise
+        with self._lock:
+            self.flushes += 1
+            self.flushed_rows += len(pending)
+        return len(pending)
+
+    async def flush_async(self) -> int:
+        from app.core.database import AsyncSessionLocal
+        async with AsyncSessionLocal() as db:
+            return await db.run_sync(self.flush)
+
+    async def _run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_seconds)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush_async()
+
+    def start(self):
+        """Запускает фоновую запись, вызывается из lifespan"""
+        if self._task is None:
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает фоновую запись и сбрасывает остаток буфера"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+            self._wakeup = None
+        await self.flush_async()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "pending": len(self._pending),
+                "touches": self.touches,
+                "flushes": self.flushes,
+                "flushed_rows": self.flushed_rows,
+                "errors": self.errors,
+            }
+
+
+access_time_buffer = AccessTimeBuffer(ACCESS_TIME_FLUSH_SECONDS, ACCESS_TIME_MAX_PENDING)
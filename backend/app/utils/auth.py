@@ -6,28 +6,33 @@ from datetime import datetime, timezone, timedelta
 from typing import Optional
 import jwt
 from fastapi import Depends, HTTPException, status, Header
+from sqlalchemy import select
 from sqlalchemy.orm import Session
-import bcrypt
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.core.database import get_db
+from app.core.database import get_async_db
 from app.core.models import User, RefreshToken
 from app.core.config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, REFRESH_TOKEN_EXPIRE_MINUTES
+from app.utils.hashing import hash_password, check_password, password_hasher
+from app.utils.principals import Principal, principal_cache
 
 
 # Password hashing
 def get_password_hash(password: str) -> str:
-    hashed = bcrypt.hashpw(
-        bytes(password, encoding="utf-8"),
-        bcrypt.gensalt(),
-    )
-    return hashed.decode('utf-8')
+    return hash_password(password)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return bcrypt.checkpw(
-        bytes(plain_password, encoding="utf-8"),
-        bytes(hashed_password, encoding="utf-8"),
-    )
+    return check_password(plain_password, hashed_password)
+
+
+# Asynchronous variants run bcrypt in the bounded hashing pool
+async def get_password_hash_async(password: str) -> str:
+    return await password_hasher.hash(password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    return await password_hasher.verify(plain_password, hashed_password)
 
 
 # Token handling
@@ -70,10 +75,31 @@ def save_refresh_token(db: Session, user_id: int, token: str):
     return db_token
 
 
+async def save_refresh_token_async(db: AsyncSession, user_id: int, token: str):
+    return await db.run_sync(save_refresh_token, user_id, token)
+
+
+async def get_user_by_token_subject(db: AsyncSession, username: str) -> Optional[User]:
+    result = await db.execute(select(User).where(User.username == username))
+    return result.scalars().first()
+
+
+async def get_principal(db: AsyncSession, username: str) -> Optional[Principal]:
+    """Resolve token subject to a principal, from cache when possible"""
+    principal = principal_cache.get(username)
+    if principal is None:
+        user = await get_user_by_token_subject(db, username)
+        if user is None:
+            return None
+        principal = Principal.from_user(user)
+        principal_cache.put(username, principal)
+    return principal
+
+
 async def get_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-):
+    db: AsyncSession = Depends(get_async_db)
+) -> Principal:
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
@@ -87,16 +113,16 @@ async def get_current_user(
     except jwt.PyJWTError:
         raise credentials_exception
 
-    user = db.query(User).filter(User.username == username).first()
-    if user is None:
+    principal = await get_principal(db, username)
+    if principal is None:
         raise credentials_exception
-    return user
+    return principal
 
 
 async def get_optional_current_user(
     token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db)
-):
+    db: AsyncSession = Depends(get_async_db)
+) -> Optional[Principal]:
     """
     Attempts to get the current user from the token but returns None
     if authentication fails instead of raising an exception.
@@ -112,13 +138,12 @@ async def get_optional_current_user(
     except jwt.PyJWTError:
         return None
 
-    user = db.query(User).filter(User.username == username).first()
-    return user
+    return await get_principal(db, username)
 
 
 async def get_current_active_user(
-    current_user: User = Depends(get_current_user)
-):
+    current_user: Principal = Depends(get_current_user)
+) -> Principal:
     if current_user.disabled:
         raise HTTPException(status_code=400, detail="Inactive user")
     return current_user
@@ -128,7 +153,7 @@ class RoleChecker:
     def __init__(self, allowed_roles: list):
         self.allowed_roles = allowed_roles
 
-    def __call__(self, user: User = Depends(get_current_active_user)):
+    def __call__(self, user: Principal = Depends(get_current_active_user)):
         if user.role not in self.allowed_roles:
             raise HTTPException(
                 status_code=403,
@@ -0,0 +1,252 @@
+"""
+Content-addressed blob store for user files.
+
+Every distinct file content is stored once under BLOB_DIR, named after its
+SHA-256. UserFile rows reference blobs and each blob counts its references,
+so uploading a duplicate costs no disk and renames or moves only change
+metadata. A blob file is removed once the last reference to it is gone.
+
+Counters live only in the database and change by single UPDATE statements,
+so they stay correct across workers and processes; row locks taken by those
+statements order adding a reference against removing the blob file.
+"""
+import hashlib
+import os
+import shutil
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Callable, Iterable, List, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.core.config import BASE_FOLDER_DIR
+from app.core.models import FileBlob, UserFile
+from app.utils.thumbnails import thumbnail_cache
+from app.utils.uploads import StagedUpload
+
+# Same filesystem as the upload temp dir, so adding a blob is an atomic rename
+BLOB_DIR = Path(BASE_FOLDER_DIR) / ".blobs"
+
+# Thumbnails of blobs are shared by all users under this namespace
+BLOB_THUMBNAIL_NAMESPACE = "blobs"
+
+# Attempts to reference a blob whose row is concurrently inserted or removed
+BLOB_REFERENCE_ATTEMPTS = 5
+
+
+def blob_path(checksum: str) -> Path:
+    """Location of blob content on disk"""
+    return BLOB_DIR / checksum[:2] / checksum[2:4] / checksum
+
+
+def _reference_blob(db: Session, checksum: str, size: int,
+                    store: Callable[[Path], None]) -> Tuple[FileBlob, bool]:
+    """
+    Add a reference to the blob with given checksum, creating its row if needed.
+
+    The counter is bumped by a single UPDATE whose row lock is held until the
+    caller commits, so remove_blob_files() can not remove the content in the
+    meantime. store() puts the content at the blob path; it is called for a
+    new row and for an existing row whose file is missing (removal of a
+    released blob whose row delete was rolled back). Returns the blob and
+    whether store() was called.
+    """
+    path = blob_path(checksum)
+    for _ in range(BLOB_REFERENCE_ATTEMPTS):
+        updated = db.query(FileBlob).filter(FileBlob.checksum == checksum).update(
+            {FileBlob.ref_count: FileBlob.ref_count + 1},
+            synchronize_session=False
+        )
+        if updated:
+            blob = db.query(FileBlob).filter(FileBlob.checksum == checksum).one()
+            if path.is_file():
+                return blob, False
+            path.parent.mkdir(parents=True, exist_ok=True)
+            store(path)
+            return blob, True
+
+        blob = FileBlob(checksum=checksum, size=size, ref_count=1)
+        try:
+            with db.begin_nested():
+                db.add(blob)
+        except IntegrityError:
+            # The same content was added concurrently, reference that row instead
+            continue
+        path.parent.mkdir(parents=True, exist_ok=True)
+        store(path)
+        return blob, True
+    raise RuntimeError(f"Could not reference blob {checksum}")
+
+
+def acquire_blob(db: Session, staged: StagedUpload) -> FileBlob:
+    """
+    Return the blob for staged content, adding a reference to it.
+
+    Existing content only bumps the reference counter and the staged file is
+    dropped; new content is renamed into the store. The caller commits.
+    """
+    # A file left by an interrupted upload has the same content and is simply replaced
+    blob, stored = _reference_blob(
+        db, staged.checksum, staged.size, lambda path: os.replace(staged.path, path))
+    if not stored:
+        staged.discard()
+    return blob
+
+
+def hash_file(path: Path, chunk_size: int = 1024 * 1024) -> Tuple[int, str]:
+    """Size and SHA-256 of file on disk"""
+    hasher = hashlib.sha256()
+    size = 0
+    with path.open("rb") as source:
+        for chunk in iter(lambda: source.read(chunk_size), b""):
+            hasher.update(chunk)
+            size += len(chunk)
+    return size, hasher.hexdigest()
+
+
+def _link_or_copy(source: Path, target: Path):
+    try:
+        os.link(source, target)
+    except FileExistsError:
+        # Content left by an interrupted upload is the same, keep it
+        pass
+    except OSError:
+        tmp_path = target.with_suffix(".tmp")
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, target)
+
+
+def adopt_blob(db: Session, path: Path) -> FileBlob:
+    """
+    Add a reference to the blob holding content of an existing file, storing
+    the content first if it is new. The source file is left untouched (new
+    content is hard-linked into the store where possible), so the caller
+    removes it only after committing.
+    """
+    size, checksum = hash_file(path)
+    blob, _ = _reference_blob(db, checksum, size, lambda target: _link_or_copy(path, target))
+    return blob
+
+
+def release_blobs(db: Session, blob_ids: Iterable[int]) -> List[str]:
+    """
+    Drop references to blobs.
+
+    Returns checksums of blobs left without references. The caller commits
+    and then passes them to remove_blob_files(), which re-checks the counters.
+    """
+    counts = Counter(blob_id for blob_id in blob_ids if blob_id is not None)
+    if not counts:
+        return []
+
+    for blob_id, count in counts.items():
+        updated = db.query(FileBlob).filter(
+            FileBlob.id == blob_id,
+            FileBlob.ref_count >= count
+        ).update(
+            {FileBlob.ref_count: FileBlob.ref_count - count},
+            synchronize_session=False
+        )
+        if not updated:
+            # The counter is behind the user_files rows; never let it go negative,
+            # reconcile_blob_refs() restores the exact value
+            print(f"Blob {blob_id} has fewer than {count} references, resetting counter")
+            db.query(FileBlob).filter(
+                FileBlob.id == blob_id,
+                FileBlob.ref_count > 0
+            ).update({FileBlob.ref_count: 0}, synchronize_session=False)
+
+    return [checksum for (checksum,) in db.query(FileBlob.checksum).filter(
+        FileBlob.id.in_(list(counts)),
+        FileBlob.ref_count <= 0
+    ).all()]
+
+
+def remove_blob_files(db: Session, checksums: Iterable[str]) -> int:
+    """
+    Remove released blobs together with their thumbnails. Called after the
+    transaction that released them has committed.
+
+    Each blob row is deleted only if it still has no references; the delete
+    keeps the row locked while the file is unlinked, so a concurrent
+    acquire_blob() either waits and then stores the content again, or has
+    already referenced the blob and the row is kept. Returns number of
+    removed blobs.
+    """
+    removed = 0
+    for checksum in checksums:
+        try:
+            deleted = db.query(FileBlob).filter(
+                FileBlob.checksum == checksum,
+                FileBlob.ref_count <= 0
+            ).delete(synchronize_session=False)
+            if deleted:
+                path = blob_path(checksum)
+                thumbnail_cache.invalidate(path, BLOB_THUMBNAIL_NAMESPACE)
+                path.unlink(missing_ok=True)
+            db.commit()
+            removed += deleted
+        except SQLAlchemyError as e:
+            # The row stays; acquire_blob() restores missing content when it is referenced again
+            print(f"Database error in remove_blob_files: {str(e)}")
+            db.rollback()
+    return removed
+
+
+def remove_released_blobs(checksums: Iterable[str]) -> int:
+    """remove_blob_files() with a session of its own, for use in a worker thread"""
+    checksums = list(checksums)
+    if not checksums:
+        return 0
+    from app.core.database import SessionLocal
+    db = SessionLocal()
+    try:
+        return remove_blob_files(db, checksums)
+    finally:
+        db.close()
+
+
+def reconcile_blob_refs(db: Session) -> int:
+    """
+    Recount blob references from user_files and drop blobs nobody references.
+    Returns number of blobs whose counter was wrong.
+    """
+    actual = dict(db.query(UserFile.blob_id, func.count(UserFile.id)).filter(
+        UserFile.blob_id != None
+    ).group_by(UserFile.blob_id).all())
+
+    fixed = 0
+    released = []
+    for blob in db.query(FileBlob).all():
+        count = actual.get(blob.id, 0)
+        if blob.ref_count != count:
+            blob.ref_count = count
+            fixed += 1
+        if count == 0:
+            released.append(blob.checksum)
+    db.commit()
+    remove_blob_files(db, released)
+    return fixed
+
+
+def collect_orphan_blob_files(db: Session, min_age: float = 3600) -> int:
+    """
+    Remove blob files without a blob row, left by uploads whose transaction
+    failed. Files younger than min_age seconds may belong to an upload in
+    progress and are kept. Returns number of removed files.
+    """
+    known = {checksum for (checksum,) in db.query(FileBlob.checksum).all()}
+    deadline = time.time() - min_age
+    removed = 0
+    for path in BLOB_DIR.glob("*/*/*"):
+        try:
+            if path.name in known or path.stat().st_mtime > deadline:
+                continue
+        except OSError:
+            continue
+        path.unlink(missing_ok=True)
+        removed += 1
+    return removed
@@ -0,0 +1,227 @@
+"""
+Массовая запись пользователей на курсы из JSON или потока CSV.
+
+Строки обрабатываются пакетами: пользователи и курсы пакета выбираются
+двумя запросами, допустимые пары вставляются одним
+INSERT ... ON CONFLICT DO NOTHING (insert_enrollments), после чего пакет
+коммитится. Для каждой строки возвращается статус.
+"""
+import codecs
+import csv
+from dataclasses import dataclass
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+
+from app.core.config import BULK_ENROLL_BATCH_SIZE, BULK_ENROLL_MAX_ROWS
+from app.core.models import Course, User
+from app.core.schemas import BulkEnrollmentItem
+from app.utils.courses import insert_enrollments
+from app.utils.recommendations import recommendation_engine
+
+# Статусы строк
+ENROLLED = "enrolled"
+ALREADY_ENROLLED = "already_enrolled"
+DUPLICATE = "duplicate"
+INVALID = "invalid"
+USER_NOT_FOUND = "user_not_found"
+COURSE_NOT_FOUND = "course_not_found"
+FORBIDDEN = "forbidden"
+ERROR = "error"
+
+
+@dataclass
+class BulkRow:
+    row: int
+    user_id: Optional[int] = None
+    username: Optional[str] = None
+    course_id: Optional[int] = None
+    status: Optional[str] = None
+    detail: Optional[str] = None
+
+    def result(self) -> dict:
+        return {
+            "row": self.row, "user_id": self.user_id, "username": self.username,
+            "course_id": self.course_id, "status": self.status, "detail": self.detail,
+        }
+
+
+async def rows_from_items(items: Iterable[BulkEnrollmentItem]) -> AsyncIterator[BulkRow]:
+    for number, item in enumerate(items, start=1):
+        yield BulkRow(row=number, user_id=item.user_id, username=item.username, course_id=item.course_id)
+
+
+def _parse_int(value: Optional[str]) -> Optional[int]:
+    value = (value or "").strip()
+    return int(value) if value else None
+
+
+def row_from_csv(number: int, record: Dict[str, str]) -> BulkRow:
+    """Строка CSV с колонками user_id или username и course_id"""
+    row = BulkRow(row=number, username=(record.get("username") or "").strip() or None)
+    try:
+        row.user_id = _parse_int(record.get("user_id"))
+        row.course_id = _parse_int(record.get("course_id"))
+    except ValueError:
+        row.status, row.detail = INVALID, "user_id и course_id должны быть целыми числами"
+        return row
+    if row.course_id is None or (row.user_id is None and row.username is None):
+        row.status, row.detail = INVALID, "Нужны course_id и user_id или username"
+    return row
+
+
+async def rows_from_csv_stream(chunks: AsyncIterator[bytes]) -> AsyncIterator[BulkRow]:
+    """
+    Читает CSV из потока тела запроса по мере поступления.
+    Первая строка - заголовок, номер строки данных считается с 1.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")(errors="replace")
+    header: Optional[List[str]] = None
+    number = 0
+    pending = ""
+
+    def records(lines: List[str]):
+        nonlocal header, number
+        for values in csv.reader(lines):
+            if not values or not any(v.strip() for v in values):
+                continue
+            if header is None:
+                header = [v.strip().lower() for v in values]
+                continue
+            number += 1
+            yield row_from_csv(number, dict(zip(header, values)))
+
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for row in records(lines):
+            yield row
+    pending += decoder.decode(b"", final=True)
+    for row in records([pending]):
+        yield row
+
+
+def enroll_batch(db: Session, rows: List[BulkRow], actor, seen: Set[Tuple[int, int]]) -> List[BulkRow]:
+    """
+    Обрабатывает пакет строк и коммитит вставленные записи
+
+    Args:
+        db: Сессия базы данных
+        rows: Строки пакета
+        actor: Пользователь, выполняющий импорт (админ или преподаватель)
+        seen: Пары, уже встречавшиеся в импорте; дополняется пакетом
+
+    Returns:
+        Строки с заполненными статусами
+    """
+    usernames = {row.username for row in rows if row.status is None and row.user_id is None}
+    user_ids = {row.user_id for row in rows if row.status is None and row.user_id is not None}
+    course_ids = {row.course_id for row in rows if row.status is None}
+
+    try:
+        ids_by_username = dict(db.query(User.username, User.id).filter(
+            User.username.in_(usernames)).all()) if usernames else {}
+        existing_users = {user_id for (user_id,) in db.query(User.id).filter(
+            User.id.in_(user_ids)).all()} if user_ids else set()
+        authors = dict(db.query(Course.id, Course.author).filter(
+            Course.id.in_(course_ids)).all()) if course_ids else {}
+    except SQLAlchemyError as e:
+        print(f"Database error in enroll_batch: {str(e)}")
+        db.rollback()
+        for row in rows:
+            row.status = row.status or ERROR
+        return rows
+
+    pairs = []
+    for row in rows:
+        if row.status is not None:
+            continue
+        if row.user_id is None:
+            row.user_id = ids_by_username.get(row.username)
+            if row.user_id is None:
+                row.status, row.detail = USER_NOT_FOUND, f"Пользователь {row.username} не найден"
+                continue
+        elif row.user_id not in existing_users:
+            row.status, row.detail = USER_NOT_FOUND, f"Пользователь с ID {row.user_id} не найден"
+            continue
+        if row.course_id not in authors:
+            row.status, row.detail = COURSE_NOT_FOUND, f"Курс с ID {row.course_id} не найден"
+            continue
+        if actor.role != "admin" and authors[row.course_id] != actor.username:
+            row.status, row.detail = FORBIDDEN, "Недостаточно прав для записи на этот курс"
+            continue
+        pair = (row.user_id, row.course_id)
+        if pair in seen:
+            row.status, row.detail = DUPLICATE, "Пара уже встречалась в импорте"
+            continue
+        seen.add(pair)
+        pairs.append(pair)
+
+    try:
+        inserted = {(e.user_id, e.course_id) for e in insert_enrollments(db, pairs)}
+        db.commit()
+    except SQLAlchemyError as e:
+        print(f"Database error in enroll_batch: {str(e)}")
+        db.rollback()
+        inserted = None
+
+    for row in rows:
+        if row.status is not None:
+            continue
+        if inserted is None:
+            row.status = ERROR
+        else:
+            row.status = ENROLLED if (row.user_id, row.course_id) in inserted else ALREADY_ENROLLED
+
+    if inserted:
+        # Совместные записи изменились массово, индекс перестроится при следующем запросе
+        recommendation_engine.invalidate()
+    return rows
+
+
+async def import_enrollments(db: AsyncSession, rows: AsyncIterator[BulkRow], actor,
+                             errors_only: bool = False) -> dict:
+    """
+    Записывает пользователей на курсы пакетами по BULK_ENROLL_BATCH_SIZE строк.
+    Строки сверх BULK_ENROLL_MAX_ROWS не обрабатываются, в отчете
+    выставляется truncated.
+
+    Args:
+        db: Асинхронная сессия базы данных
+        rows: Строки импорта
+        actor: Пользователь, выполняющий импорт
+        errors_only: Возвращать в отчете только строки с ошибками
+
+    Returns:
+        Данные для BulkEnrollmentReport
+    """
+    report = {"total": 0, "enrolled": 0, "already_enrolled": 0, "failed": 0,
+              "truncated": False, "rows": []}
+    seen: Set[Tuple[int, int]] = set()
+    batch: List[BulkRow] = []
+
+    async def flush():
+        for row in await db.run_sync(enroll_batch, batch, actor, seen):
+            if row.status == ENROLLED:
+                report["enrolled"] += 1
+            elif row.status == ALREADY_ENROLLED:
+                report["already_enrolled"] += 1
+            else:
+                report["failed"] += 1
+            if not errors_only or row.status not in (ENROLLED, ALREADY_ENROLLED):
+                report["rows"].append(row.result())
+        batch.clear()
+
+    async for row in rows:
+        if report["total"] >= BULK_ENROLL_MAX_ROWS:
+            report["truncated"] = True
+            break
+        report["total"] += 1
+        batch.append(row)
+        if len(batch) >= BULK_ENROLL_BATCH_SIZE:
+            await flush()
+    if batch:
+        await flush()
+    return report
@@ -0,0 +1,357 @@
+"""
+HTTP content coding: negotiation helpers, a response compression middleware,
+precompressed static file lookup and compression ratio metrics
+"""
+import gzip
+import mimetypes
+import os
+import threading
+import zlib
+from collections import defaultdict
+from typing import Iterable, List, Optional, Tuple
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+from starlette.types import Message, Receive, Scope, Send
+
+from app.core.config import (
+    COMPRESSION_MIN_BYTES, COMPRESSION_TYPES, COMPRESSION_GZIP_LEVEL, COMPRESSION_BROTLI_QUALITY
+)
+from app.core.types import is_gzip
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+# Supported codings in order of preference when the client weighs them equally
+SUPPORTED_ENCODINGS = ["br", "gzip"] if brotli is not None else ["gzip"]
+
+# File name suffixes of precompressed static siblings
+PRECOMPRESSED_SUFFIXES = {"br": ".br", "gzip": ".gz"}
+
+
+def parse_accept_encoding(header: Optional[str]) -> dict:
+    """Map content codings of an Accept-Encoding header to their q-values"""
+    codings = {}
+    for item in (header or "").split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params.split(";"):
+            name, _, value = param.strip().partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        codings[coding] = quality
+    return codings
+
+
+def accepts_encoding(request_headers: Optional[Headers], coding: str) -> bool:
+    """Whether the client accepts a response in the given content coding"""
+    if request_headers is None:
+        return False
+    codings = parse_accept_encoding(request_headers.get("accept-encoding"))
+    if coding in codings:
+        return codings[coding] > 0
+    return codings.get("*", 0) > 0
+
+
+def choose_encoding(request_headers: Optional[Headers],
+                    available: Iterable[str] = SUPPORTED_ENCODINGS) -> Optional[str]:
+    """Best coding out of available ones the client accepts, None for identity"""
+    if request_headers is None:
+        return None
+    codings = parse_accept_encoding(request_headers.get("accept-encoding"))
+    best, best_quality = None, 0.0
+    for coding in available:
+        quality = codings.get(coding, codings.get("*", 0.0))
+        if quality > best_quality:
+            best, best_quality = coding, quality
+    return best
+
+
+def is_compressible(content_type: Optional[str], allowed: Iterable[str] = COMPRESSION_TYPES) -> bool:
+    if not content_type:
+        return False
+    return content_type.split(";", 1)[0].strip().lower() in allowed
+
+
+def add_vary(headers: MutableHeaders, value: str = "Accept-Encoding"):
+    vary = headers.get("vary")
+    if not vary:
+        headers["vary"] = value
+    elif value.lower() not in [v.strip().lower() for v in vary.split(",")] and vary.strip() != "*":
+        headers["vary"] = f"{vary}, {value}"
+
+
+class _Encoder:
+    """Incremental compressor for one response body"""
+
+    def __init__(self, coding: str, gzip_level: int, brotli_quality: int):
+        if coding == "br":
+            self._compressor = brotli.Compressor(quality=brotli_quality)
+            self._compress, self._finish = self._compressor.process, self._compressor.finish
+        else:
+            self._compressor = zlib.compressobj(gzip_level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+            self._compress, self._finish = self._compressor.compress, self._compressor.flush
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compress(data)
+
+    def finish(self) -> bytes:
+        return self._finish()
+
+
+class CompressionMetrics:
+    """Compressed and skipped responses, byte counts and compression ratio per coding"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._compressed = defaultdict(lambda: {"responses": 0, "bytes_in": 0, "bytes_out": 0})
+        self._precompressed = defaultdict(lambda: {"responses": 0, "bytes_in": 0, "bytes_out": 0})
+        self._skipped = defaultdict(int)
+
+    def record_compressed(self, coding: str, bytes_in: int, bytes_out: int):
+        with self._lock:
+            self._add(self._compressed[coding], bytes_in, bytes_out)
+
+    def record_precompressed(self, coding: str, bytes_in: int, bytes_out: int):
+        with self._lock:
+            self._add(self._precompressed[coding], bytes_in, bytes_out)
+
+    def record_skipped(self, reason: str):
+        with self._lock:
+            self._skipped[reason] += 1
+
+    @staticmethod
+    def _add(counters: dict, bytes_in: int, bytes_out: int):
+        counters["responses"] += 1
+        counters["bytes_in"] += bytes_in
+        counters["bytes_out"] += bytes_out
+
+    @staticmethod
+    def _summary(counters: dict) -> dict:
+        summary = {}
+        for coding, item in counters.items():
+            summary[coding] = dict(
+                item,
+                ratio=round(item["bytes_out"] / item["bytes_in"], 4) if item["bytes_in"] else 0.0,
+                bytes_saved=item["bytes_in"] - item["bytes_out"],
+            )
+        return summary
+
+    def snapshot(self) -> Tuple[dict, dict, dict]:
+        """Raw counters: compressed and precompressed per coding, skipped per reason"""
+        with self._lock:
+            return ({k: dict(v) for k, v in self._compressed.items()},
+                    {k: dict(v) for k, v in self._precompressed.items()},
+                    dict(self._skipped))
+
+    def stats(self) -> dict:
+        compressed, precompressed, skipped = self.snapshot()
+        return {
+            "compressed": self._summary(compressed),
+            "precompressed": self._summary(precompressed),
+            "skipped": skipped,
+            "encodings": SUPPORTED_ENCODINGS,
+            "min_bytes": COMPRESSION_MIN_BYTES,
+        }
+
+
+compression_metrics = CompressionMetrics()
+
+
+class CompressionMiddleware:
+    """
+    Compress response bodies with brotli or gzip, whichever the client prefers.
+
+    Only responses of an allowed media type that are at least min_bytes long
+    are compressed. Responses that already carry Content-Encoding (such as
+    precompressed static files or stored gzip lesson data), partial content
+    and no-transform responses pass through untouched.
+    """
+
+    def __init__(self, app, min_bytes: int = COMPRESSION_MIN_BYTES,
+                 content_types: Iterable[str] = COMPRESSION_TYPES,
+                 gzip_level: int = COMPRESSION_GZIP_LEVEL,
+                 brotli_quality: int = COMPRESSION_BROTLI_QUALITY):
+        self.app = app
+        self.min_bytes = min_bytes
+        self.content_types = {t.strip().lower() for t in content_types if t.strip()}
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http" or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        coding = choose_encoding(Headers(scope=scope))
+        if coding is None:
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressionResponder(self, coding, send)
+        await self.app(scope, receive, responder.send)
+
+
+class _CompressionResponder:
+    def __init__(self, middleware: CompressionMiddleware, coding: str, send: Send):
+        self.middleware = middleware
+        self.coding = coding
+        self._send = send
+        self.start: Optional[Message] = None
+        self.passthrough = False
+        self.buffer: List[bytes] = []
+        self.buffered = 0
+        self.encoder: Optional[_Encoder] = None
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def _skip_reason(self, message: Message) -> Optional[str]:
+        headers = Headers(raw=message["headers"])
+        status = message["status"]
+        if status < 200 or status in (204, 206, 304) or "content-range" in headers:
+            return "status"
+        if "content-encoding" in headers:
+            return "already_encoded"
+        if "no-transform" in headers.get("cache-control", "").lower():
+            return "no_transform"
+        if not is_compressible(headers.get("content-type"), self.middleware.content_types):
+            return "content_type"
+        length = headers.get("content-length")
+        if length is not None and length.isdigit() and int(length) < self.middleware.min_bytes:
+            return "too_small"
+        return None
+
+    async def send(self, message: Message):
+        if message["type"] == "http.response.start":
+            reason = self._skip_reason(message)
+            if reason is not None:
+                compression_metrics.record_skipped(reason)
+                self.passthrough = True
+                await self._send(message)
+            else:
+                self.start = message
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.encoder is None:
+            self.buffer.append(body)
+            self.buffered += len(body)
+            if more_body and self.buffered < self.middleware.min_bytes:
+                return
+            body = b"".join(self.buffer)
+            self.buffer = []
+            if not more_body and self.buffered < self.middleware.min_bytes:
+                # Body without Content-Length turned out to be small
+                compression_metrics.record_skipped("too_small")
+                self.passthrough = True
+                await self._send(self.start)
+                await self._send({"type": "http.response.body", "body": body})
+                return
+            await self._start_compression(body, more_body)
+            return
+
+        await self._send_compressed(body, more_body)
+
+    async def _start_compression(self, body: bytes, more_body: bool):
+        self.encoder = _Encoder(self.coding, self.middleware.gzip_level, self.middleware.brotli_quality)
+        headers = MutableHeaders(raw=list(self.start["headers"]))
+        headers["content-encoding"] = self.coding
+        add_vary(headers)
+        # The compressed representation is not byte-identical to the original
+        etag = headers.get("etag")
+        if etag and not etag.startswith("W/"):
+            headers["etag"] = f"W/{etag}"
+        if "content-length" in headers:
+            del headers["content-length"]
+
+        if not more_body:
+            data = self.encoder.compress(body) + self.encoder.finish()
+            headers["content-length"] = str(len(data))
+            await self._send({**self.start, "headers": headers.raw})
+            await self._send({"type": "http.response.body", "body": data})
+            compression_metrics.record_compressed(self.coding, len(body), len(data))
+            return
+
+        await self._send({**self.start, "headers": headers.raw})
+        await self._send_compressed(body, more_body)
+
+    async def _send_compressed(self, body: bytes, more_body: bool):
+        data = self.encoder.compress(body)
+        if not more_body:
+            data += self.encoder.finish()
+        self.bytes_in += len(body)
+        self.bytes_out += len(data)
+        if data or not more_body:
+            await self._send({"type": "http.response.body", "body": data, "more_body": more_body})
+        if not more_body:
+            compression_metrics.record_compressed(self.coding, self.bytes_in, self.bytes_out)
+
+
+def find_precompressed(full_path: "os.PathLike[str]", stat_result: os.stat_result,
+                       request_headers: Headers) -> Optional[Tuple[str, str, os.stat_result]]:
+    """
+    Precompressed sibling (file.br or file.gz) of a static file in a coding
+    the client accepts. Siblings older than the file itself are ignored.
+
+    Returns:
+        (coding, sibling path, sibling stat) or None
+    """
+    if "range" in request_headers:
+        return None
+    available = []
+    siblings = {}
+    for coding in ("br", "gzip"):
+        path = f"{os.fspath(full_path)}{PRECOMPRESSED_SUFFIXES[coding]}"
+        try:
+            sibling_stat = os.stat(path)
+        except OSError:
+            continue
+        if sibling_stat.st_mtime >= stat_result.st_mtime:
+            available.append(coding)
+            siblings[coding] = (path, sibling_stat)
+    if not available:
+        return None
+    coding = choose_encoding(request_headers, available)
+    if coding is None:
+        return None
+    return (coding,) + siblings[coding]
+
+
+def guess_media_type(path: "os.PathLike[str]") -> str:
+    return mimetypes.guess_type(os.fspath(path))[0] or "text/plain"
+
+
+def compress_bytes(data: bytes, coding: str) -> bytes:
+    """Compress a whole body with maximum effort, for precompressed files"""
+    if coding == "br":
+        return brotli.compress(data, quality=11)
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def stored_content_response(data: bytes, media_type: str,
+                            request_headers: Optional[Headers]) -> Response:
+    """
+    Respond with a stored value that may be a gzip stream.
+
+    Compressed data is sent as is with Content-Encoding: gzip when the client
+    accepts gzip and decompressed otherwise; uncompressed data is sent as is.
+    """
+    headers = {"Vary": "Accept-Encoding"}
+    if is_gzip(data):
+        if accepts_encoding(request_headers, "gzip"):
+            headers["Content-Encoding"] = "gzip"
+        else:
+            data = gzip.decompress(data)
+    return Response(content=data, media_type=media_type, headers=headers)
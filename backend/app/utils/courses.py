@@ -3,12 +3,21 @@
 """
 from typing import Dict, List, Optional, Any, Tuple
 from datetime import datetime, timezone
-from sqlalchemy import func, desc, asc, and_, or_
-from sqlalchemy.orm import Session, joinedload, contains_eager
+from sqlalchemy import func, desc, and_, or_, case, type_coerce, literal, select, Text
+from sqlalchemy.orm import Session, joinedload, contains_eager, selectinload
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.ext.asyncio import AsyncSession
 from fastapi import HTTPException, status
 
-from app.core.models import Course, Category, CourseEnrollment, User, course_categories, Lesson
+from app.core.models import (
+    Course, Category, CourseEnrollment, User, course_categories, Lesson, LessonCompletion
+)
+from app.core.types import stored_bytes
+from app.utils.search import is_search_index_enabled, build_search_subquery
+from app.utils.pagination import fetch_keyset_page, keyset_order, count_cache, make_cache_key
+from app.utils.recommendations import recommendation_engine
 
 
 def get_course_by_id(db: Session, course_id: int) -> Course:
@@ -49,7 +58,151 @@ def get_course_by_id(db: Session, course_id: int) -> Course:
         )
 
 
-def get_filtered_courses_query(
+def get_course_with_lessons_by_id(db: Session, course_id: int) -> Course:
+    """
+    Получает курс вместе с категориями и упорядоченными уроками или выдает ошибку 404
+
+    Args:
+        db: Сессия базы данных
+        course_id: ID курса
+
+    Returns:
+        Объект курса с загруженными уроками
+
+    Raises:
+        HTTPException: если курс не найден
+    """
+    try:
+        course = db.query(Course).options(
+            joinedload(Course.categories),
+            selectinload(Course.lessons)
+        ).filter(
+            Course.id == course_id
+        ).first()
+
+        if not course:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"Курс с ID {course_id} не найден"
+            )
+
+        return course
+
+    except SQLAlchemyError as e:
+        # Логирование ошибки
+        print(f"Database error in get_course_with_lessons_by_id: {str(e)}")
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при получении курса: {str(e)}"
+        )
+
+
+def get_lesson_summaries(db: Session, course_id: int) -> List[Dict[str, Any]]:
+    """
+    Получает краткое описание уроков курса без загрузки их содержимого
+
+    Столбцы content и scene_data не читаются: размеры и признак наличия сцены
+    берутся из content_size и scene_size.
+
+    Args:
+        db: Сессия базы данных
+        course_id: ID курса
+
+    Returns:
+        Список словарей с полями LessonSummary в порядке уроков
+    """
+    # Размеры уроков, записанных до появления content_size и scene_size,
+    # считаются по хранимому тексту (см. app.core.compress_lessons)
+    content = type_coerce(Lesson.content, Text)
+    scene_data = type_coerce(Lesson.scene_data, Text)
+    content_size = func.coalesce(Lesson.content_size, func.length(content), 0)
+    scene_size = func.coalesce(
+        Lesson.scene_size,
+        case((scene_data.in_(["", "null"]), 0), else_=func.length(scene_data)),
+        0
+    )
+
+    rows = db.query(
+        Lesson.id,
+        Lesson.course_id,
+        Lesson.title,
+        Lesson.order,
+        content_size.label("content_size"),
+        scene_size.label("scene_size"),
+        Lesson.created_at,
+        Lesson.updated_at
+    ).filter(
+        Lesson.course_id == course_id
+    ).order_by(Lesson.order, Lesson.id).all()
+
+    return [dict(row._asdict(), has_scene=row.scene_size > 0) for row in rows]
+
+
+def get_lesson_by_id(db: Session, course_id: int, lesson_id: int) -> Lesson:
+    """
+    Получает урок курса со всем содержимым или выдает ошибку 404
+
+    Args:
+        db: Сессия базы данных
+        course_id: ID курса
+        lesson_id: ID урока
+
+    Returns:
+        Объект урока
+
+    Raises:
+        HTTPException: если урок не найден
+    """
+    lesson = db.query(Lesson).filter(
+        Lesson.id == lesson_id,
+        Lesson.course_id == course_id
+    ).first()
+
+    if not lesson:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Урок с ID {lesson_id} не найден"
+        )
+
+    return lesson
+
+
+def get_lesson_stored_field(db: Session, course_id: int, lesson_id: int, field: str) -> Optional[bytes]:
+    """
+    Получает хранимые байты поля урока (content или scene_data) без распаковки.
+    Сжатое значение - поток gzip (см. app.core.types.CompressedText)
+
+    Raises:
+        HTTPException: если урок не найден
+    """
+    column = getattr(Lesson, field)
+    row = db.query(type_coerce(column, Text)).filter(
+        Lesson.id == lesson_id,
+        Lesson.course_id == course_id
+    ).first()
+
+    if row is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Урок с ID {lesson_id} не найден"
+        )
+
+    return stored_bytes(row[0])
+
+
+def get_filtered_courses_query(db: Session, **filter_params) -> Any:
+    """
+    Создает SQLAlchemy запрос для фильтрации курсов с заданными параметрами.
+    Параметры совпадают с build_filtered_courses_query.
+
+    Returns:
+        SQLAlchemy Query объект с примененными фильтрами
+    """
+    query, _, _ = build_filtered_courses_query(db, **filter_params)
+    return query
+
+
+def build_filtered_courses_query(
     db: Session,
     category_id: Optional[int] = None,
     difficulty: Optional[str] = None,
@@ -59,7 +212,7 @@ def get_filtered_courses_query(
     author: Optional[str] = None,
     sort_by: Optional[str] = "created_at",
     sort_order: Optional[str] = "desc"
-) -> Any:
+) -> Tuple[Any, Any, bool]:
     """
     Создает SQLAlchemy запрос для фильтрации курсов с заданными параметрами
 
@@ -68,14 +221,17 @@ def get_filtered_courses_query(
         category_id: ID категории для фильтрации
         difficulty: Уровень сложности курса (для обратной совместимости)
         difficulties: Список уровней сложности курса
-        search: Строка поиска только для заголовка и описания
+        search: Строка поиска по курсам и названиям их уроков
         category_names: Список имен категорий для фильтрации
         author: Имя автора для фильтрации
-        sort_by: Поле для сортировки
+        sort_by: Поле для сортировки или "relevance" для сортировки по релевантности поиска
         sort_order: Порядок сортировки ("asc" или "desc")
 
     Returns:
-        SQLAlchemy Query объект с примененными фильтрами
+        Tuple из трех элементов:
+        - SQLAlchemy Query объект с примененными фильтрами и сортировкой
+        - Выражение, по которому выполняется сортировка
+        - True, если сортировка по убыванию
     """
     try:
         # Загружаем связанные категории для каждого курса
@@ -123,8 +279,15 @@ def get_filtered_courses_query(
             if category_conditions:
                 query = query.filter(or_(*category_conditions))
 
-        # Поиск по названию и описанию
-        if search:
+        # Полнотекстовый поиск по индексу или поиск по названию и описанию
+        search_results = None
+        if search and is_search_index_enabled(db):
+            search_results = build_search_subquery(db, search)
+
+        if search_results is not None:
+            query = query.join(
+                search_results, search_results.c.course_id == Course.id)
+        elif search:
             search_term = f"%{search.lower()}%"
             query = query.filter(
                 or_(
@@ -133,18 +296,23 @@ def get_filtered_courses_query(
                 )
             )
 
-        # Сортировка
-        sort_column = getattr(Course, sort_by, Course.created_at)
-        if sort_order.lower() == "asc":
-            query = query.order_by(asc(sort_column))
+        # Сортировка, ID курса разрешает равенство значений для стабильных страниц
+        if sort_by == "relevance" and search_results is not None:
+            # Меньший rank соответствует более релевантному курсу
+            sort_column = search_results.c.rank
+            descending = False
         else:
-            query = query.order_by(desc(sort_column))
+            sort_column = getattr(Course, sort_by) \
+                if sort_by in Course.__table__.c else Course.created_at
+            descending = sort_order.lower() != "asc"
+
+        query = query.order_by(*keyset_order(sort_column, Course.id, descending))
 
-        return query
+        return query, sort_column, descending
 
     except SQLAlchemyError as e:
-        print(f"Database error in get_filtered_courses_query: {str(e)}")
-        return db.query(Course).filter(Course.id == -1)
+        print(f"Database error in build_filtered_courses_query: {str(e)}")
+        return db.query(Course).filter(Course.id == -1), Course.id, True
 
 
 def get_paginated_courses(
@@ -204,9 +372,126 @@ def get_paginated_courses(
         return [], 0, 0
 
 
-def is_enrolled(db: Session, user_id: int, course_id: int) -> bool:
+def get_courses_by_cursor(
+    db: Session,
+    cursor: Optional[str] = None,
+    size: int = 10,
+    sort_by: str = "created_at",
+    sort_order: str = "desc",
+    include_total: bool = False,
+    **filter_params
+) -> Tuple[List[Course], Optional[str], Optional[int]]:
+    """
+    Получает страницу курсов по курсору (поиск по ключу вместо OFFSET)
+
+    Args:
+        db: Сессия базы данных
+        cursor: Курсор из предыдущего ответа, пустой для первой страницы
+        size: Размер страницы
+        sort_by: Поле для сортировки результатов
+        sort_order: Порядок сортировки ('asc' или 'desc')
+        include_total: Вернуть общее количество курсов (кэшируется на COURSE_COUNT_CACHE_TTL)
+        **filter_params: Параметры фильтрации, передаваемые в build_filtered_courses_query
+
+    Returns:
+        Tuple из трех элементов:
+        - Список объектов курсов
+        - Курсор следующей страницы или None
+        - Общее количество курсов или None, если не запрошено
+    """
+    try:
+        size = max(1, min(100, size))
+
+        query, sort_column, descending = build_filtered_courses_query(
+            db,
+            sort_by=sort_by,
+            sort_order=sort_order,
+            **filter_params
+        )
+
+        scope = f"courses:{sort_by}:{'desc' if descending else 'asc'}"
+        courses, next_cursor = fetch_keyset_page(
+            query, sort_column, Course.id, descending, size, cursor, scope)
+
+        total = None
+        if include_total:
+            total = count_cache.get_count(
+                make_cache_key("courses", **filter_params), query)
+
+        return courses, next_cursor, total
+
+    except SQLAlchemyError as e:
+        # Логирование ошибки
+        print(f"Database error in get_courses_by_cursor: {str(e)}")
+        return [], None, None
+
+
+def get_enrolled_course_ids(db: Session, user_id: int, exclude: Optional[int] = None) -> List[int]:
+    """
+    Получает ID курсов, на которые записан пользователь
+
+    Args:
+        db: Сессия базы данных
+        user_id: ID пользователя
+        exclude: ID курса, который не нужно включать в результат
+
+    Returns:
+        Список ID курсов
+    """
+    query = db.query(CourseEnrollment.course_id).filter(CourseEnrollment.user_id == user_id)
+    if exclude is not None:
+        query = query.filter(CourseEnrollment.course_id != exclude)
+    return [row[0] for row in query.all()]
+
+
+def _dialect_insert(db: Session):
+    """insert() с поддержкой ON CONFLICT для диалекта сессии"""
+    return postgresql_insert if db.get_bind().dialect.name == "postgresql" else sqlite_insert
+
+
+def insert_enrollments(db: Session, pairs: List[Tuple[int, int]]) -> List[CourseEnrollment]:
+    """
+    Вставляет записи на курсы одним INSERT ... ON CONFLICT DO NOTHING.
+    Пары, уже записанные ранее, пропускаются уникальным индексом
+    (user_id, course_id) без ошибки, в том числе при одновременных запросах.
+    Счетчики студентов увеличиваются только для вставленных записей.
+    Коммит выполняет вызывающая сторона.
+
+    Args:
+        db: Сессия базы данных
+        pairs: Пары (user_id, course_id)
+
+    Returns:
+        Вставленные записи
     """
-    Проверяет, записан ли пользователь на курс
+    if not pairs:
+        return []
+    now = datetime.now(timezone.utc)
+    statement = _dialect_insert(db)(CourseEnrollment).values([
+        {
+            "user_id": user_id, "course_id": course_id, "progress": 0.0, "completed": False,
+            "enrolled_at": now, "last_accessed_at": now,
+        }
+        for user_id, course_id in pairs
+    ]).on_conflict_do_nothing(
+        index_elements=[CourseEnrollment.user_id, CourseEnrollment.course_id]
+    ).returning(CourseEnrollment)
+    inserted = list(db.scalars(statement))
+
+    added: Dict[int, int] = {}
+    for enrollment in inserted:
+        added[enrollment.course_id] = added.get(enrollment.course_id, 0) + 1
+    if added:
+        db.query(Course).filter(Course.id.in_(list(added))).update(
+            {Course.students_count: Course.students_count + case(added, value=Course.id, else_=0)},
+            synchronize_session=False
+        )
+    return inserted
+
+
+def upsert_enrollment(db: Session, user_id: int, course_id: int) -> Tuple[Optional[CourseEnrollment], Optional[bool]]:
+    """
+    Записывает пользователя на курс, если он еще не записан
 
     Args:
         db: Сессия базы данных
@@ -214,25 +499,31 @@ def is_enrolled(db: Session, user_id: int, course_id: int) -> bool:
         course_id: ID курса
 
     Returns:
-        True если пользователь записан на курс, иначе False
+        (запись, True) для новой записи, (None, False) если пользователь уже
+        записан, (None, None) в случае ошибки
     """
     try:
-        enrollment = db.query(CourseEnrollment).filter(
-            CourseEnrollment.user_id == user_id,
-            CourseEnrollment.course_id == course_id
-        ).first()
+        inserted = insert_enrollments(db, [(user_id, course_id)])
+        db.commit()
+        if not inserted:
+            return None, False
 
-        return enrollment is not None
+        # Обновляем совместные записи в индексе рекомендаций
+        recommendation_engine.record_enrollment(
+            course_id, get_enrolled_course_ids(db, user_id, exclude=course_id))
+        return inserted[0], True
 
     except SQLAlchemyError as e:
-        # Логирование ошибки
-        print(f"Database error in is_enrolled: {str(e)}")
-        return False
+        # Логирование ошибки и откат транзакции
+        print(f"Database error in upsert_enrollment: {str(e)}")
+        db.rollback()
+        return None, None
 
 
 def enroll_user_to_course(db: Session, user_id: int, course_id: int) -> Optional[CourseEnrollment]:
     """
-    Записывает пользователя на курс
+    Записывает пользователя на курс. Если пользователь уже записан,
+    обновляет время последнего доступа к курсу
 
     Args:
         db: Сессия базы данных
@@ -242,40 +533,129 @@ def enroll_user_to_course(db: Session, user_id: int, course_id: int) -> Optional
     Returns:
         Объект записи на курс или None в случае ошибки
     """
+    enrollment, created = upsert_enrollment(db, user_id, course_id)
+    if created is not False:
+        return enrollment
+
     try:
-        # Проверяем, что пользователь еще не записан на курс
-        existing_enrollment = db.query(CourseEnrollment).filter(
+        enrollment = db.query(CourseEnrollment).filter(
             CourseEnrollment.user_id == user_id,
             CourseEnrollment.course_id == course_id
         ).first()
-
-        if existing_enrollment:
-            # Обновляем время последнего доступа
-            existing_enrollment.last_accessed_at = datetime.now(timezone.utc)
+        if enrollment:
+            enrollment.last_accessed_at = datetime.now(timezone.utc)
             db.commit()
-            return existing_enrollment
-
-        # Создаем новую запись
-        new_enrollment = CourseEnrollment(
-            user_id=user_id,
-            course_id=course_id,
-            progress=0.0,
-            completed=False,
-            enrolled_at=datetime.now(timezone.utc),
-            last_accessed_at=datetime.now(timezone.utc)
+        return enrollment
+
+    except SQLAlchemyError as e:
+        # Логирование ошибки и откат транзакции
+        print(f"Database error in enroll_user_to_course: {str(e)}")
+        db.rollback()
+        return None
+
+
+def unenroll_user_from_course(db: Session, enrollment: CourseEnrollment) -> bool:
+    """
+    Отменяет запись пользователя на курс и уменьшает счетчик студентов
+
+    Args:
+        db: Сессия базы данных
+        enrollment: Объект записи на курс
+
+    Returns:
+        True если отмена записи успешна, иначе False
+    """
+    try:
+        course_id = enrollment.course_id
+        user_id = enrollment.user_id
+        db.query(LessonCompletion).filter(
+            LessonCompletion.enrollment_id == enrollment.id
+        ).delete(synchronize_session=False)
+        db.delete(enrollment)
+
+        db.query(Course).filter(
+            Course.id == course_id,
+            Course.students_count > 0
+        ).update(
+            {Course.students_count: Course.students_count - 1},
+            synchronize_session=False
         )
 
-        db.add(new_enrollment)
         db.commit()
-        db.refresh(new_enrollment)
 
-        return new_enrollment
+        recommendation_engine.record_unenrollment(
+            course_id, get_enrolled_course_ids(db, user_id, exclude=course_id))
+        return True
 
     except SQLAlchemyError as e:
         # Логирование ошибки и откат транзакции
-        print(f"Database error in enroll_user_to_course: {str(e)}")
+        print(f"Database error in unenroll_user_from_course: {str(e)}")
         db.rollback()
-        return None
+        return False
+
+
+def release_user_enrollments(db: Session, user_id: int) -> None:
+    """
+    Уменьшает счетчики студентов для всех курсов пользователя и удаляет
+    отметки пройденных уроков. Вызывается перед удалением пользователя
+    в той же транзакции, коммит выполняет вызывающая сторона.
+
+    Args:
+        db: Сессия базы данных
+        user_id: ID пользователя
+    """
+    enrolled_course_ids = db.query(CourseEnrollment.course_id).filter(
+        CourseEnrollment.user_id == user_id
+    )
+
+    db.query(Course).filter(
+        Course.id.in_(enrolled_course_ids.scalar_subquery()),
+        Course.students_count > 0
+    ).update(
+        {Course.students_count: Course.students_count - 1},
+        synchronize_session=False
+    )
+
+    enrollment_ids = db.query(CourseEnrollment.id).filter(
+        CourseEnrollment.user_id == user_id
+    )
+    db.query(LessonCompletion).filter(
+        LessonCompletion.enrollment_id.in_(enrollment_ids.scalar_subquery())
+    ).delete(synchronize_session=False)
+
+
+def reconcile_students_count(db: Session) -> int:
+    """
+    Пересчитывает счетчики студентов по фактическим записям на курсы
+
+    Args:
+        db: Сессия базы данных
+
+    Returns:
+        Количество курсов, у которых счетчик был исправлен
+    """
+    try:
+        actual_count = db.query(
+            func.count(CourseEnrollment.id)
+        ).filter(
+            CourseEnrollment.course_id == Course.id
+        ).scalar_subquery()
+
+        fixed = db.query(Course).filter(
+            Course.students_count != actual_count
+        ).update(
+            {Course.students_count: actual_count},
+            synchronize_session=False
+        )
+
+        db.commit()
+        return fixed
+
+    except SQLAlchemyError as e:
+        # Логирование ошибки и откат транзакции
+        print(f"Database error in reconcile_students_count: {str(e)}")
+        db.rollback()
+        return 0
 
 
 def get_user_enrolled_courses(db: Session, user_id: int,
@@ -310,7 +690,7 @@ def get_user_enrolled_courses(db: Session, user_id: int,
         ).filter(
             CourseEnrollment.user_id == user_id
         ).order_by(
-            desc(CourseEnrollment.last_accessed_at)
+            *keyset_order(CourseEnrollment.last_accessed_at, CourseEnrollment.id, True)
         )
 
         # Подсчет общего количества записей
@@ -330,6 +710,151 @@ def get_user_enrolled_courses(db: Session, user_id: int,
         return [], 0, 0
 
 
+def get_user_enrolled_courses_by_cursor(
+    db: Session,
+    user_id: int,
+    cursor: Optional[str] = None,
+    size: int = 10,
+    include_total: bool = False
+) -> Tuple[List[Course], Optional[str], Optional[int]]:
+    """
+    Получает курсы, на которые записан пользователь, по курсору
+
+    Args:
+        db: Сессия базы данных
+        user_id: ID пользователя
+        cursor: Курсор из предыдущего ответа, пустой для первой страницы
+        size: Размер страницы
+        include_total: Вернуть общее количество курсов
+
+    Returns:
+        Tuple из трех элементов:
+        - Список объектов курсов
+        - Курсор следующей страницы или None
+        - Общее количество курсов или None, если не запрошено
+    """
+    try:
+        size = max(1, min(100, size))
+
+        query = db.query(Course).join(
+            CourseEnrollment,
+            CourseEnrollment.course_id == Course.id
+        ).options(
+            joinedload(Course.categories),
+            contains_eager(Course.enrollments)
+        ).filter(
+            CourseEnrollment.user_id == user_id
+        ).order_by(
+            *keyset_order(CourseEnrollment.last_accessed_at, CourseEnrollment.id, True)
+        )
+
+        courses, next_cursor = fetch_keyset_page(
+            query, CourseEnrollment.last_accessed_at, CourseEnrollment.id,
+            True, size, cursor, "my-courses")
+
+        # Количество записей пользователя дешево считается по индексу, без кэша
+        total = query.order_by(None).count() if include_total else None
+
+        return courses, next_cursor, total
+
+    except SQLAlchemyError as e:
+        print(f"Database error in get_user_enrolled_courses_by_cursor: {str(e)}")
+        return [], None, None
+
+
+def get_author_courses(db: Session, author: str,
+                       page: int = 1, size: int = 10) -> Tuple[List[Course], int, int]:
+    """
+    Получает список курсов автора с пагинацией
+
+    Args:
+        db: Сессия базы данных
+        author: Имя пользователя автора
+        page: Номер страницы
+        size: Размер страницы
+
+    Returns:
+        Tuple из трех элементов:
+        - Список объектов курсов
+        - Общее количество курсов
+        - Общее количество страниц
+    """
+    try:
+        page = max(1, page)
+        size = max(1, min(100, size))
+
+        # Получаем курсы, где автор - указанный пользователь
+        query = db.query(Course).filter(
+            Course.author == author
+        ).options(
+            joinedload(Course.categories)
+        ).order_by(
+            *keyset_order(Course.created_at, Course.id, True)
+        )
+
+        # Подсчет общего количества записей
+        total = query.count()
+
+        # Применение пагинации
+        courses = query.offset((page - 1) * size).limit(size).all()
+
+        # Расчет общего количества страниц
+        pages = (total + size - 1) // size if total > 0 else 0
+
+        return courses, total, pages
+
+    except SQLAlchemyError as e:
+        # Логирование ошибки
+        print(f"Database error in get_author_courses: {str(e)}")
+        return [], 0, 0
+
+
+def get_author_courses_by_cursor(
+    db: Session,
+    author: str,
+    cursor: Optional[str] = None,
+    size: int = 10,
+    include_total: bool = False
+) -> Tuple[List[Course], Optional[str], Optional[int]]:
+    """
+    Получает курсы автора по курсору
+
+    Args:
+        db: Сессия базы данных
+        author: Имя пользователя автора
+        cursor: Курсор из предыдущего ответа, пустой для первой страницы
+        size: Размер страницы
+        include_total: Вернуть общее количество курсов
+
+    Returns:
+        Tuple из трех элементов:
+        - Список объектов курсов
+        - Курсор следующей страницы или None
+        - Общее количество курсов или None, если не запрошено
+    """
+    try:
+        size = max(1, min(100, size))
+
+        query = db.query(Course).filter(
+            Course.author == author
+        ).options(
+            joinedload(Course.categories)
+        ).order_by(
+            *keyset_order(Course.created_at, Course.id, True)
+        )
+
+        courses, next_cursor = fetch_keyset_page(
+            query, Course.created_at, Course.id, True, size, cursor, "created-by-me")
+
+        total = query.order_by(None).count() if include_total else None
+
+        return courses, next_cursor, total
+
+    except SQLAlchemyError as e:
+        print(f"Database error in get_author_courses_by_cursor: {str(e)}")
+        return [], None, None
+
+
 def get_user_course_progress(db: Session, user_id: int, course_id: int) -> Optional[Dict[str, Any]]:
     """
     Получает информацию о прогрессе пользователя на конкретном курсе
@@ -351,10 +876,16 @@ def get_user_course_progress(db: Session, user_id: int, course_id: int) -> Optio
         if not enrollment:
             return None
 
+        completed_lesson_ids = [row[0] for row in db.query(LessonCompletion.lesson_id).filter(
+            LessonCompletion.enrollment_id == enrollment.id
+        ).all()] if enrollment.completed_lessons else []
+
         return {
             "enrollment_id": enrollment.id,
             "progress": enrollment.progress,
             "completed": enrollment.completed,
+            "completed_lessons": enrollment.completed_lessons,
+            "completed_lesson_ids": completed_lesson_ids,
             "enrolled_at": enrollment.enrolled_at,
             "last_accessed_at": enrollment.last_accessed_at
         }
@@ -411,36 +942,140 @@ def update_course_progress(db: Session, user_id: int, course_id: int, progress:
         return False
 
 
-def update_course_access_time(db: Session, user_id: int, course_id: int) -> bool:
+def _progress_values(completed_lessons, lessons_count) -> Dict:
     """
-    Обновляет время последнего доступа к курсу
+    Значения колонок записи на курс по числу пройденных уроков.
+    Аргументы - SQL-выражения, в UPDATE они вычисляются по старым значениям строки
+    """
+    return {
+        CourseEnrollment.completed_lessons: completed_lessons,
+        CourseEnrollment.progress: case(
+            (lessons_count <= 0, 0.0),
+            (completed_lessons >= lessons_count, 100.0),
+            else_=completed_lessons * 100.0 / lessons_count
+        ),
+        CourseEnrollment.completed: and_(lessons_count > 0, completed_lessons >= lessons_count),
+    }
+
+
+def set_lesson_completed(db: Session, user_id: int, course_id: int, lesson_id: int,
+                         completed: bool = True) -> Optional[CourseEnrollment]:
+    """
+    Отмечает урок пройденным или снимает отметку.
+    Счетчик пройденных уроков, progress и completed обновляются одним UPDATE
+    строки записи в той же транзакции, курс повторно не обходится
 
     Args:
         db: Сессия базы данных
         user_id: ID пользователя
         course_id: ID курса
+        lesson_id: ID урока
+        completed: True - отметить урок, False - снять отметку
 
     Returns:
-        True если обновление успешно, иначе False
+        Обновленная запись на курс или None в случае ошибки
     """
-    try:
-        enrollment = db.query(CourseEnrollment).filter(
-            CourseEnrollment.user_id == user_id,
-            CourseEnrollment.course_id == course_id
-        ).first()
+    enrollment = db.query(CourseEnrollment).filter(
+        CourseEnrollment.user_id == user_id,
+        CourseEnrollment.course_id == course_id
+    ).first()
+    if not enrollment:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Вы не записаны на этот курс"
+        )
 
-        if not enrollment:
-            return False
+    lesson = db.query(Lesson.id).filter(
+        Lesson.id == lesson_id,
+        Lesson.course_id == course_id
+    ).first()
+    if not lesson:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Урок с ID {lesson_id} не найден"
+        )
+
+    try:
+        now = datetime.now(timezone.utc)
+        if completed:
+            changed = db.execute(
+                _dialect_insert(db)(LessonCompletion).values(
+                    enrollment_id=enrollment.id, lesson_id=lesson_id, completed_at=now
+                ).on_conflict_do_nothing(
+                    index_elements=[LessonCompletion.enrollment_id, LessonCompletion.lesson_id]
+                ).returning(LessonCompletion.id)
+            ).first() is not None
+            delta = 1
+        else:
+            changed = db.query(LessonCompletion).filter(
+                LessonCompletion.enrollment_id == enrollment.id,
+                LessonCompletion.lesson_id == lesson_id
+            ).delete(synchronize_session=False) > 0
+            delta = -1
+
+        # Повторная отметка ничего не меняет
+        if not changed:
+            return enrollment
+
+        lessons_count = select(Course.lessons_count).where(
+            Course.id == CourseEnrollment.course_id
+        ).scalar_subquery()
+        values = _progress_values(CourseEnrollment.completed_lessons + delta, lessons_count)
+        values[CourseEnrollment.last_accessed_at] = now
+        db.query(CourseEnrollment).filter(
+            CourseEnrollment.id == enrollment.id
+        ).update(values, synchronize_session=False)
 
-        enrollment.last_accessed_at = datetime.now(timezone.utc)
         db.commit()
-        return True
+        db.refresh(enrollment)
+        return enrollment
 
     except SQLAlchemyError as e:
         # Логирование ошибки и откат транзакции
-        print(f"Database error in update_course_access_time: {str(e)}")
+        print(f"Database error in set_lesson_completed: {str(e)}")
         db.rollback()
-        return False
+        return None
+
+
+def refresh_course_progress(db: Session, course_id: int, lessons_count: int,
+                            removed_lesson_id: Optional[int] = None) -> None:
+    """
+    Пересчитывает progress и completed записей курса после изменения числа
+    уроков одним UPDATE. Затрагиваются только записи с отмеченными уроками,
+    прогресс остальных записей не меняется.
+    Для удаленного урока снимаются его отметки и уменьшаются счетчики
+    пройденных уроков. Коммит выполняет вызывающая сторона.
+
+    Args:
+        db: Сессия базы данных
+        course_id: ID курса
+        lessons_count: Новое количество уроков курса
+        removed_lesson_id: ID удаленного урока
+    """
+    affected = CourseEnrollment.completed_lessons > 0
+    completed_lessons = CourseEnrollment.completed_lessons
+
+    if removed_lesson_id is not None:
+        completed_by = db.query(LessonCompletion.enrollment_id).filter(
+            LessonCompletion.lesson_id == removed_lesson_id
+        ).scalar_subquery()
+        # Запись могла пройти только удаленный урок, ее прогресс тоже пересчитывается
+        affected = or_(affected, CourseEnrollment.id.in_(completed_by))
+        completed_lessons = completed_lessons - case(
+            (CourseEnrollment.id.in_(completed_by), 1), else_=0)
+
+    db.query(CourseEnrollment).filter(
+        CourseEnrollment.course_id == course_id,
+        affected
+    ).update(
+        _progress_values(completed_lessons, literal(lessons_count)),
+        synchronize_session=False
+    )
+
+    if removed_lesson_id is not None:
+        db.query(LessonCompletion).filter(
+            LessonCompletion.lesson_id == removed_lesson_id
+        ).delete(synchronize_session=False)
 
 
 def get_popular_courses(db: Session, limit: int = 5) -> List[Course]:
@@ -458,18 +1093,11 @@ def get_popular_courses(db: Session, limit: int = 5) -> List[Course]:
         # Ограничение значения limit для предотвращения перегрузки
         limit = max(1, min(50, limit))
 
-        # Подсчитываем количество записей на каждый курс
-        subquery = db.query(
-            CourseEnrollment.course_id,
-            func.count(CourseEnrollment.id).label('enrollments_count')
-        ).group_by(CourseEnrollment.course_id).subquery()
-
-        # Присоединяем подзапрос к основному запросу и сортируем по количеству записей
-        query = db.query(Course).options(joinedload(Course.categories)).join(
-            subquery,
-            Course.id == subquery.c.course_id
+        # Сортируем по денормализованному счетчику записей
+        query = db.query(Course).options(joinedload(Course.categories)).filter(
+            Course.students_count > 0
         ).order_by(
-            desc(subquery.c.enrollments_count)
+            desc(Course.students_count)
         ).limit(limit)
 
         return query.all()
@@ -509,7 +1137,11 @@ def get_recent_courses(db: Session, limit: int = 5) -> List[Course]:
 
 def get_recommended_courses(db: Session, user_id: int, limit: int = 5) -> List[Course]:
     """
-    Получает рекомендованные курсы для пользователя на основе его интересов
+    Получает рекомендованные курсы для пользователя
+
+    Курсы ранжируются по индексу похожих курсов, построенному по совместным
+    записям студентов (см. app.utils.recommendations). Пока у пользователя мало
+    записей, к оценке примешивается близость по категориям его курсов.
 
     Args:
         db: Сессия базы данных
@@ -520,45 +1152,30 @@ def get_recommended_courses(db: Session, user_id: int, limit: int = 5) -> List[C
         Список рекомендованных курсов
     """
     try:
-        # Получаем категории курсов, на которые уже записан пользователь
-        enrolled_categories = db.query(Category.id).join(
-            course_categories
-        ).join(
-            Course
-        ).join(
-            CourseEnrollment
-        ).filter(
-            CourseEnrollment.user_id == user_id
-        ).distinct().all()
-
-        # Получаем IDs категорий
-        category_ids = [cat[0] for cat in enrolled_categories]
-
-        if not category_ids:
-            # Если нет записей на курсы, возвращаем популярные курсы
-            return get_popular_courses(db, limit)
+        # Ограничение значения limit для предотвращения перегрузки
+        limit = max(1, min(50, limit))
 
-        # Получаем курсы из тех же категорий, на которые пользователь не записан
-        enrolled_course_ids = db.query(CourseEnrollment.course_id).filter(
-            CourseEnrollment.user_id == user_id
-        ).all()
+        # Перестройка устаревшего индекса идет в фоне, запрос ее не ждет
+        recommendation_engine.refresh_if_stale()
+        enrolled_ids = get_enrolled_course_ids(db, user_id)
+        course_ids = recommendation_engine.recommend(enrolled_ids, limit)
 
-        # Получаем IDs курсов
-        enrolled_ids = [c[0] for c in enrolled_course_ids]
+        if not course_ids:
+            # Индекс еще не построен или нечего рекомендовать: популярные курсы,
+            # на которые пользователь не записан
+            enrolled = set(enrolled_ids)
+            popular = get_popular_courses(db, limit + len(enrolled))
+            return [course for course in popular if course.id not in enrolled][:limit]
 
-        # Запрос на рекомендованные курсы
-        query = db.query(Course).join(
-            course_categories
-        ).filter(
-            course_categories.c.category_id.in_(category_ids),
-            ~Course.id.in_(enrolled_ids) if enrolled_ids else True
-        ).options(
+        courses = db.query(Course).options(
             joinedload(Course.categories)
-        ).order_by(
-            desc(Course.created_at)
-        ).limit(limit)
+        ).filter(
+            Course.id.in_(course_ids)
+        ).all()
 
-        return query.all()
+        # Сохраняем порядок, в котором курсы ранжированы индексом
+        by_id = {course.id: course for course in courses}
+        return [by_id[course_id] for course_id in course_ids if course_id in by_id]
 
     except SQLAlchemyError as e:
         # Логирование ошибки
@@ -590,31 +1207,269 @@ def check_course_owner(course: Course, user) -> bool:
     return True
 
 
-def reorder_lessons(db: Session, course_id: int) -> bool:
+def reorder_lessons(db: Session, course_id: int) -> None:
+    """
+    Нумерует уроки курса подряд с 1 с сохранением текущего порядка.
+    Читает только ID уроков и обновляет их одним UPDATE,
+    коммит выполняет вызывающая сторона.
+
+    Args:
+        db: Сессия базы данных
+        course_id: ID курса
+    """
+    lesson_ids = [row[0] for row in db.query(Lesson.id).filter(
+        Lesson.course_id == course_id
+    ).order_by(Lesson.order, Lesson.id).all()]
+    update_lesson_positions(db, course_id, lesson_ids)
+
+
+def update_lesson_positions(db: Session, course_id: int, lesson_ids: List[int]) -> None:
+    """Присваивает урокам позиции по порядку списка одним UPDATE"""
+    if not lesson_ids:
+        return
+    positions = {lesson_id: idx + 1 for idx, lesson_id in enumerate(lesson_ids)}
+    db.query(Lesson).filter(Lesson.course_id == course_id).update(
+        {Lesson.order: case(positions, value=Lesson.id)},
+        synchronize_session=False
+    )
+
+
+def ensure_sequential_lesson_order(db: Session, course_id: int) -> int:
     """
-    Переупорядочивает уроки курса после удаления или изменения порядка
+    Проверяет, что уроки курса пронумерованы подряд с 1, и при необходимости
+    перенумеровывает их. Коммит выполняет вызывающая сторона.
 
     Args:
         db: Сессия базы данных
         course_id: ID курса
 
     Returns:
-        True, если операция выполнена успешно
+        Количество уроков в курсе
     """
-    try:
-        lessons = db.query(Lesson).filter(
-            Lesson.course_id == course_id
-        ).order_by(Lesson.order).all()
+    total, distinct_orders, min_order, max_order = db.query(
+        func.count(Lesson.id),
+        func.count(func.distinct(Lesson.order)),
+        func.min(Lesson.order),
+        func.max(Lesson.order)
+    ).filter(Lesson.course_id == course_id).one()
 
-        # Обновляем порядок уроков, чтобы он был последовательным
-        for idx, lesson in enumerate(lessons):
-            lesson.order = idx + 1
+    if total and (distinct_orders != total or min_order != 1 or max_order != total):
+        reorder_lessons(db, course_id)
+    return total
 
-        db.commit()
-        return True
 
-    except SQLAlchemyError as e:
-        # Логирование ошибки и откат транзакции
-        print(f"Database error in reorder_lessons: {str(e)}")
-        db.rollback()
-        return False
+def shift_lessons(db: Session, course_id: int, start: int, end: Optional[int], delta: int) -> None:
+    """
+    Сдвигает порядок уроков курса с позициями в диапазоне [start, end] на delta
+    одним UPDATE. end=None означает до конца курса.
+    """
+    query = db.query(Lesson).filter(
+        Lesson.course_id == course_id,
+        Lesson.order >= start
+    )
+    if end is not None:
+        query = query.filter(Lesson.order <= end)
+    query.update({Lesson.order: Lesson.order + delta}, synchronize_session=False)
+
+
+def move_lesson(db: Session, course_id: int, lesson: Lesson, new_order: int) -> int:
+    """
+    Перемещает урок на новую позицию, сдвигая уроки между старой и новой
+    позицией одним UPDATE. Коммит выполняет вызывающая сторона.
+
+    Args:
+        db: Сессия базы данных
+        course_id: ID курса
+        lesson: Перемещаемый урок
+        new_order: Новая позиция (ограничивается диапазоном 1..число уроков)
+
+    Returns:
+        Итоговая позиция урока
+    """
+    total = ensure_sequential_lesson_order(db, course_id)
+    db.refresh(lesson, ["order"])
+    old_order = lesson.order
+    new_order = max(1, min(total, new_order))
+
+    if new_order != old_order:
+        # Сдвиг соседей и установка позиции урока в одном выражении
+        if new_order < old_order:
+            low, high = new_order, old_order
+            shifted = Lesson.order + 1
+        else:
+            low, high = old_order, new_order
+            shifted = Lesson.order - 1
+
+        db.query(Lesson).filter(
+            Lesson.course_id == course_id,
+            Lesson.order >= low,
+            Lesson.order <= high
+        ).update(
+            {Lesson.order: case((Lesson.id == lesson.id, new_order), else_=shifted)},
+            synchronize_session=False
+        )
+        db.expire(lesson, ["order"])
+
+    return new_order
+
+
+def set_lesson_order(db: Session, course_id: int, lesson_ids: List[int]) -> None:
+    """
+    Устанавливает полный порядок уроков курса одним UPDATE.
+    Коммит выполняет вызывающая сторона.
+
+    Args:
+        db: Сессия базы данных
+        course_id: ID курса
+        lesson_ids: ID всех уроков курса в новом порядке
+
+    Raises:
+        HTTPException: Если список не совпадает с уроками курса
+    """
+    current_ids = {row[0] for row in db.query(Lesson.id).filter(Lesson.course_id == course_id).all()}
+    if len(lesson_ids) != len(set(lesson_ids)) or set(lesson_ids) != current_ids:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Список уроков должен содержать каждый урок курса ровно один раз"
+        )
+    update_lesson_positions(db, course_id, lesson_ids)
+
+
+def get_lesson_positions(db: Session, course_id: int) -> List[Dict[str, int]]:
+    """
+    Получает порядок уроков курса без загрузки их содержимого
+
+    Args:
+        db: Сессия базы данных
+        course_id: ID курса
+
+    Returns:
+        Список словарей с ID урока и его позицией
+    """
+    rows = db.query(Lesson.id, Lesson.order).filter(
+        Lesson.course_id == course_id
+    ).order_by(Lesson.order, Lesson.id).all()
+    return [{"id": lesson_id, "order": order} for lesson_id, order in rows]
+
+
+# Асинхронные варианты для AsyncSession. Синхронная логика выполняется через
+# run_sync поверх асинхронного драйвера и не блокирует цикл событий.
+
+async def get_course_by_id_async(db: AsyncSession, course_id: int) -> Course:
+    """Асинхронный вариант get_course_by_id"""
+    return await db.run_sync(get_course_by_id, course_id)
+
+
+async def get_course_with_lessons_by_id_async(db: AsyncSession, course_id: int) -> Course:
+    """Асинхронный вариант get_course_with_lessons_by_id"""
+    return await db.run_sync(get_course_with_lessons_by_id, course_id)
+
+
+async def get_lesson_summaries_async(db: AsyncSession, course_id: int) -> List[Dict[str, Any]]:
+    """Асинхронный вариант get_lesson_summaries"""
+    return await db.run_sync(get_lesson_summaries, course_id)
+
+
+async def get_lesson_stored_field_async(db: AsyncSession, course_id: int, lesson_id: int,
+                                        field: str) -> Optional[bytes]:
+    """Асинхронный вариант get_lesson_stored_field"""
+    return await db.run_sync(get_lesson_stored_field, course_id, lesson_id, field)
+
+
+async def get_lesson_by_id_async(db: AsyncSession, course_id: int, lesson_id: int) -> Lesson:
+    """Асинхронный вариант get_lesson_by_id"""
+    return await db.run_sync(get_lesson_by_id, course_id, lesson_id)
+
+
+async def get_paginated_courses_async(db: AsyncSession, *args, **kwargs) -> Tuple[List[Course], int, int]:
+    """Асинхронный вариант get_paginated_courses"""
+    return await db.run_sync(get_paginated_courses, *args, **kwargs)
+
+
+async def get_courses_by_cursor_async(db: AsyncSession, **kwargs) -> Tuple[List[Course], Optional[str], Optional[int]]:
+    """Асинхронный вариант get_courses_by_cursor"""
+    return await db.run_sync(get_courses_by_cursor, **kwargs)
+
+
+async def enroll_user_to_course_async(db: AsyncSession, user_id: int, course_id: int) -> Optional[CourseEnrollment]:
+    """Асинхронный вариант enroll_user_to_course"""
+    return await db.run_sync(enroll_user_to_course, user_id, course_id)
+
+
+async def upsert_enrollment_async(db: AsyncSession, user_id: int,
+                                  course_id: int) -> Tuple[Optional[CourseEnrollment], Optional[bool]]:
+    """Асинхронный вариант upsert_enrollment"""
+    return await db.run_sync(upsert_enrollment, user_id, course_id)
+
+
+async def unenroll_user_from_course_async(db: AsyncSession, enrollment: CourseEnrollment) -> bool:
+    """Асинхронный вариант unenroll_user_from_course"""
+    return await db.run_sync(unenroll_user_from_course, enrollment)
+
+
+async def release_user_enrollments_async(db: AsyncSession, user_id: int) -> None:
+    """Асинхронный вариант release_user_enrollments"""
+    await db.run_sync(release_user_enrollments, user_id)
+
+
+async def get_user_enrolled_courses_async(db: AsyncSession, user_id: int,
+                                          page: int = 1, size: int = 10) -> Tuple[List[Course], int, int]:
+    """Асинхронный вариант get_user_enrolled_courses"""
+    return await db.run_sync(get_user_enrolled_courses, user_id, page, size)
+
+
+async def get_user_enrolled_courses_by_cursor_async(
+        db: AsyncSession, user_id: int, cursor: Optional[str] = None, size: int = 10,
+        include_total: bool = False) -> Tuple[List[Course], Optional[str], Optional[int]]:
+    """Асинхронный вариант get_user_enrolled_courses_by_cursor"""
+    return await db.run_sync(get_user_enrolled_courses_by_cursor, user_id, cursor, size, include_total)
+
+
+async def get_author_courses_async(db: AsyncSession, author: str,
+                                   page: int = 1, size: int = 10) -> Tuple[List[Course], int, int]:
+    """Асинхронный вариант get_author_courses"""
+    return await db.run_sync(get_author_courses, author, page, size)
+
+
+async def get_author_courses_by_cursor_async(
+        db: AsyncSession, author: str, cursor: Optional[str] = None, size: int = 10,
+        include_total: bool = False) -> Tuple[List[Course], Optional[str], Optional[int]]:
+    """Асинхронный вариант get_author_courses_by_cursor"""
+    return await db.run_sync(get_author_courses_by_cursor, author, cursor, size, include_total)
+
+
+async def get_user_course_progress_async(db: AsyncSession, user_id: int, course_id: int) -> Optional[Dict[str, Any]]:
+    """Асинхронный вариант get_user_course_progress"""
+    return await db.run_sync(get_user_course_progress, user_id, course_id)
+
+
+async def update_course_progress_async(db: AsyncSession, user_id: int, course_id: int, progress: float,
+                                       completed: Optional[bool] = None) -> bool:
+    """Асинхронный вариант update_course_progress"""
+    return await db.run_sync(update_course_progress, user_id, course_id, progress, completed)
+
+
+async def set_lesson_completed_async(db: AsyncSession, user_id: int, course_id: int, lesson_id: int,
+                                     completed: bool = True) -> Optional[CourseEnrollment]:
+    """Асинхронный вариант set_lesson_completed"""
+    return await db.run_sync(set_lesson_completed, user_id, course_id, lesson_id, completed)
+
+
+async def get_popular_courses_async(db: AsyncSession, limit: int = 5) -> List[Course]:
+    """Асинхронный вариант get_popular_courses"""
+    return await db.run_sync(get_popular_courses, limit)
+
+
+async def get_recent_courses_async(db: AsyncSession, limit: int = 5) -> List[Course]:
+    """Асинхронный вариант get_recent_courses"""
+    return await db.run_sync(get_recent_courses, limit)
+
+
+async def get_recommended_courses_async(db: AsyncSession, user_id: int, limit: int = 5) -> List[Course]:
+    """Асинхронный вариант get_recommended_courses"""
+    return await db.run_sync(get_recommended_courses, user_id, limit)
+
+
+async def reorder_lessons_async(db: AsyncSession, course_id: int) -> None:
+    """Асинхронный вариант reorder_lessons"""
+    return await db.run_sync(reorder_lessons, course_id)
@@ -1,20 +1,35 @@
 """
 File and folder operations
 """
-from fastapi import HTTPException, UploadFile
-from sqlalchemy.orm import Session
+from fastapi import HTTPException
+from sqlalchemy import select, literal
+from sqlalchemy.orm import Session, aliased
 from datetime import datetime, timezone
 from pathlib import Path
 import shutil
-from PIL import Image
-from fastapi.responses import FileResponse
-import os
+from starlette.datastructures import Headers
 
 from app.core.models import User, UserFile
-from app.core.schemas import FolderSchema, FileSchema
-from app.core.config import BASE_FOLDER_DIR, THUMBNAIL_DIR, BASE_URL
+from app.core.schemas import FolderSchema, FileSchema, FileTree, FileTreeNode
+from app.core.config import BASE_FOLDER_DIR, THUMBNAIL_DIR, BASE_URL, DOWNLOAD_CACHE_CONTROL
+from app.utils.thumbnails import thumbnail_cache
+from app.utils.uploads import StagedUpload
+from app.utils.http_cache import RangeFileResponse, conditional_response
+from app.utils.blobs import (
+    BLOB_THUMBNAIL_NAMESPACE, blob_path,
+    acquire_blob, adopt_blob, release_blobs, remove_released_blobs
+)
+from collections import defaultdict
+from dataclasses import dataclass, field
 from typing import List, Optional
 
+# Guards the recursive tree query against parent_id cycles
+TREE_DEPTH_LIMIT = 256
+
+# Database work runs on the event loop thread through AsyncSession.run_sync, so
+# functions below either query the database or touch the filesystem; routes
+# run the filesystem part in a worker thread
+
 # Создаем директории, если они не существуют
 Path(BASE_FOLDER_DIR).mkdir(parents=True, exist_ok=True)
 Path(THUMBNAIL_DIR).mkdir(parents=True, exist_ok=True)
@@ -83,42 +98,76 @@ def create_folder(db: Session, user: User, folder_name: str, parent_id: Optional
         updated_at=datetime.now(timezone.utc)
     )
 
+    # Folders exist only as metadata, file contents live in the blob store
     db.add(new_folder)
     db.commit()
     db.refresh(new_folder)
 
-    # Create folder on disk
-    absolute_path = get_absolute_path(user, relative_path)
-    ensure_directory(absolute_path)
-
     return FolderSchema(id=new_folder.id, name=new_folder.filename, parent=new_folder.parent_id)
 
 
-def create_thumbnail(file_path: Path, user_username: str, thumbnail_size=(100, 100)) -> str:
-    """Create thumbnail for image file"""
-    user_thumbnail_dir = ensure_directory(Path(THUMBNAIL_DIR) / user_username)
-    thumbnail_path = user_thumbnail_dir / f"th_{file_path.stem}.webp"
+def get_thumbnail_path(file_path: Path, user_username: str, filename: Optional[str] = None) -> str:
+    """Get thumbnail path for file"""
+    return thumbnail_cache.get_url(file_path, user_username, filename)
+
+
+def get_storage_path(user: User, file: UserFile) -> Path:
+    """Get path of file content: its blob, or the per-user copy of a file uploaded before the blob store"""
+    if file.blob_id is not None:
+        return blob_path(file.checksum)
+    return get_absolute_path(user, file.relative_path)
+
+
+def get_file_thumbnail(user: User, file: UserFile) -> str:
+    """Get thumbnail path for stored file"""
+    if file.blob_id is not None:
+        return get_thumbnail_path(blob_path(file.checksum), BLOB_THUMBNAIL_NAMESPACE, file.filename)
+    return get_thumbnail_path(get_absolute_path(user, file.relative_path), user.username)
+
+
+def to_file_schema(user: User, file: UserFile) -> FileSchema:
+    """Build API schema for stored file"""
+    size = file.size
+    if size is None:
+        size = get_storage_path(user, file).stat().st_size
+    return FileSchema(
+        id=file.id,
+        name=file.filename,
+        url=f"{BASE_URL}/api/files/{file.id}/download",
+        size=size,
+        folder=file.parent_id,
+        thumbnail=get_file_thumbnail(user, file),
+        checksum=file.checksum
+    )
 
-    try:
-        with Image.open(file_path) as img:
-            img.thumbnail(thumbnail_size)
-            img.save(thumbnail_path, "WEBP")
 
-        return f"{BASE_URL}/api/thumbnails/{user_username}/{thumbnail_path.name}"
-    except Exception as e:
-        print(f"Error creating thumbnail: {str(e)}")
-        return f"{BASE_URL}/path/to/default/icon.png"
+def adopt_legacy_file(db: Session, user: User, file: UserFile,
+                      candidates: Optional[List[str]] = None) -> Optional[Path]:
+    """
+    Move a file uploaded before the blob store into it. The legacy copy is
+    kept until the caller commits and then removes the returned path.
+    Candidates are relative paths to look for the legacy copy at.
+    """
+    for relative_path in candidates or [file.relative_path]:
+        legacy_path = get_absolute_path(user, relative_path)
+        if legacy_path.is_file():
+            break
+    else:
+        return None
 
+    blob = adopt_blob(db, legacy_path)
+    file.blob_id = blob.id
+    file.size = blob.size
+    file.checksum = blob.checksum
+    return legacy_path
 
-def get_thumbnail_path(file_path: Path, user_username: str) -> str:
-    """Get thumbnail path for file"""
-    if file_path.suffix.lower() in ['.png', '.jpg', '.jpeg', '.gif', '.bmp']:
-        return create_thumbnail(file_path, user_username)
-    else:
-        return f"{BASE_URL}/path/to/default/icon.png"
 
+def to_file_schemas(user: User, files: List[UserFile]) -> List[FileSchema]:
+    """Build API schemas for files, stats files without a stored size and looks up thumbnails"""
+    return [to_file_schema(user, file) for file in files]
 
-def get_files(db: Session, user: User, folder_id: Optional[int] = None) -> List[FileSchema]:
+
+def get_files(db: Session, user: User, folder_id: Optional[int] = None) -> List[UserFile]:
     """Get list of files for user"""
     query = db.query(UserFile).filter(
         UserFile.user_id == user.id,
@@ -127,73 +176,133 @@ def get_files(db: Session, user: User, folder_id: Optional[int] = None) -> List[
     query = query.filter(UserFile.parent_id ==
                          folder_id if folder_id else UserFile.parent_id == None)
 
-    files = query.all()
-    file_schemas = []
+    return query.all()
 
-    for file in files:
-        absolute_path = get_absolute_path(user, file.relative_path)
-        thumbnail_path = get_thumbnail_path(absolute_path, user.username)
 
-        file_schemas.append(FileSchema(
-            id=file.id,
-            name=file.filename,
-            url=f"{BASE_URL}/api/files/{file.id}/download",
-            size=absolute_path.stat().st_size,
-            folder=file.parent_id,
-            thumbnail=thumbnail_path
-        ))
+def get_tree(db: Session, user: User, root_id: Optional[int] = None,
+             depth: Optional[int] = None, include_files: bool = True) -> FileTree:
+    """
+    Folder hierarchy of user, or of the subtree under root_id, from one
+    recursive query. Folders carry the size and the number of files and
+    folders of their whole subtree, also below the depth limit. Sizes come
+    from the database, files uploaded before sizes were stored count as 0.
+    """
+    columns = (UserFile.id, UserFile.parent_id, UserFile.filename, UserFile.is_folder, UserFile.size)
+    if root_id is None:
+        anchor = select(*columns, literal(1).label("depth")).where(
+            UserFile.user_id == user.id,
+            UserFile.parent_id == None
+        )
+    else:
+        anchor = select(*columns, literal(0).label("depth")).where(
+            UserFile.id == root_id,
+            UserFile.user_id == user.id,
+            UserFile.is_folder == True
+        )
+    tree = anchor.cte("file_tree", recursive=True)
+    child = aliased(UserFile)
+    tree = tree.union_all(
+        select(child.id, child.parent_id, child.filename, child.is_folder, child.size,
+               tree.c.depth + 1).where(
+            child.parent_id == tree.c.id,
+            child.user_id == user.id,
+            tree.c.depth < TREE_DEPTH_LIMIT
+        )
+    )
+    rows = db.execute(select(tree)).all()
+    if root_id is not None and not rows:
+        raise HTTPException(status_code=404, detail="Folder not found")
 
-    return file_schemas
+    # Subtree totals [size, files, folders] are summed bottom-up, deepest rows first
+    deepest_first = sorted(rows, key=lambda row: row.depth, reverse=True)
+    totals = defaultdict(lambda: [0, 0, 0])
+    children = defaultdict(list)
+    for row in deepest_first:
+        if row.id == root_id:
+            continue
+        size, files, folders = totals[row.id]
+        parent = totals[row.parent_id]
+        parent[0] += size if row.is_folder else row.size or 0
+        parent[1] += files + (0 if row.is_folder else 1)
+        parent[2] += folders + (1 if row.is_folder else 0)
+        if include_files or row.is_folder:
+            children[row.parent_id].append(row)
+
+    nodes = {}
+    for row in deepest_first:
+        size, files, folders = totals[row.id]
+        node = FileTreeNode(id=row.id, name=row.filename, is_folder=row.is_folder, parent=row.parent_id,
+                            size=size if row.is_folder else row.size or 0,
+                            file_count=files, folder_count=folders)
+        listed = sorted(children[row.id], key=lambda item: (not item.is_folder, item.filename.lower()))
+        if depth is not None and row.depth >= depth:
+            node.truncated = bool(listed)
+        else:
+            node.children = [nodes[item.id] for item in listed]
+        nodes[row.id] = node
+
+    size, files, folders = totals[root_id]
+    items = nodes[root_id].children if root_id is not None else [
+        nodes[row.id] for row in
+        sorted(children[None], key=lambda item: (not item.is_folder, item.filename.lower()))
+    ]
+    return FileTree(root=root_id, size=size, file_count=files, folder_count=folders, items=items)
 
 
-def upload_file(db: Session, user: User, file: UploadFile, folder_id: Optional[int] = None) -> FileSchema:
-    """Upload new file"""
-    parent = None
-    if folder_id:
-        parent = db.query(UserFile).filter(
-            UserFile.id == folder_id,
+def upload_file(db: Session, user: User, staged: StagedUpload, filename: str,
+                folder_id: Optional[int] = None) -> UserFile:
+    """Register a staged upload, storing its content once per distinct checksum"""
+    try:
+        parent = None
+        if folder_id:
+            parent = db.query(UserFile).filter(
+                UserFile.id == folder_id,
+                UserFile.user_id == user.id,
+                UserFile.is_folder == True
+            ).first()
+            if not parent:
+                raise HTTPException(
+                    status_code=404, detail="Parent folder not found")
+
+        filename = Path(filename or "").name
+        if not filename:
+            raise HTTPException(status_code=400, detail="File name is required")
+
+        existing_file = db.query(UserFile).filter(
             UserFile.user_id == user.id,
-            UserFile.is_folder == True
+            UserFile.parent_id == folder_id if folder_id else UserFile.parent_id == None,
+            UserFile.filename == filename,
+            UserFile.is_folder == False
         ).first()
-        if not parent:
+        if existing_file:
             raise HTTPException(
-                status_code=404, detail="Parent folder not found")
+                status_code=400, detail="A file with this name already exists")
 
-    try:
-        relative_path = file.filename if not parent else str(
-            Path(parent.relative_path) / file.filename)
-        absolute_path = get_absolute_path(user, relative_path)
-
-        # Create user directory if it doesn't exist
-        ensure_directory(absolute_path.parent)
+        relative_path = filename if not parent else str(
+            Path(parent.relative_path) / filename)
 
+        # Duplicate content only adds a reference to the existing blob
+        blob = acquire_blob(db, staged)
         new_file = UserFile(
             user_id=user.id,
-            filename=file.filename,
+            filename=filename,
             relative_path=relative_path,
             is_folder=False,
             parent_id=folder_id,
+            blob_id=blob.id,
+            size=blob.size,
+            checksum=blob.checksum,
             created_at=datetime.now(timezone.utc),
             updated_at=datetime.now(timezone.utc)
         )
-
         db.add(new_file)
         db.commit()
         db.refresh(new_file)
 
-        with absolute_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        thumbnail_path = get_thumbnail_path(absolute_path, user.username)
-
-        return FileSchema(
-            id=new_file.id,
-            name=new_file.filename,
-            url=f"{BASE_URL}/api/files/{new_file.id}/download",
-            size=absolute_path.stat().st_size,
-            folder=new_file.parent_id,
-            thumbnail=thumbnail_path
-        )
+        return new_file
+    except HTTPException:
+        db.rollback()
+        raise
     except Exception as e:
         # Если произошла ошибка, откатываем транзакцию
         db.rollback()
@@ -201,6 +310,15 @@ def upload_file(db: Session, user: User, file: UploadFile, folder_id: Optional[i
             status_code=500,
             detail=f"Ошибка при загрузке файла: {str(e)}"
         )
+    finally:
+        staged.discard()
+
+
+def iter_descendants(item: UserFile):
+    """Iterate over all files and folders inside folder"""
+    for child in item.children:
+        yield child
+        yield from iter_descendants(child)
 
 
 def delete_recursive(db: Session, item: UserFile):
@@ -210,8 +328,30 @@ def delete_recursive(db: Session, item: UserFile):
         db.delete(child)
 
 
-def delete_folder(db: Session, user: User, folder_id: int):
-    """Delete folder and its contents"""
+@dataclass
+class FileCleanup:
+    """Filesystem work left after a delete has committed"""
+    user: User
+    # Checksums of released blobs, see remove_blob_files()
+    checksums: List[str] = field(default_factory=list)
+    # Relative paths of per-user copies left from before the blob store
+    legacy_files: List[str] = field(default_factory=list)
+    legacy_folders: List[str] = field(default_factory=list)
+
+
+def run_cleanup(cleanup: FileCleanup):
+    """Remove released blobs and legacy copies, runs in a worker thread"""
+    remove_released_blobs(cleanup.checksums)
+    for relative_path in cleanup.legacy_files:
+        legacy_path = get_absolute_path(cleanup.user, relative_path)
+        thumbnail_cache.invalidate(legacy_path, cleanup.user.username)
+        legacy_path.unlink(missing_ok=True)
+    for relative_path in cleanup.legacy_folders:
+        shutil.rmtree(get_absolute_path(cleanup.user, relative_path), ignore_errors=True)
+
+
+def delete_folder(db: Session, user: User, folder_id: int) -> FileCleanup:
+    """Delete folder and its contents. Returns cleanup to run after the commit"""
     folder = db.query(UserFile).filter(
         UserFile.id == folder_id,
         UserFile.user_id == user.id,
@@ -220,17 +360,24 @@ def delete_folder(db: Session, user: User, folder_id: int):
     if not folder:
         raise HTTPException(status_code=404, detail="Folder not found")
 
-    delete_recursive(db, folder)
+    files = [item for item in iter_descendants(folder) if not item.is_folder]
+    blob_ids = [file.blob_id for file in files]
+    # Per-user copies of renamed folders stay at their old paths
+    cleanup = FileCleanup(
+        user=user,
+        legacy_files=[file.relative_path for file in files if file.blob_id is None],
+        legacy_folders=[folder.relative_path]
+    )
 
-    absolute_path = get_absolute_path(user, folder.relative_path)
+    delete_recursive(db, folder)
     db.delete(folder)
+    cleanup.checksums = release_blobs(db, blob_ids)
     db.commit()
-
-    shutil.rmtree(absolute_path, ignore_errors=True)
+    return cleanup
 
 
-def delete_file(db: Session, user: User, file_id: int):
-    """Delete single file"""
+def delete_file(db: Session, user: User, file_id: int) -> FileCleanup:
+    """Delete single file. Returns cleanup to run after the commit"""
     try:
         file = db.query(UserFile).filter(
             UserFile.id == file_id,
@@ -240,15 +387,16 @@ def delete_file(db: Session, user: User, file_id: int):
         if not file:
             raise HTTPException(status_code=404, detail="File not found")
 
-        absolute_path = get_absolute_path(user, file.relative_path)
-        thumbnail_path = Path(THUMBNAIL_DIR) / user.username / \
-            f"th_{absolute_path.stem}.webp"
-
+        cleanup = FileCleanup(user=user)
+        if file.blob_id is None:
+            cleanup.legacy_files.append(file.relative_path)
+        else:
+            cleanup.checksums = release_blobs(db, [file.blob_id])
         db.delete(file)
         db.commit()
-
-        absolute_path.unlink(missing_ok=True)
-        thumbnail_path.unlink(missing_ok=True)
+        return cleanup
+    except HTTPException:
+        raise
     except Exception as e:
         db.rollback()
         raise HTTPException(
@@ -257,44 +405,89 @@ def delete_file(db: Session, user: User, file_id: int):
         )
 
 
-def download_file(db: Session, user: User, file_id: int):
-    """Download file"""
+def delete_user_files(db: Session, user: User) -> List[str]:
+    """
+    Delete all files of user and release their blobs. The caller commits and
+    then passes the returned checksums to remove_released_blobs()
+    """
+    blob_ids = [blob_id for (blob_id,) in db.query(UserFile.blob_id).filter(
+        UserFile.user_id == user.id,
+        UserFile.blob_id != None
+    ).all()]
+
+    db.query(UserFile).filter(UserFile.user_id == user.id).delete(
+        synchronize_session=False)
+    return release_blobs(db, blob_ids)
+
+
+def get_user_file(db: Session, user: User, file_id: int) -> UserFile:
+    """File of user by ID, 404 if there is none"""
     file = db.query(UserFile).filter(
         UserFile.id == file_id,
-        UserFile.user_id == user.id
+        UserFile.user_id == user.id,
+        UserFile.is_folder == False
     ).first()
     if not file:
         raise HTTPException(status_code=404, detail="File not found")
+    return file
+
 
-    absolute_path = get_absolute_path(user, file.relative_path)
-    if not absolute_path.exists():
+def download_file(user: User, file: UserFile, request_headers: Optional[Headers] = None):
+    """
+    Download file. Range requests are served by FileResponse; the ETag is the
+    content checksum when known, otherwise it is derived from size and mtime.
+    """
+    absolute_path = get_storage_path(user, file)
+    try:
+        stat_result = absolute_path.stat()
+    except OSError:
         raise HTTPException(status_code=404, detail="File not found on disk")
 
-    return FileResponse(
+    headers = {"cache-control": DOWNLOAD_CACHE_CONTROL}
+    if file.checksum:
+        headers["etag"] = f'"{file.checksum}"'
+
+    response = RangeFileResponse(
         path=absolute_path,
         filename=file.filename,
-        media_type='application/octet-stream'
+        media_type='application/octet-stream',
+        headers=headers,
+        stat_result=stat_result
     )
+    return conditional_response(response, request_headers)
 
 
-def read_file_content(db: Session, file_id: int):
+def read_file_content(user: User, file: UserFile):
     """Read text file content"""
-    file = db.query(UserFile).filter(UserFile.id == file_id).first()
-    if not file:
-        raise HTTPException(status_code=404, detail="File not found")
-
-    absolute_path = Path(BASE_FOLDER_DIR) / 'admin' / file.relative_path
-
+    absolute_path = get_storage_path(user, file)
     try:
         with open(absolute_path, 'r', encoding='utf-8') as f:
             content = f.read()
         return {"id": file.id, "name": file.filename, "content": content}
     except UnicodeDecodeError:
         raise HTTPException(status_code=400, detail="File is not a text file")
+    except OSError:
+        raise HTTPException(status_code=404, detail="File not found on disk")
+
+
+def rebase_descendants(folder: UserFile, old_path: str, new_path: str):
+    """
+    Update relative paths of folder contents after folder was renamed.
+    Files still stored as per-user copies keep their path, it points at their
+    content on disk until migrate_blobs moves them into the blob store.
+    """
+    for child in folder.children:
+        old_child_path = str(Path(old_path) / child.filename)
+        new_child_path = str(Path(new_path) / child.filename)
+
+        if child.is_folder or child.blob_id is not None:
+            child.relative_path = new_child_path
+        if child.is_folder:
+            rebase_descendants(child, old_child_path, new_child_path)
 
 
 def rename_item(db: Session, user: User, item_id: int, new_name: str, is_folder: bool) -> UserFile:
-    """Rename file or folder"""
+    """Rename file or folder. Only metadata changes, file contents stay in place"""
     # Get the item
     item = db.query(UserFile).filter(
         UserFile.id == item_id,
@@ -323,46 +516,17 @@ def rename_item(db: Session, user: User, item_id: int, new_name: str, is_folder:
             detail=f"An {'folder' if is_folder else 'file'} with this name already exists"
         )
 
-    # Get old and new paths
-    old_path = get_absolute_path(user, item.relative_path)
-    new_relative_path = str(Path(item.relative_path).parent / new_name)
-    new_path = get_absolute_path(user, new_relative_path)
+    old_relative_path = item.relative_path
+    new_relative_path = str(Path(old_relative_path).parent / new_name)
 
-    # Rename on filesystem
-    try:
-        os.rename(old_path, new_path)
-
-        # If it's a file and has a thumbnail, rename it too
-        if not is_folder and old_path.suffix.lower() in ['.png', '.jpg', '.jpeg', '.gif', '.bmp']:
-            old_thumbnail = Path(THUMBNAIL_DIR) / \
-                user.username / f"th_{old_path.stem}.webp"
-            new_thumbnail = Path(THUMBNAIL_DIR) / \
-                user.username / f"th_{new_path.stem}.webp"
-            if old_thumbnail.exists():
-                os.rename(old_thumbnail, new_thumbnail)
-
-    except OSError as e:
-        raise HTTPException(
-            status_code=500, detail=f"Failed to rename: {str(e)}")
+    if is_folder:
+        rebase_descendants(item, old_relative_path, new_relative_path)
 
-    # Update database
+    # Update database. A per-user copy from before the blob store is located
+    # by its path, so only its name changes
     item.filename = new_name
-    item.relative_path = new_relative_path
+    if item.is_folder or item.blob_id is not None:
+        item.relative_path = new_relative_path
     db.commit()
     db.refresh(item)
-
-    if is_folder:
-        return FolderSchema(
-            id=item.id,
-            name=item.filename,
-            parent=item.parent_id
-        )
-    else:
-        return FileSchema(
-            id=item.id,
-            name=item.filename,
-            url=f"{BASE_URL}/api/files/{item.id}/download",
-            size=new_path.stat().st_size,
-            folder=item.parent_id,
-            thumbnail=get_thumbnail_path(new_path, user.username)
-        )
+    return item
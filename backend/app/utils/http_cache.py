@@ -0,0 +1,126 @@
+"""
+HTTP caching helpers: conditional GET evaluation and static files with an
+explicit Cache-Control policy and optional precompressed variants
+"""
+import os
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+from fastapi.staticfiles import StaticFiles
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse
+from starlette.types import Message, Scope, Send
+
+from app.utils.compression import find_precompressed, guess_media_type, compression_metrics
+
+
+def _parse_http_date(value: str):
+    try:
+        return parsedate_to_datetime(value)
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def is_not_modified(response_headers: Headers, request_headers: Headers) -> bool:
+    """
+    Decide whether a 304 can be sent instead of the representation.
+
+    If-None-Match is compared weakly against the ETag and, when present,
+    takes precedence over If-Modified-Since (RFC 9110, section 13.2.2).
+    """
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match is not None:
+        etag = response_headers.get("etag")
+        if etag is None:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        opaque_tag = etag[2:] if etag.startswith("W/") else etag
+        for tag in if_none_match.split(","):
+            tag = tag.strip()
+            if (tag[2:] if tag.startswith("W/") else tag) == opaque_tag:
+                return True
+        return False
+
+    if_modified_since = request_headers.get("if-modified-since")
+    last_modified = response_headers.get("last-modified")
+    if if_modified_since and last_modified:
+        since = _parse_http_date(if_modified_since)
+        modified = _parse_http_date(last_modified)
+        if since is not None and modified is not None:
+            return modified <= since
+    return False
+
+
+def conditional_response(response: Response, request_headers: Optional[Headers]) -> Response:
+    """Replace response with 304 Not Modified when the client copy is current"""
+    if request_headers is not None and is_not_modified(response.headers, request_headers):
+        return NotModifiedResponse(response.headers)
+    return response
+
+
+class RangeFileResponse(FileResponse):
+    """
+    FileResponse that labels multi-range (206) bodies correctly. Starlette
+    sends the multipart/byteranges media type in Content-Range instead of
+    Content-Type, which clients cannot parse.
+    """
+
+    async def _handle_multiple_ranges(self, send: Send, ranges, file_size: int,
+                                      send_header_only: bool) -> None:
+        async def send_with_content_type(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                headers = MutableHeaders(raw=list(message["headers"]))
+                media_type = headers.get("content-range", "")
+                if media_type.startswith("multipart/byteranges"):
+                    del headers["content-range"]
+                    headers["content-type"] = media_type
+                message = {**message, "headers": headers.raw}
+            await send(message)
+
+        await super()._handle_multiple_ranges(
+            send_with_content_type, ranges, file_size, send_header_only)
+
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles that sends Cache-Control and honors conditional requests.
+    With precompressed=True a file.br or file.gz sibling is served instead of
+    the file itself when the client accepts that coding.
+    """
+
+    def __init__(self, *args, cache_control: str, precompressed: bool = False, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cache_control = cache_control
+        self.precompressed = precompressed
+
+    def file_response(
+        self,
+        full_path: "os.PathLike[str]",
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        sibling = None
+        if self.precompressed and status_code == 200:
+            sibling = find_precompressed(full_path, stat_result, request_headers)
+
+        if sibling is not None:
+            coding, sibling_path, sibling_stat = sibling
+            response = RangeFileResponse(
+                sibling_path, status_code=status_code, stat_result=sibling_stat,
+                media_type=guess_media_type(full_path),
+                headers={"content-encoding": coding, "vary": "Accept-Encoding"}
+            )
+            compression_metrics.record_precompressed(
+                coding, stat_result.st_size, sibling_stat.st_size)
+        else:
+            response = RangeFileResponse(full_path, status_code=status_code, stat_result=stat_result)
+            if self.precompressed:
+                response.headers["vary"] = "Accept-Encoding"
+
+        if self.cache_control:
+            response.headers["cache-control"] = self.cache_control
+        return conditional_response(response, request_headers)
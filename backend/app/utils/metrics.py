@@ -0,0 +1,329 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+A small registry of counters, gauges and histograms is filled by
+MetricsMiddleware (request latency, status codes, requests in flight, SQL
+statements per route from the request's QueryLog). Counters kept elsewhere in the
+app (connection pools, uploads, thumbnails, compression, buffered access times)
+are read by collectors at scrape time, so they cost nothing between scrapes.
+"""
+import bisect
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+
+from starlette.staticfiles import StaticFiles
+from starlette.types import Message, Receive, Scope, Send
+
+from app.utils.queries import current_query_log, statement_listeners
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+# Sample of a collected metric: (labels, value) or (name suffix, labels, value)
+Sample = Tuple[Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_format_labels(dict(zip(self.labelnames, key)))} {_format_value(value)}"
+            for key, value in items
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # labels -> (counts per bucket, sum, count)
+        self._values: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            if index < len(self.buckets):
+                entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, [list(entry[0]), entry[1], entry[2]]) for key, entry in self._values.items())
+        lines = self.header()
+        for key, (counts, total, count) in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(dict(labels, le=_format_value(bound)))} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(dict(labels, le='+Inf'))} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+@dataclass
+class CollectedMetric:
+    """Metric produced by a collector at scrape time"""
+    name: str
+    kind: str
+    documentation: str
+    samples: Iterable[Sample]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(f"{self.name}{_format_labels(labels)} {_format_value(value)}"
+                     for labels, value in self.samples)
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._collectors: List[Callable[[], Iterable[CollectedMetric]]] = []
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], Iterable[CollectedMetric]]):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for collector in self._collectors:
+            try:
+                for metric in collector():
+                    lines.extend(metric.render())
+            except Exception as e:
+                print(f"Metrics collector error: {str(e)}")
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+http_requests_total = registry.counter(
+    "http_requests_total", "HTTP requests by route and status code", ["method", "route", "status"])
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency", ["method", "route"])
+http_requests_in_flight = registry.gauge(
+    "http_requests_in_flight", "HTTP requests being processed", ["method"])
+db_queries_total = registry.counter(
+    "db_queries_total", "SQL statements executed, by route", ["route"])
+db_query_seconds_total = registry.counter(
+    "db_query_seconds_total", "Time spent executing SQL statements, by route", ["route"])
+db_queries_per_request = registry.histogram(
+    "http_request_db_queries", "SQL statements executed per request", ["route"],
+    buckets=QUERY_COUNT_BUCKETS)
+db_query_duration = registry.histogram(
+    "db_query_duration_seconds", "SQL statement latency")
+
+
+statement_listeners.append(db_query_duration.observe)
+
+
+def route_label(scope: Scope, root_path: str) -> str:
+    """Route template of a handled request, e.g. /courses/{course_id}"""
+    route = scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path
+    if isinstance(scope.get("endpoint"), StaticFiles):
+        mount_path = scope.get("root_path", "")[len(root_path):]
+        return f"{mount_path}/{{path}}"
+    return "unmatched"
+
+
+class MetricsMiddleware:
+    """Record latency, status code and SQL statements of every HTTP request"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        root_path = scope.get("root_path", "")
+        status_code = 500
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc(method=method)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_requests_in_flight.dec(method=method)
+            log = current_query_log.get()
+
+            route = route_label(scope, root_path)
+            http_requests_total.inc(method=method, route=route, status=str(status_code))
+            http_request_duration.observe(elapsed, method=method, route=route)
+            if log is not None:
+                if log.count:
+                    db_queries_total.inc(log.count, route=route)
+                    db_query_seconds_total.inc(log.seconds, route=route)
+                db_queries_per_request.observe(log.count, route=route)
+
+
+def collect_app_metrics() -> Iterable[CollectedMetric]:
+    """Counters kept by connection pools, uploads, thumbnails, compression and access times"""
+    from app.core.database import pool_metrics
+    from app.utils.access_times import access_time_buffer
+    from app.utils.compression import compression_metrics
+    from app.utils.thumbnails import thumbnail_cache
+    from app.utils.uploads import upload_metrics
+
+    pools = {name: (metrics, metrics.pool_state()) for name, metrics in pool_metrics.items()}
+    for name, field, documentation in (
+        ("db_pool_size", "size", "Connections kept open by the pool"),
+        ("db_pool_checked_out", "checked_out", "Connections currently in use"),
+        ("db_pool_overflow", "overflow", "Connections open above the pool size"),
+    ):
+        yield CollectedMetric(name, "gauge", documentation, [
+            ({"engine": engine}, state[field]) for engine, (_, state) in pools.items() if field in state
+        ])
+    for name, attribute, documentation in (
+        ("db_pool_checkouts_total", "checkouts", "Connections handed out by the pool"),
+        ("db_pool_checkout_timeouts_total", "timeouts", "Checkouts that timed out waiting for a connection"),
+        ("db_pool_checkout_wait_seconds_total", "wait_seconds_total", "Time spent waiting for a connection"),
+        ("db_pool_connections_opened_total", "connections_opened", "Database connections opened"),
+        ("db_pool_connections_closed_total", "connections_closed", "Database connections closed"),
+    ):
+        yield CollectedMetric(name, "counter", documentation, [
+            ({"engine": engine}, getattr(metrics, attribute)) for engine, (metrics, _) in pools.items()
+        ])
+
+    uploads = upload_metrics.stats()
+    yield CollectedMetric("uploads_total", "counter", "File uploads by result", [
+        ({"result": "completed"}, uploads["completed"]),
+        ({"result": "failed"}, uploads["failed"]),
+        ({"result": "too_large"}, uploads["rejected_too_large"]),
+    ])
+    yield CollectedMetric("upload_bytes_total", "counter", "Bytes received in completed uploads",
+                          [({}, uploads["bytes_total"])])
+
+    thumbnails = thumbnail_cache.stats()
+    yield CollectedMetric("thumbnail_cache_requests_total", "counter", "Thumbnail lookups by result", [
+        ({"result": "hit"}, thumbnails["hits"]),
+        ({"result": "miss"}, thumbnails["misses"]),
+    ])
+    yield CollectedMetric("thumbnails_rendered_total", "counter", "Thumbnails rendered",
+                          [({}, thumbnails["rendered"])])
+    yield CollectedMetric("thumbnail_rendered_bytes_total", "counter", "Bytes of rendered thumbnails",
+                          [({}, thumbnails["rendered_bytes"])])
+    yield CollectedMetric("thumbnail_errors_total", "counter", "Thumbnails that failed to render",
+                          [({}, thumbnails["errors"])])
+    yield CollectedMetric("thumbnail_evictions_total", "counter", "Thumbnails evicted from the cache",
+                          [({}, thumbnails["evictions"])])
+    yield CollectedMetric("thumbnail_cache_bytes", "gauge", "Size of cached thumbnails",
+                          [({}, thumbnails["bytes"])])
+
+    access_times = access_time_buffer.stats()
+    yield CollectedMetric("course_access_times_pending", "gauge",
+                          "Course access times waiting to be written", [({}, access_times["pending"])])
+    yield CollectedMetric("course_access_times_flushed_total", "counter",
+                          "Course access times written to the database", [({}, access_times["flushed_rows"])])
+    yield CollectedMetric("course_access_time_flush_errors_total", "counter",
+                          "Access time flushes that failed and were retried", [({}, access_times["errors"])])
+
+    compressed, precompressed, _ = compression_metrics.snapshot()
+    for name, field, documentation in (
+        ("http_compression_bytes_in_total", "bytes_in", "Response bytes before compression"),
+        ("http_compression_bytes_out_total", "bytes_out", "Response bytes after compression"),
+    ):
+        yield CollectedMetric(name, "counter", documentation, [
+            ({"encoding": coding, "source": source}, item[field])
+            for source, counters in (("dynamic", compressed), ("precompressed", precompressed))
+            for coding, item in counters.items()
+        ])
+
+
+registry.add_collector(collect_app_metrics)
@@ -0,0 +1,191 @@
+"""
+Keyset (cursor) pagination helpers
+"""
+import base64
+import enum
+import json
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from fastapi import HTTPException, status
+from sqlalchemy import and_, or_
+
+from app.core.config import COURSE_COUNT_CACHE_TTL
+
+
+def encode_cursor(scope: str, value: Any, row_id: int) -> str:
+    """
+    Упаковывает позицию последней строки страницы в непрозрачный курсор
+
+    Args:
+        scope: Область действия курсора (список и сортировка)
+        value: Значение колонки сортировки последней строки
+        row_id: ID последней строки
+
+    Returns:
+        Строка курсора для передачи клиенту
+    """
+    value_type = "raw"
+    if isinstance(value, datetime):
+        value, value_type = value.isoformat(), "datetime"
+    elif isinstance(value, enum.Enum):
+        value = value.name
+    payload = {"s": scope, "v": value, "t": value_type, "id": row_id}
+    raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, scope: str) -> Tuple[Any, int]:
+    """
+    Распаковывает курсор и проверяет, что он выдан для того же списка
+
+    Args:
+        cursor: Строка курсора
+        scope: Ожидаемая область действия курсора
+
+    Returns:
+        Значение колонки сортировки и ID последней строки
+
+    Raises:
+        HTTPException: если курсор поврежден или выдан для другой сортировки
+    """
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if payload["s"] != scope:
+            raise ValueError("cursor scope mismatch")
+        value = payload["v"]
+        if payload["t"] == "datetime":
+            value = datetime.fromisoformat(value)
+        return value, int(payload["id"])
+    except (ValueError, KeyError, TypeError, UnicodeDecodeError):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Некорректный курсор пагинации"
+        )
+
+
+def keyset_order(sort_expression: Any, id_expression: Any, descending: bool) -> Tuple[Any, Any]:
+    """
+    Порядок сортировки для fetch_keyset_page. NULL в колонке сортировки
+    считается меньше любого значения (первым по возрастанию, последним по
+    убыванию) независимо от СУБД, так же его обходит условие поиска по ключу.
+
+    Args:
+        sort_expression: Колонка сортировки
+        id_expression: Уникальная колонка для разрешения равенства значений
+        descending: Направление сортировки
+
+    Returns:
+        Выражения для order_by
+    """
+    if descending:
+        return sort_expression.desc().nulls_last(), id_expression.desc()
+    return sort_expression.asc().nulls_first(), id_expression.asc()
+
+
+def _seek_condition(sort_expression: Any, id_expression: Any, descending: bool,
+                    value: Any, last_id: int) -> Any:
+    """Условие для строк после (value, last_id) в порядке keyset_order"""
+    nullable = getattr(sort_expression, "nullable", True)
+    if value is None:
+        # Последняя строка страницы была среди NULL
+        after_id = id_expression < last_id if descending else id_expression > last_id
+        if descending:
+            return and_(sort_expression.is_(None), after_id)
+        return or_(and_(sort_expression.is_(None), after_id), sort_expression.isnot(None))
+
+    if descending:
+        seek = or_(sort_expression < value,
+                   and_(sort_expression == value, id_expression < last_id))
+        # Строки с NULL идут после всех значений
+        return or_(seek, sort_expression.is_(None)) if nullable else seek
+    return or_(sort_expression > value,
+               and_(sort_expression == value, id_expression > last_id))
+
+
+def fetch_keyset_page(
+    query: Any,
+    sort_expression: Any,
+    id_expression: Any,
+    descending: bool,
+    size: int,
+    cursor: Optional[str],
+    scope: str
+) -> Tuple[List[Any], Optional[str]]:
+    """
+    Получает страницу по курсору поиском по ключу (sort_expression, id) вместо OFFSET.
+    Запрос уже должен быть отсортирован по keyset_order(sort_expression,
+    id_expression, descending).
+
+    Args:
+        query: Отсортированный SQLAlchemy Query
+        sort_expression: Колонка сортировки
+        id_expression: Уникальная колонка для разрешения равенства значений
+        descending: Направление сортировки
+        size: Размер страницы
+        cursor: Курсор предыдущей страницы (пустой для первой страницы)
+        scope: Область действия курсора
+
+    Returns:
+        Tuple из двух элементов:
+        - Список объектов первой сущности запроса
+        - Курсор следующей страницы или None, если страница последняя
+    """
+    if cursor:
+        value, last_id = decode_cursor(cursor, scope)
+        query = query.filter(
+            _seek_condition(sort_expression, id_expression, descending, value, last_id))
+
+    rows = query.add_columns(
+        sort_expression.label("sort_value"),
+        id_expression.label("seek_id")
+    ).limit(size + 1).all()
+
+    has_more = len(rows) > size
+    rows = rows[:size]
+    items = [row[0] for row in rows]
+
+    next_cursor = None
+    if has_more and rows:
+        next_cursor = encode_cursor(scope, rows[-1].sort_value, rows[-1].seek_id)
+
+    return items, next_cursor
+
+
+class CountCache:
+    """Кэш общего количества строк с ограниченным временем жизни"""
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._values: Dict[Hashable, Tuple[float, int]] = {}
+
+    def get_count(self, key: Hashable, query: Any) -> int:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._values.get(key)
+            if cached and cached[0] > now:
+                return cached[1]
+
+        total = query.order_by(None).count()
+        with self._lock:
+            # Отбрасываем устаревшие значения, чтобы кэш не рос бесконечно
+            if len(self._values) > 1024:
+                self._values = {k: v for k, v in self._values.items() if v[0] > now}
+            self._values[key] = (now + self.ttl, total)
+        return total
+
+
+count_cache = CountCache(COURSE_COUNT_CACHE_TTL)
+
+
+def make_cache_key(*parts: Any, **params: Any) -> Hashable:
+    """Строит ключ кэша из параметров фильтрации"""
+    def freeze(value):
+        if isinstance(value, (list, tuple, set)):
+            return tuple(sorted(str(v) for v in value))
+        return value
+    return parts + tuple(sorted((k, freeze(v)) for k, v in params.items()))
@@ -0,0 +1,156 @@
+"""
+Per-request SQL statement counter and N+1 detector.
+
+SQLAlchemy cursor events add every executed statement to the QueryLog of
+the request being handled. After the response QueryCounterMiddleware logs
+requests that ran too many statements or repeated one statement shape
+(an N+1 pattern), and outside production reports the count in the
+X-Query-Count header. Routes may declare a budget with @query_budget(n);
+exceeding it is logged, and the query_budgets fixture in tests/conftest.py
+fails tests that trigger it.
+"""
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.datastructures import MutableHeaders
+from starlette.types import Message, Receive, Scope, Send
+
+from app.core.config import QUERY_LOG_THRESHOLD, QUERY_REPEAT_THRESHOLD, QUERY_COUNT_HEADER
+
+_PLACEHOLDER = r"(?:\?|\$\d+|%s|%\(\w+\)s|:\w+)"
+_PLACEHOLDER_LIST = re.compile(rf"\(\s*{_PLACEHOLDER}(?:\s*,\s*{_PLACEHOLDER})+\s*\)")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def statement_shape(statement: str) -> str:
+    """Statement text with whitespace and IN lists of any length collapsed"""
+    shape = _WHITESPACE.sub(" ", statement).strip()
+    return _PLACEHOLDER_LIST.sub("(...)", shape)
+
+
+class QueryLog:
+    """SQL statements executed while handling one request"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes: Counter = Counter()
+
+    def record(self, statement: str, seconds: float):
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[statement_shape(statement)] += 1
+
+    def repeated(self, threshold: int = QUERY_REPEAT_THRESHOLD) -> List[Tuple[str, int]]:
+        """Statement shapes executed at least threshold times, most frequent first"""
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+
+# Log of the request being handled. Sync endpoints run in a worker thread
+# with a copy of the context, which shares the same QueryLog object.
+current_query_log: ContextVar[Optional[QueryLog]] = ContextVar("current_query_log", default=None)
+
+# Callbacks invoked after every request with (method, route, query log, budget or None)
+request_listeners: List[Callable[[str, str, QueryLog, Optional[int]], None]] = []
+
+# Callbacks invoked with the duration of every statement, e.g. a latency histogram
+statement_listeners: List[Callable[[float], None]] = []
+
+
+def instrument_queries(engine: Engine):
+    """Count and time SQL statements of an engine (sync_engine for async ones)"""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started_at", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started_at"].pop()
+        for listener in statement_listeners:
+            listener(elapsed)
+        log = current_query_log.get()
+        if log is not None:
+            log.record(statement, elapsed)
+
+
+@contextmanager
+def count_queries() -> Iterator[QueryLog]:
+    """Collect statements executed inside the block, e.g. in scripts and tests"""
+    log = QueryLog()
+    token = current_query_log.set(log)
+    try:
+        yield log
+    finally:
+        current_query_log.reset(token)
+
+
+def query_budget(max_queries: int):
+    """Declare the most SQL statements a route may execute per request"""
+    def decorator(endpoint):
+        endpoint.query_budget = max_queries
+        return endpoint
+    return decorator
+
+
+def route_budget(scope: Scope) -> Optional[int]:
+    route = scope.get("route")
+    return getattr(getattr(route, "endpoint", None), "query_budget", None)
+
+
+def route_path(scope: Scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or scope.get("path", "")
+
+
+class QueryCounterMiddleware:
+    """Attach a QueryLog to every HTTP request and report what it collected"""
+
+    def __init__(self, app, log_threshold: int = QUERY_LOG_THRESHOLD,
+                 repeat_threshold: int = QUERY_REPEAT_THRESHOLD, add_header: bool = QUERY_COUNT_HEADER):
+        self.app = app
+        self.log_threshold = log_threshold
+        self.repeat_threshold = repeat_threshold
+        self.add_header = add_header
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        log = QueryLog()
+        token = current_query_log.set(log)
+
+        async def send_wrapper(message: Message):
+            if message["type"] == "http.response.start" and self.add_header:
+                headers = MutableHeaders(scope=message)
+                headers["X-Query-Count"] = str(log.count)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_query_log.reset(token)
+            self.report(scope, log)
+
+    def report(self, scope: Scope, log: QueryLog):
+        method, route = scope["method"], route_path(scope)
+        budget = route_budget(scope)
+        for listener in request_listeners:
+            listener(method, route, log, budget)
+        if budget is not None and log.count > budget:
+            print(f"Query budget exceeded in {method} {route}: {log.count} queries, budget {budget}")
+
+        repeated = log.repeated(self.repeat_threshold)
+        if repeated:
+            print(f"Possible N+1 in {method} {route}: {log.count} queries")
+            for shape, n in repeated:
+                print(f"  {n}x {shape[:300]}")
+        elif self.log_threshold and log.count > self.log_threshold:
+            print(f"Many queries in {method} {route}: {log.count} queries, {log.seconds * 1000:.1f} ms")
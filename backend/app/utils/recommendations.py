@@ -0,0 +1,393 @@
+"""
+Рекомендации курсов по совместным записям (item-item).
+
+Из таблицы course_enrollments строится разреженная матрица пользователь x курс,
+по ней матрица совместных записей курс x курс и косинусная близость курсов.
+Для каждого курса хранится top-K самых похожих курсов, так что ответ на запрос
+считается в памяти по нескольким массивам NumPy. Новые записи на курсы
+обновляют счетчики и top-K затронутых курсов инкрементально, полная
+перестройка выполняется раз в RECOMMENDER_REFRESH_SECONDS в фоновом потоке
+со своей сессией. Пока индекс перестраивается, запросы обслуживаются
+предыдущим индексом (или популярными курсами, если индекса еще нет).
+
+Пользователям с небольшим числом записей (холодный старт) к оценке
+примешивается близость по категориям уже выбранных курсов и популярность.
+"""
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+from scipy import sparse
+from sqlalchemy.orm import Session
+
+from app.core.config import (
+    RECOMMENDER_TOP_K, RECOMMENDER_REFRESH_SECONDS, RECOMMENDER_COLD_START_ENROLLMENTS
+)
+from app.core.models import Course, CourseEnrollment, course_categories
+
+# Вес популярности в итоговой оценке: разрешает равенство и дает результат без записей
+POPULARITY_WEIGHT = 0.05
+# Пауза перед повторной попыткой после неудачной перестройки, секунды
+REBUILD_RETRY_SECONDS = 30.0
+
+
+class RecommendationEngine:
+    """Индекс похожих курсов в памяти процесса"""
+
+    def __init__(self, top_k: int, refresh_seconds: float, cold_start_enrollments: int):
+        self.top_k = top_k
+        self.refresh_seconds = refresh_seconds
+        self.cold_start_enrollments = max(1, cold_start_enrollments)
+        # Защищает только чтение и замену ссылок, запросы к базе выполняются без нее
+        self._lock = threading.RLock()
+        self._built_at: Optional[float] = None
+        # Перестройка в фоновом потоке: одна за раз, номер поколения отличает
+        # индекс, построенный до invalidate(), от актуального
+        self._rebuilding = False
+        self._generation = 0
+        self._failed_at: Optional[float] = None
+
+        # ID курса -> номер строки во всех матрицах
+        self._index: Dict[int, int] = {}
+        self._course_ids = np.zeros(0, dtype=np.int64)
+        self._active = np.zeros(0, dtype=bool)
+        # Число записей на курс (диагональ матрицы совместных записей)
+        self._counts = np.zeros(0, dtype=np.float64)
+        # Совместные записи курс x курс без диагонали
+        self._co = sparse.lil_matrix((0, 0), dtype=np.float64)
+        # Курс x категория: lil для изменений, csr для запросов
+        self._categories = sparse.lil_matrix((0, 0), dtype=np.float64)
+        self._categories_csr = sparse.csr_matrix((0, 0), dtype=np.float64)
+        self._category_index: Dict[int, int] = {}
+        # top-K похожих курсов: номера строк (-1 для пустых мест) и близость
+        self._topk_rows = np.zeros((0, top_k), dtype=np.int32)
+        self._topk_sims = np.zeros((0, top_k), dtype=np.float32)
+        # Вклад популярности в оценку: POPULARITY_WEIGHT * log1p(записи) / log1p(максимум)
+        self._popularity = np.zeros(0, dtype=np.float64)
+        self._popularity_scale = 0.0
+
+        self.builds = 0
+        self.build_errors = 0
+        self.incremental_updates = 0
+        self.requests = 0
+        self.last_build_seconds = 0.0
+
+    # Построение индекса
+
+    def rebuild(self, db: Session):
+        """
+        Полная перестройка индекса по текущему состоянию базы данных.
+        Строки читаются и индекс считается без блокировки, под блокировкой
+        только подменяются ссылки на готовые массивы
+        """
+        started = time.perf_counter()
+        with self._lock:
+            generation = self._generation
+
+        course_rows = db.query(Course.id).order_by(Course.id).all()
+        course_ids = np.fromiter((row[0] for row in course_rows), dtype=np.int64,
+                                 count=len(course_rows))
+        index = {int(course_id): i for i, course_id in enumerate(course_ids)}
+        n_courses = len(course_ids)
+
+        enrollments = db.query(CourseEnrollment.user_id, CourseEnrollment.course_id).all()
+        user_ids = np.fromiter((row[0] for row in enrollments), dtype=np.int64, count=len(enrollments))
+        enrolled = np.fromiter((index.get(row[1], -1) for row in enrollments),
+                               dtype=np.int64, count=len(enrollments))
+        known = enrolled >= 0
+        user_ids, enrolled = user_ids[known], enrolled[known]
+        _, user_rows = np.unique(user_ids, return_inverse=True)
+        n_users = int(user_rows.max()) + 1 if len(user_rows) else 0
+
+        # Пользователь x курс, повторные записи схлопываются в 1
+        user_course = sparse.csr_matrix(
+            (np.ones(len(enrolled)), (user_rows, enrolled)), shape=(n_users, n_courses))
+        user_course.data[:] = 1.0
+        co = (user_course.T @ user_course).tocsr()
+        counts = co.diagonal().astype(np.float64)
+        co.setdiag(0)
+        co.eliminate_zeros()
+
+        links = db.query(course_categories.c.course_id, course_categories.c.category_id).all()
+        category_index: Dict[int, int] = {}
+        link_courses, link_categories = [], []
+        for course_id, category_id in links:
+            if course_id in index:
+                link_courses.append(index[course_id])
+                link_categories.append(category_index.setdefault(category_id, len(category_index)))
+        categories = sparse.csr_matrix(
+            (np.ones(len(link_courses)), (link_courses, link_categories)),
+            shape=(n_courses, len(category_index)))
+
+        topk_rows, topk_sims = self._compute_topk(co, counts)
+        popularity_scale = self._scale_for(counts)
+
+        with self._lock:
+            # Записи, сделанные во время перестройки, попадут в индекс при следующей
+            self._index = index
+            self._course_ids = course_ids
+            self._active = np.ones(n_courses, dtype=bool)
+            self._counts = counts
+            self._co = co.tolil()
+            self._categories = categories.tolil()
+            self._categories_csr = categories
+            self._category_index = category_index
+            self._popularity = np.log1p(counts) * popularity_scale
+            self._popularity_scale = popularity_scale
+            self._topk_rows = topk_rows
+            self._topk_sims = topk_sims
+            # После invalidate() во время перестройки индекс сразу считается устаревшим
+            self._built_at = time.monotonic() if generation == self._generation else None
+            self.builds += 1
+            self.last_build_seconds = time.perf_counter() - started
+
+    def _compute_topk(self, co: sparse.csr_matrix, counts: np.ndarray):
+        """top-K по косинусной близости для всех курсов сразу"""
+        n_courses = co.shape[0]
+        topk_rows = np.full((n_courses, self.top_k), -1, dtype=np.int32)
+        topk_sims = np.zeros((n_courses, self.top_k), dtype=np.float32)
+        if co.nnz == 0:
+            return topk_rows, topk_sims
+
+        # S = D^-1/2 * C * D^-1/2
+        norms = np.sqrt(counts)
+        inverse = np.divide(1.0, norms, out=np.zeros_like(norms), where=norms > 0)
+        similarity = (sparse.diags(inverse) @ co @ sparse.diags(inverse)).tocsr()
+
+        for row in range(n_courses):
+            start, end = similarity.indptr[row], similarity.indptr[row + 1]
+            self._store_row(topk_rows, topk_sims, row,
+                            similarity.indices[start:end], similarity.data[start:end])
+        return topk_rows, topk_sims
+
+    def _store_row(self, topk_rows, topk_sims, row: int, columns: np.ndarray, sims: np.ndarray):
+        topk_rows[row] = -1
+        topk_sims[row] = 0.0
+        if len(columns) == 0:
+            return
+        if len(columns) > self.top_k:
+            best = np.argpartition(-sims, self.top_k - 1)[:self.top_k]
+            columns, sims = columns[best], sims[best]
+        order = np.argsort(-sims, kind="stable")
+        topk_rows[row, :len(order)] = columns[order]
+        topk_sims[row, :len(order)] = sims[order]
+
+    @staticmethod
+    def _scale_for(counts: np.ndarray) -> float:
+        top = counts.max() if len(counts) else 0.0
+        return POPULARITY_WEIGHT / np.log1p(top) if top > 0 else 0.0
+
+    def _refresh_popularity(self, row: int):
+        """Вклад популярности одного курса (блокировка захвачена)"""
+        value = np.log1p(self._counts[row])
+        if self._popularity_scale == 0.0 or value * self._popularity_scale > POPULARITY_WEIGHT:
+            # Новый самый популярный курс меняет нормировку всех курсов
+            self._popularity_scale = self._scale_for(self._counts)
+            self._popularity = np.log1p(self._counts) * self._popularity_scale
+        else:
+            self._popularity[row] = value * self._popularity_scale
+
+    def _refresh_row(self, row: int):
+        """Пересчет top-K одного курса по текущим счетчикам (блокировка захвачена)"""
+        columns = np.asarray(self._co.rows[row], dtype=np.int64)
+        values = np.asarray(self._co.data[row], dtype=np.float64)
+        denominator = np.sqrt(self._counts[row] * self._counts[columns])
+        sims = np.divide(values, denominator, out=np.zeros_like(values), where=denominator > 0)
+        self._store_row(self._topk_rows, self._topk_sims, row, columns, sims)
+
+    def _ensure_course(self, course_id: int) -> int:
+        """Номер строки курса, добавляет строку для нового курса (блокировка захвачена)"""
+        row = self._index.get(course_id)
+        if row is not None:
+            return row
+        row = len(self._course_ids)
+        size = row + 1
+        self._index[course_id] = row
+        self._course_ids = np.append(self._course_ids, course_id)
+        self._active = np.append(self._active, True)
+        self._counts = np.append(self._counts, 0.0)
+        self._popularity = np.append(self._popularity, 0.0)
+        self._co.resize((size, size))
+        self._categories.resize((size, self._categories.shape[1]))
+        self._topk_rows = np.vstack([self._topk_rows, np.full((1, self.top_k), -1, dtype=np.int32)])
+        self._topk_sims = np.vstack([self._topk_sims, np.zeros((1, self.top_k), dtype=np.float32)])
+        return row
+
+    def is_stale(self) -> bool:
+        return self._built_at is None or time.monotonic() - self._built_at > self.refresh_seconds
+
+    def refresh_if_stale(self):
+        """
+        Запускает перестройку в фоновом потоке, если индекс еще не построен
+        или устарел. Не ждет ее завершения: до замены индекса запросы
+        обслуживаются предыдущим
+        """
+        with self._lock:
+            if self._rebuilding or not self.is_stale():
+                return
+            if self._failed_at is not None and time.monotonic() - self._failed_at < REBUILD_RETRY_SECONDS:
+                return
+            self._rebuilding = True
+        threading.Thread(target=self._rebuild_in_background,
+                         name="recommendations-rebuild", daemon=True).start()
+
+    def _rebuild_in_background(self):
+        from app.core.database import SessionLocal
+        db = SessionLocal()
+        try:
+            self.rebuild(db)
+            failed_at = None
+        except Exception as e:
+            print(f"Database error in RecommendationEngine.rebuild: {str(e)}")
+            failed_at = time.monotonic()
+        finally:
+            db.close()
+        with self._lock:
+            self._rebuilding = False
+            self._failed_at = failed_at
+            if failed_at is not None:
+                self.build_errors += 1
+
+    def invalidate(self):
+        """Требует полной перестройки, она запустится при следующем запросе"""
+        with self._lock:
+            self._built_at = None
+            self._generation += 1
+
+    # Инкрементальные обновления
+
+    def _apply_enrollment(self, course_id: int, other_course_ids: Iterable[int], delta: float):
+        with self._lock:
+            if self._built_at is None:
+                return
+            row = self._ensure_course(course_id)
+            others = [self._ensure_course(other) for other in other_course_ids if other != course_id]
+            self._counts[row] = max(0.0, self._counts[row] + delta)
+            self._refresh_popularity(row)
+            for other in others:
+                value = max(0.0, self._co[row, other] + delta)
+                self._co[row, other] = value
+                self._co[other, row] = value
+            for affected in [row] + others:
+                self._refresh_row(affected)
+            self.incremental_updates += 1
+
+    def record_enrollment(self, course_id: int, other_course_ids: Iterable[int]):
+        """
+        Учитывает новую запись на курс
+
+        Args:
+            course_id: ID курса, на который записался пользователь
+            other_course_ids: ID остальных курсов пользователя
+        """
+        self._apply_enrollment(course_id, other_course_ids, 1.0)
+
+    def record_unenrollment(self, course_id: int, other_course_ids: Iterable[int]):
+        """Учитывает отмену записи на курс"""
+        self._apply_enrollment(course_id, other_course_ids, -1.0)
+
+    def update_course(self, course_id: int, category_ids: Iterable[int]):
+        """Учитывает новый курс или изменение его категорий"""
+        with self._lock:
+            if self._built_at is None:
+                return
+            row = self._ensure_course(course_id)
+            self._active[row] = True
+            columns = []
+            for category_id in category_ids:
+                if category_id not in self._category_index:
+                    self._category_index[category_id] = len(self._category_index)
+                    self._categories.resize(
+                        (self._categories.shape[0], len(self._category_index)))
+                columns.append(self._category_index[category_id])
+            self._categories.rows[row] = sorted(columns)
+            self._categories.data[row] = [1.0] * len(columns)
+            self._categories_csr = self._categories.tocsr()
+
+    def remove_course(self, course_id: int):
+        """Исключает удаленный курс из рекомендаций"""
+        with self._lock:
+            row = self._index.get(course_id)
+            if row is not None:
+                self._active[row] = False
+
+    # Рекомендации
+
+    def recommend(self, enrolled_course_ids: Iterable[int], limit: int) -> List[int]:
+        """
+        Ранжирует курсы для пользователя
+
+        Args:
+            enrolled_course_ids: ID курсов, на которые пользователь уже записан
+            limit: Количество рекомендаций
+
+        Returns:
+            Список ID курсов в порядке убывания оценки
+        """
+        # Под блокировкой берутся только ссылки, расчет идет без нее. Инкрементальные
+        # обновления заменяют массивы при росте, а строки top-K меняют на месте:
+        # параллельный запрос может увидеть оценку курса до или после обновления
+        with self._lock:
+            self.requests += 1
+            course_ids, active = self._course_ids, self._active
+            topk_rows, topk_sims = self._topk_rows, self._topk_sims
+            categories, popularity = self._categories_csr, self._popularity
+            rows = [self._index[c] for c in enrolled_course_ids if c in self._index]
+
+        n_courses = len(course_ids)
+        if n_courses == 0:
+            return []
+        rows = np.array([row for row in rows if row < n_courses], dtype=np.int64)
+        alpha = min(1.0, len(rows) / self.cold_start_enrollments)
+        scores = popularity[:n_courses].copy()
+
+        if len(rows):
+            # Сумма близостей к курсам пользователя
+            neighbours = topk_rows[rows].ravel()
+            weights = topk_sims[rows].ravel()
+            valid = neighbours >= 0
+            collaborative = np.bincount(neighbours[valid], weights=weights[valid],
+                                        minlength=n_courses)[:n_courses]
+            if collaborative.max() > 0:
+                scores += alpha * collaborative / collaborative.max()
+
+            # Близость по категориям для холодного старта
+            # (матрица категорий обновляется в update_course, новые курсы
+            # без категорий в ней могут отсутствовать)
+            known = min(categories.shape[0], n_courses)
+            if alpha < 1.0 and categories.shape[1] and known:
+                profile = np.asarray(categories[rows[rows < known]].sum(axis=0)).ravel()
+                affinity = np.zeros(n_courses)
+                affinity[:known] = categories[:known] @ profile
+                if affinity.max() > 0:
+                    scores += (1.0 - alpha) * affinity / affinity.max()
+
+        scores[~active[:n_courses]] = 0.0
+        scores[rows] = 0.0
+
+        candidates = np.flatnonzero(scores > 0)
+        if len(candidates) > limit:
+            candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [int(course_id) for course_id in course_ids[candidates]]
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "courses": len(self._course_ids),
+                "co_enrollment_pairs": int(self._co.nnz // 2),
+                "top_k": self.top_k,
+                "builds": self.builds,
+                "build_errors": self.build_errors,
+                "rebuilding": self._rebuilding,
+                "last_build_seconds": round(self.last_build_seconds, 4),
+                "incremental_updates": self.incremental_updates,
+                "requests": self.requests,
+                "age_seconds": round(time.monotonic() - self._built_at, 1)
+                if self._built_at is not None else None,
+            }
+
+
+recommendation_engine = RecommendationEngine(
+    RECOMMENDER_TOP_K, RECOMMENDER_REFRESH_SECONDS, RECOMMENDER_COLD_START_ENROLLMENTS)
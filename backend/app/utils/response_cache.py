@@ -0,0 +1,172 @@
+"""
+Кэш ответов для редко меняющихся списков (популярные и новые курсы, категории).
+
+Записи живут в течение TTL пространства имен, после чего еще STALE_TTL секунд
+отдаются устаревшими, пока один запрос обновляет значение. Одновременные
+промахи по одному ключу ждут единственную загрузку. Изменения данных явно
+сбрасывают пространство имен через invalidate().
+"""
+import asyncio
+import threading
+import time
+from collections import defaultdict
+from dataclasses import dataclass, asdict
+from typing import Any, Awaitable, Callable, Dict, Hashable, Tuple
+
+from app.core.config import (
+    POPULAR_CACHE_TTL, RECENT_CACHE_TTL, CATEGORIES_CACHE_TTL, RESPONSE_CACHE_STALE_TTL
+)
+
+# Пространства имен кэша
+POPULAR = "popular"
+RECENT = "recent"
+CATEGORIES = "categories"
+
+
+@dataclass
+class _Entry:
+    value: Any
+    fresh_until: float
+    stale_until: float
+
+
+@dataclass
+class KeyStats:
+    """Счетчики обращений к одному ключу кэша"""
+    hits: int = 0
+    stale_hits: int = 0
+    misses: int = 0
+    coalesced: int = 0
+    refreshes: int = 0
+    loads: int = 0
+    errors: int = 0
+    load_seconds: float = 0.0
+
+
+class ResponseCache:
+    """Кэш ответов с TTL, отдачей устаревших значений и явной инвалидацией"""
+
+    def __init__(self, ttls: Dict[str, float], stale_ttl: float):
+        self.ttls = ttls
+        self.stale_ttl = stale_ttl
+        # Инвалидация вызывается и из синхронных обработчиков в пуле потоков
+        self._lock = threading.Lock()
+        self._entries: Dict[Tuple[str, Hashable], _Entry] = {}
+        self._generations: Dict[str, int] = defaultdict(int)
+        # Загрузки в процессе, доступны только из цикла событий
+        self._inflight: Dict[Tuple[str, Hashable], asyncio.Future] = {}
+        self._stats: Dict[str, KeyStats] = defaultdict(KeyStats)
+
+    async def get_or_load(self, namespace: str, key: Hashable,
+                          loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Возвращает значение из кэша или загружает его
+
+        Args:
+            namespace: Пространство имен (POPULAR, RECENT, CATEGORIES)
+            key: Ключ внутри пространства имен, например параметры запроса
+            loader: Корутина без аргументов, возвращающая готовое к ответу значение
+
+        Returns:
+            Закэшированное или только что загруженное значение
+        """
+        cache_key = (namespace, key)
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            stats = self._stats[f"{namespace}:{key}"]
+
+        if entry is not None and now < entry.fresh_until:
+            stats.hits += 1
+            return entry.value
+
+        inflight = self._inflight.get(cache_key)
+        if entry is not None and now < entry.stale_until:
+            # Устаревшее значение отдается, пока обновление выполняет другой запрос
+            if inflight is not None:
+                stats.stale_hits += 1
+                return entry.value
+            stats.refreshes += 1
+            return await self._load(namespace, key, loader, stats, entry)
+
+        if inflight is not None:
+            stats.coalesced += 1
+            return await asyncio.shield(inflight)
+
+        stats.misses += 1
+        return await self._load(namespace, key, loader, stats, None)
+
+    async def _load(self, namespace, key, loader, stats: KeyStats, stale_entry):
+        cache_key = (namespace, key)
+        with self._lock:
+            generation = self._generations[namespace]
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[cache_key] = future
+        started = time.monotonic()
+        try:
+            value = await loader()
+            future.set_result(value)
+        except Exception as e:
+            stats.errors += 1
+            future.set_exception(e)
+            # Ожидающих может не быть, помечаем исключение как полученное
+            future.exception()
+            if stale_entry is not None:
+                print(f"Response cache refresh error for {namespace}:{key}: {str(e)}")
+                return stale_entry.value
+            raise
+        finally:
+            # Запрос-загрузчик отменен: ожидающие получат отмену вместо зависания
+            if not future.done():
+                future.cancel()
+            self._inflight.pop(cache_key, None)
+
+        now = time.monotonic()
+        stats.loads += 1
+        stats.load_seconds += now - started
+
+        ttl = self.ttls.get(namespace, 0)
+        with self._lock:
+            # Данные изменились во время загрузки: значение отдаем, но не кэшируем
+            if ttl > 0 and self._generations[namespace] == generation:
+                self._entries[cache_key] = _Entry(value, now + ttl, now + ttl + self.stale_ttl)
+        return value
+
+    def invalidate(self, *namespaces: str):
+        """Сбрасывает все записи указанных пространств имен"""
+        with self._lock:
+            for namespace in namespaces:
+                self._generations[namespace] += 1
+                for cache_key in [k for k in self._entries if k[0] == namespace]:
+                    del self._entries[cache_key]
+
+    def clear(self):
+        with self._lock:
+            for namespace in list(self._generations):
+                self._generations[namespace] += 1
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Счетчики по ключам и доля попаданий"""
+        with self._lock:
+            keys = {}
+            for label, key_stats in sorted(self._stats.items()):
+                lookups = (key_stats.hits + key_stats.stale_hits + key_stats.misses
+                           + key_stats.coalesced + key_stats.refreshes)
+                item = asdict(key_stats)
+                item["load_seconds"] = round(key_stats.load_seconds, 4)
+                item["hit_rate"] = round(
+                    (key_stats.hits + key_stats.stale_hits) / lookups, 4) if lookups else 0.0
+                keys[label] = item
+            return {
+                "entries": len(self._entries),
+                "ttls": self.ttls,
+                "stale_ttl": self.stale_ttl,
+                "keys": keys,
+            }
+
+
+response_cache = ResponseCache(
+    {POPULAR: POPULAR_CACHE_TTL, RECENT: RECENT_CACHE_TTL, CATEGORIES: CATEGORIES_CACHE_TTL},
+    RESPONSE_CACHE_STALE_TTL
+)
@@ -0,0 +1,200 @@
+"""
+Полнотекстовый поиск по каталогу курсов.
+
+SQLite: виртуальная таблица FTS5 courses_fts (rowid = ID курса).
+PostgreSQL: таблица course_search с колонкой tsvector и GIN-индексом.
+Индекс охватывает название, описания курса и названия его уроков и
+обновляется инкрементально при изменении курса или его уроков.
+"""
+import re
+from typing import Any, List, Optional
+
+from sqlalchemy import text, select, func, column, table, literal_column, literal, cast
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import SQLAlchemyError
+
+from app.core.config import SEARCH_BACKEND, SEARCH_TS_CONFIG
+from app.core.models import Course, Lesson
+
+# Веса полей: название, описание, подробное описание, названия уроков
+FTS_WEIGHTS = (10.0, 4.0, 1.0, 2.0)
+
+TOKEN_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+SQLITE_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS courses_fts USING fts5(
+        title, description, longdescription, lesson_titles,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+]
+
+POSTGRES_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS course_search (
+        course_id INTEGER PRIMARY KEY REFERENCES courses(id) ON DELETE CASCADE,
+        document TSVECTOR NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_course_search_document ON course_search USING GIN (document)",
+]
+
+courses_fts = table("courses_fts", column("rowid"))
+course_search = table("course_search", column("course_id"), column("document"))
+
+# Устанавливается в ensure_search_index, если индекс не удалось создать
+_index_available = True
+
+
+def _dialect(db_or_engine) -> str:
+    bind = db_or_engine.get_bind() if isinstance(db_or_engine, Session) else db_or_engine
+    return bind.dialect.name
+
+
+def is_search_index_enabled(db: Session) -> bool:
+    """Используется ли полнотекстовый индекс для поиска"""
+    return (SEARCH_BACKEND == "fts" and _index_available
+            and _dialect(db) in ("sqlite", "postgresql"))
+
+
+def ensure_search_index(engine: Engine) -> None:
+    """Создает структуры индекса и заполняет его, если он пуст"""
+    global _index_available
+    dialect = _dialect(engine)
+    if SEARCH_BACKEND != "fts" or dialect not in ("sqlite", "postgresql"):
+        return
+
+    statements = SQLITE_SCHEMA if dialect == "sqlite" else POSTGRES_SCHEMA
+    index_table = "courses_fts" if dialect == "sqlite" else "course_search"
+    try:
+        with engine.begin() as connection:
+            for statement in statements:
+                connection.execute(text(statement))
+            indexed = connection.execute(
+                text(f"SELECT count(*) FROM {index_table}")).scalar()
+            courses = connection.execute(
+                text("SELECT count(*) FROM courses")).scalar()
+    except SQLAlchemyError as e:
+        print(f"Search index is unavailable, falling back to LIKE: {str(e)}")
+        _index_available = False
+        return
+
+    if indexed != courses:
+        with Session(bind=engine) as db:
+            rebuild_search_index(db)
+
+
+def _lesson_titles(db: Session, course_id: int) -> str:
+    titles = db.query(Lesson.title).filter(
+        Lesson.course_id == course_id
+    ).order_by(Lesson.order).all()
+    return "\n".join(title for (title,) in titles)
+
+
+def index_course(db: Session, course_id: int) -> None:
+    """
+    Обновляет запись курса в индексе. Выполняется в транзакции вызывающей
+    стороны, коммит остается за ней.
+    """
+    if not is_search_index_enabled(db):
+        return
+
+    db.flush()
+    course = db.query(
+        Course.title, Course.description, Course.longdescription
+    ).filter(Course.id == course_id).first()
+    if course is None:
+        remove_course_from_index(db, course_id)
+        return
+
+    params = {
+        "course_id": course_id,
+        "title": course.title or "",
+        "description": course.description or "",
+        "longdescription": course.longdescription or "",
+        "lesson_titles": _lesson_titles(db, course_id),
+    }
+
+    if _dialect(db) == "sqlite":
+        db.execute(text("DELETE FROM courses_fts WHERE rowid = :course_id"),
+                   {"course_id": course_id})
+        db.execute(text(
+            "INSERT INTO courses_fts "
+            "(rowid, title, description, longdescription, lesson_titles) "
+            "VALUES (:course_id, :title, :description, :longdescription, :lesson_titles)"
+        ), params)
+    else:
+        params["config"] = SEARCH_TS_CONFIG
+        db.execute(text(
+            "INSERT INTO course_search (course_id, document) VALUES (:course_id, "
+            "setweight(to_tsvector(CAST(:config AS regconfig), :title), 'A') || "
+            "setweight(to_tsvector(CAST(:config AS regconfig), :description), 'B') || "
+            "setweight(to_tsvector(CAST(:config AS regconfig), :lesson_titles), 'B') || "
+            "setweight(to_tsvector(CAST(:config AS regconfig), :longdescription), 'C')) "
+            "ON CONFLICT (course_id) DO UPDATE SET document = EXCLUDED.document"
+        ), params)
+
+
+def remove_course_from_index(db: Session, course_id: int) -> None:
+    """Удаляет курс из индекса в транзакции вызывающей стороны"""
+    if not is_search_index_enabled(db):
+        return
+
+    if _dialect(db) == "sqlite":
+        db.execute(text("DELETE FROM courses_fts WHERE rowid = :course_id"),
+                   {"course_id": course_id})
+    else:
+        db.execute(text("DELETE FROM course_search WHERE course_id = :course_id"),
+                   {"course_id": course_id})
+
+
+def rebuild_search_index(db: Session) -> int:
+    """Полностью перестраивает индекс, возвращает количество курсов"""
+    if not is_search_index_enabled(db):
+        return 0
+
+    index_table = "courses_fts" if _dialect(db) == "sqlite" else "course_search"
+    db.execute(text(f"DELETE FROM {index_table}"))
+    course_ids = [course_id for (course_id,) in db.query(Course.id).all()]
+    for course_id in course_ids:
+        index_course(db, course_id)
+    db.commit()
+    return len(course_ids)
+
+
+def _search_tokens(search: str) -> List[str]:
+    return TOKEN_PATTERN.findall(search.lower())
+
+
+def build_search_subquery(db: Session, search: str) -> Optional[Any]:
+    """
+    Строит подзапрос (course_id, rank) по строке поиска. Каждое слово ищется
+    как префикс, все слова должны присутствовать. Меньший rank - более
+    релевантный курс. None, если в строке нет слов.
+    """
+    tokens = _search_tokens(search)
+    if not tokens:
+        return None
+
+    if _dialect(db) == "sqlite":
+        match_query = " ".join(f'"{token}"*' for token in tokens)
+        return select(
+            courses_fts.c.rowid.label("course_id"),
+            func.bm25(literal_column("courses_fts"), *FTS_WEIGHTS).label("rank")
+        ).select_from(courses_fts).where(
+            literal_column("courses_fts").op("MATCH")(match_query)
+        ).subquery("search_results")
+
+    ts_query = func.to_tsquery(
+        cast(literal(SEARCH_TS_CONFIG), REGCONFIG),
+        " & ".join(f"{token}:*" for token in tokens)
+    )
+    return select(
+        course_search.c.course_id,
+        (-func.ts_rank_cd(course_search.c.document, ts_query)).label("rank")
+    ).where(
+        course_search.c.document.op("@@")(ts_query)
+    ).subquery("search_results")
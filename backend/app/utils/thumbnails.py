@@ -0,0 +1,179 @@
+"""
+Thumbnail cache keyed by file identity
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional, Set
+
+from PIL import Image
+
+from app.core.config import THUMBNAIL_DIR, BASE_URL, THUMBNAIL_CACHE_MAX_BYTES, THUMBNAIL_WORKERS
+
+IMAGE_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.bmp'}
+DEFAULT_ICON_URL = f"{BASE_URL}/path/to/default/icon.png"
+
+
+class ThumbnailCache:
+    """
+    On-disk WebP thumbnail cache.
+
+    Thumbnails are named after the identity of the source file (inode, size
+    and mtime), so a listing only needs a stat() to find out whether the
+    cached thumbnail is still valid. Missing thumbnails are rendered by a
+    background worker pool, and the least recently used ones are evicted
+    once the total size exceeds the byte budget.
+    """
+
+    def __init__(self, root: Path, max_bytes: int, workers: int, thumbnail_size=(100, 100)):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.thumbnail_size = thumbnail_size
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="thumbnail")
+        self._lock = threading.Lock()
+        # thumbnail path -> size in bytes, ordered from least to most recently used
+        self._entries: "OrderedDict[Path, int]" = OrderedDict()
+        self._pending: Set[Path] = set()
+        self._total_bytes = 0
+        self._loaded = False
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.errors = 0
+        self.rendered = 0
+        self.rendered_bytes = 0
+
+    @staticmethod
+    def cache_key(file_path: Path) -> Optional[str]:
+        """Build cache key from file identity, None if file is missing"""
+        try:
+            st = file_path.stat()
+        except OSError:
+            return None
+        identity = f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+        return hashlib.sha1(identity.encode()).hexdigest()[:32]
+
+    def _thumbnail_path(self, file_path: Path, user_username: str) -> Optional[Path]:
+        key = self.cache_key(file_path)
+        if key is None:
+            return None
+        return self.root / user_username / f"th_{key}.webp"
+
+    @staticmethod
+    def _url(thumbnail_path: Path) -> str:
+        user_username = thumbnail_path.parent.name
+        return f"{BASE_URL}/api/thumbnails/{user_username}/{thumbnail_path.name}"
+
+    def _load_index(self):
+        """Rebuild LRU index from thumbnails left by previous runs (lock held)"""
+        if self._loaded:
+            return
+        existing = []
+        for path in self.root.glob("*/th_*.webp"):
+            try:
+                st = path.stat()
+            except OSError:
+                continue
+            existing.append((st.st_mtime, path, st.st_size))
+        for _, path, size in sorted(existing):
+            self._entries[path] = size
+            self._total_bytes += size
+        self._loaded = True
+        self._evict()
+
+    def _evict(self):
+        """Remove least recently used thumbnails over byte budget (lock held)"""
+        while self._total_bytes > self.max_bytes and self._entries:
+            path, size = self._entries.popitem(last=False)
+            self._total_bytes -= size
+            self.evictions += 1
+            path.unlink(missing_ok=True)
+
+    def _render(self, file_path: Path, thumbnail_path: Path):
+        tmp_path = thumbnail_path.with_suffix(".tmp")
+        try:
+            thumbnail_path.parent.mkdir(parents=True, exist_ok=True)
+            with Image.open(file_path) as img:
+                img.thumbnail(self.thumbnail_size)
+                img.save(tmp_path, "WEBP")
+            os.replace(tmp_path, thumbnail_path)
+            size = thumbnail_path.stat().st_size
+        except Exception as e:
+            tmp_path.unlink(missing_ok=True)
+            print(f"Error creating thumbnail: {str(e)}")
+            with self._lock:
+                self.errors += 1
+                self._pending.discard(thumbnail_path)
+            return
+
+        with self._lock:
+            self._pending.discard(thumbnail_path)
+            self.rendered += 1
+            self.rendered_bytes += size
+            self._entries[thumbnail_path] = size
+            self._total_bytes += size
+            self._evict()
+
+    def get_url(self, file_path: Path, user_username: str, filename: Optional[str] = None) -> str:
+        """
+        Return thumbnail URL for file. On a miss the thumbnail is scheduled
+        for rendering and the default icon is returned instead of waiting.
+        The image type is taken from filename when the stored file has no
+        extension of its own.
+        """
+        if Path(filename or file_path.name).suffix.lower() not in IMAGE_EXTENSIONS:
+            return DEFAULT_ICON_URL
+
+        thumbnail_path = self._thumbnail_path(file_path, user_username)
+        if thumbnail_path is None:
+            return DEFAULT_ICON_URL
+
+        with self._lock:
+            self._load_index()
+            if thumbnail_path in self._entries:
+                self._entries.move_to_end(thumbnail_path)
+                self.hits += 1
+                return self._url(thumbnail_path)
+
+            self.misses += 1
+            if thumbnail_path not in self._pending:
+                self._pending.add(thumbnail_path)
+                self._executor.submit(self._render, file_path, thumbnail_path)
+
+        return DEFAULT_ICON_URL
+
+    def invalidate(self, file_path: Path, user_username: str):
+        """Drop cached thumbnail of file. Must be called before file is removed"""
+        thumbnail_path = self._thumbnail_path(file_path, user_username)
+        if thumbnail_path is None:
+            return
+        with self._lock:
+            size = self._entries.pop(thumbnail_path, None)
+            if size is not None:
+                self._total_bytes -= size
+        thumbnail_path.unlink(missing_ok=True)
+
+    def stats(self) -> Dict[str, int]:
+        """Cache counters"""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "errors": self.errors,
+                "rendered": self.rendered,
+                "rendered_bytes": self.rendered_bytes,
+                "entries": len(self._entries),
+                "pending": len(self._pending),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+            }
+
+
+thumbnail_cache = ThumbnailCache(
+    Path(THUMBNAIL_DIR), THUMBNAIL_CACHE_MAX_BYTES, THUMBNAIL_WORKERS)
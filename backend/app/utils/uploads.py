@@ -0,0 +1,306 @@
+"""
+Upload pipeline: a per-request byte cap enforced while the body is received,
+a streaming multipart parser that writes the file part straight to a temp
+file with on-the-fly SHA-256 and size accounting, and throughput metrics
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+
+import anyio
+from fastapi import HTTPException, Request, status
+from fastapi.responses import JSONResponse
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+from app.core.config import BASE_FOLDER_DIR, UPLOAD_MAX_BYTES, UPLOAD_CHUNK_SIZE
+
+# Temp files live on the same filesystem as user storage so the final move is an atomic rename
+UPLOAD_TMP_DIR = Path(BASE_FOLDER_DIR) / ".uploads"
+
+# Allowance for multipart boundaries and part headers on top of the file itself
+MULTIPART_OVERHEAD = 64 * 1024
+
+# Text fields sent next to the file (folder id and the like) are small
+MAX_FIELD_BYTES = 16 * 1024
+
+
+@dataclass
+class StagedUpload:
+    """Upload fully written to a temp file, not yet visible to the user"""
+    path: Path
+    size: int
+    checksum: str
+
+    def discard(self):
+        """Remove the temp file if it was not moved into place"""
+        self.path.unlink(missing_ok=True)
+
+
+@dataclass
+class ReceivedUpload:
+    """File part of a multipart request staged on disk, with the text fields sent next to it"""
+    staged: StagedUpload
+    filename: str
+    fields: Dict[str, str]
+
+
+class UploadMetrics:
+    """Counters for completed, failed and rejected uploads and their throughput"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self.rejected_too_large = 0
+        self.bytes_total = 0
+        self.seconds_total = 0.0
+        self.last_throughput = 0.0
+
+    def record_success(self, size: int, elapsed: float):
+        with self._lock:
+            self.completed += 1
+            self.bytes_total += size
+            self.seconds_total += elapsed
+            self.last_throughput = size / elapsed if elapsed > 0 else 0.0
+
+    def record_failure(self, too_large: bool = False):
+        with self._lock:
+            if too_large:
+                self.rejected_too_large += 1
+            else:
+                self.failed += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "completed": self.completed,
+                "failed": self.failed,
+                "rejected_too_large": self.rejected_too_large,
+                "bytes_total": self.bytes_total,
+                "seconds_total": round(self.seconds_total, 3),
+                "avg_throughput_bytes_per_sec": round(
+                    self.bytes_total / self.seconds_total, 1) if self.seconds_total else 0.0,
+                "last_throughput_bytes_per_sec": round(self.last_throughput, 1),
+                "max_bytes": UPLOAD_MAX_BYTES,
+            }
+
+
+upload_metrics = UploadMetrics()
+
+
+def too_large_error(max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"File exceeds the upload limit of {max_bytes} bytes"
+    )
+
+
+def bad_form_error(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=detail)
+
+
+def _write_chunk(buffer, hasher, chunk: bytes):
+    buffer.write(chunk)
+    hasher.update(chunk)
+
+
+class _UploadForm:
+    """
+    python-multipart callbacks for a form carrying one file. Bytes of the
+    file part are collected in file_data for receive_upload to write out;
+    text fields are kept in memory, at most MAX_FIELD_BYTES each.
+    """
+
+    def __init__(self, file_field: str, charset: str):
+        self.file_field = file_field
+        self.charset = charset
+        self.fields: Dict[str, str] = {}
+        self.filename: Optional[str] = None
+        self.file_data = bytearray()
+        self.file_size = 0
+        self.complete = False
+        self._header_name = b""
+        self._header_value = b""
+        self._disposition = b""
+        self._name = ""
+        self._is_file = False
+        self._value = bytearray()
+
+    def callbacks(self) -> dict:
+        return {
+            "on_part_begin": self.on_part_begin,
+            "on_part_data": self.on_part_data,
+            "on_part_end": self.on_part_end,
+            "on_header_field": self.on_header_field,
+            "on_header_value": self.on_header_value,
+            "on_header_end": self.on_header_end,
+            "on_headers_finished": self.on_headers_finished,
+            "on_end": self.on_end,
+        }
+
+    def _decode(self, value: bytes) -> str:
+        try:
+            return value.decode(self.charset)
+        except (UnicodeDecodeError, LookupError):
+            return value.decode("latin-1")
+
+    def on_part_begin(self):
+        self._disposition = b""
+        self._name = ""
+        self._is_file = False
+        self._value = bytearray()
+
+    def on_header_field(self, data: bytes, start: int, end: int):
+        self._header_name += data[start:end]
+
+    def on_header_value(self, data: bytes, start: int, end: int):
+        self._header_value += data[start:end]
+
+    def on_header_end(self):
+        if self._header_name.lower() == b"content-disposition":
+            self._disposition = self._header_value
+        self._header_name = b""
+        self._header_value = b""
+
+    def on_headers_finished(self):
+        _, options = parse_options_header(self._disposition)
+        if b"name" not in options:
+            raise bad_form_error("Form part without a name")
+        self._name = self._decode(options[b"name"])
+        if b"filename" in options:
+            if self._name != self.file_field or self.filename is not None:
+                raise bad_form_error(f"Only one file is accepted, in the '{self.file_field}' field")
+            self.filename = self._decode(options[b"filename"])
+            self._is_file = True
+
+    def on_part_data(self, data: bytes, start: int, end: int):
+        if self._is_file:
+            self.file_data += data[start:end]
+            self.file_size += end - start
+        else:
+            if len(self._value) + end - start > MAX_FIELD_BYTES:
+                raise bad_form_error(f"Form field '{self._name}' is too large")
+            self._value += data[start:end]
+
+    def on_part_end(self):
+        if not self._is_file:
+            self.fields[self._name] = self._decode(bytes(self._value))
+
+    def on_end(self):
+        self.complete = True
+
+
+async def receive_upload(request: Request, file_field: str = "file", max_bytes: int = UPLOAD_MAX_BYTES,
+                         chunk_size: int = UPLOAD_CHUNK_SIZE) -> ReceivedUpload:
+    """
+    Parse a multipart/form-data body as it arrives and write its file part
+    straight into a temp file, hashing it on the way.
+
+    The body is read from request.stream() instead of Starlette's form
+    parser, which would first spool the file into a temp file of its own
+    and so write every upload twice. The request body is capped by
+    UploadSizeLimitMiddleware; here max_bytes applies to the file part alone.
+    File bytes are buffered up to chunk_size and written in a worker thread
+    so the event loop is never blocked on disk. The temp file is removed if
+    the upload fails, is malformed or exceeds max_bytes.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or b"boundary" not in params:
+        raise bad_form_error("Expected a multipart/form-data body")
+    charset = params.get(b"charset", b"utf-8").decode("latin-1")
+    form = _UploadForm(file_field, charset)
+    parser = MultipartParser(params[b"boundary"], form.callbacks())
+
+    UPLOAD_TMP_DIR.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=UPLOAD_TMP_DIR, suffix=".part")
+    path = Path(tmp_name)
+    hasher = hashlib.sha256()
+
+    async def flush():
+        chunk = bytes(form.file_data)
+        form.file_data.clear()
+        await anyio.to_thread.run_sync(_write_chunk, buffer, hasher, chunk)
+
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            async for data in request.stream():
+                parser.write(data)
+                if form.file_size > max_bytes:
+                    raise too_large_error(max_bytes)
+                if len(form.file_data) >= chunk_size:
+                    await flush()
+            if form.file_data:
+                await flush()
+        if not form.complete:
+            raise bad_form_error("Incomplete multipart body")
+        if form.filename is None:
+            raise HTTPException(
+                status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+                detail=f"Form field '{file_field}' with a file is required"
+            )
+    except MultipartParseError:
+        path.unlink(missing_ok=True)
+        raise bad_form_error("Malformed multipart body")
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+
+    staged = StagedUpload(path=path, size=form.file_size, checksum=hasher.hexdigest())
+    return ReceivedUpload(staged=staged, filename=form.filename, fields=form.fields)
+
+
+class UploadSizeLimitMiddleware:
+    """
+    Cap the request body of upload endpoints. A declared Content-Length over
+    the cap is rejected before anything is read; otherwise bytes are counted
+    as they are received, so chunked bodies without a length are cut off
+    before more than the cap is written to disk.
+    """
+
+    def __init__(self, app, paths: Iterable[str], max_bytes: int = UPLOAD_MAX_BYTES):
+        self.app = app
+        self.paths = set(paths)
+        self.max_bytes = max_bytes
+
+    def _matches(self, scope) -> bool:
+        path = scope["path"]
+        root_path = scope.get("root_path", "")
+        if root_path and path.startswith(root_path):
+            path = path[len(root_path):]
+        return path in self.paths
+
+    async def __call__(self, scope, receive, send):
+        if not (scope["type"] == "http" and scope["method"] == "POST" and self._matches(scope)):
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.max_bytes + MULTIPART_OVERHEAD
+        for name, value in scope["headers"]:
+            if name == b"content-length":
+                if value.isdigit() and int(value) > limit:
+                    upload_metrics.record_failure(too_large=True)
+                    error = too_large_error(self.max_bytes)
+                    response = JSONResponse(
+                        {"detail": error.detail}, status_code=error.status_code)
+                    await response(scope, receive, send)
+                    return
+                break
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised inside receive_upload; the upload route records the failure
+                    raise too_large_error(self.max_bytes)
+            return message
+
+        await self.app(scope, limited_receive, send)
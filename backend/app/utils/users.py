@@ -1,10 +1,14 @@
 """
 User management utilities
 """
+from typing import Optional
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.models import User
 from app.core.schemas import UserCreate
 from app.utils.auth import get_password_hash, verify_password
+from app.utils.hashing import password_hasher
+from app.utils.principals import principal_cache
 
 
 def authenticate_user(db: Session, username_or_email: str, password: str):
@@ -34,8 +38,9 @@ def get_users(db: Session, skip: int = 0, limit: int = 100):
     return db.query(User).offset(skip).limit(limit).all()
 
 
-def create_user(db: Session, user: UserCreate):
-    hashed_password = get_password_hash(user.password)
+def create_user(db: Session, user: UserCreate, hashed_password: Optional[str] = None):
+    if hashed_password is None:
+        hashed_password = get_password_hash(user.password)
     db_user = User(
         username=user.username,
         email=user.email,
@@ -54,6 +59,7 @@ def update_user_vk_id(db: Session, user_id: int, vk_id: str):
         user.vk_id = vk_id
         db.commit()
         db.refresh(user)
+        principal_cache.invalidate(user.username)
     return user
 
 def update_user_password(db: Session, user_id: int, current_password: str, new_password: str):
@@ -72,4 +78,67 @@ def update_user_password(db: Session, user_id: int, current_password: str, new_p
     user.hashed_password = get_password_hash(new_password)
     db.commit()
     db.refresh(user)
-    return user
\ No newline at end of file
+    principal_cache.invalidate(user.username)
+    return user
+
+
+# Асинхронные варианты для AsyncSession
+
+async def authenticate_user_async(db: AsyncSession, username_or_email: str, password: str):
+    user = await get_user_by_username_async(db, username_or_email)
+    if not user:
+        user = await get_user_by_email_async(db, username_or_email)
+    if not user:
+        return False
+    if not await password_hasher.verify(password, user.hashed_password):
+        return False
+
+    # Прозрачное перехэширование после изменения BCRYPT_ROUNDS
+    if password_hasher.needs_rehash(user.hashed_password):
+        user.hashed_password = await password_hasher.hash(password)
+        await db.commit()
+        password_hasher.record_rehash()
+    return user
+
+
+async def get_user_async(db: AsyncSession, user_id: int):
+    return await db.run_sync(get_user, user_id)
+
+
+async def get_user_by_username_async(db: AsyncSession, username: str):
+    return await db.run_sync(get_user_by_username, username)
+
+
+async def get_user_by_email_async(db: AsyncSession, email: str):
+    return await db.run_sync(get_user_by_email, email)
+
+
+async def get_users_async(db: AsyncSession, skip: int = 0, limit: int = 100):
+    return await db.run_sync(get_users, skip, limit)
+
+
+async def create_user_async(db: AsyncSession, user: UserCreate):
+    hashed_password = await password_hasher.hash(user.password)
+    return await db.run_sync(create_user, user, hashed_password)
+
+
+async def update_user_vk_id_async(db: AsyncSession, user_id: int, vk_id: str):
+    return await db.run_sync(update_user_vk_id, user_id, vk_id)
+
+
+async def update_user_password_async(db: AsyncSession, user_id: int, current_password: str, new_password: str):
+    """
+    Асинхронный вариант update_user_password, хэширование выполняется в пуле.
+    """
+    user = await get_user_async(db, user_id)
+    if not user:
+        raise ValueError("Пользователь не найден")
+
+    if not await password_hasher.verify(current_password, user.hashed_password):
+        raise ValueError("Неверный текущий пароль")
+
+    user.hashed_password = await password_hasher.hash(new_password)
+    await db.commit()
+    await db.refresh(user)
+    principal_cache.invalidate(user.username)
+    return user
@@ -3,11 +3,11 @@ VK OAuth implementation
 """
 import httpx
 from fastapi import HTTPException
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.core.config import VK_CLIENT_ID, VK_CLIENT_SECRET, VK_REDIRECT_URI
 from app.core.schemas import UserCreate
-from app.utils.users import get_user_by_username, create_user, update_user_vk_id
+from app.utils.users import get_user_by_username_async, create_user_async, update_user_vk_id_async
 from app.utils.auth import create_access_token, create_refresh_token
 
 
@@ -19,7 +19,7 @@ def vk_login():
     }
 
 
-async def vk_callback(code: str, db: Session):
+async def vk_callback(code: str, db: AsyncSession):
     async with httpx.AsyncClient() as client:
         # Get access token
         token_response = await client.get(
@@ -49,9 +49,10 @@ async def vk_callback(code: str, db: Session):
 
         # Create or get user
         username = f"vk_{vk_user_id}"
-        user = get_user_by_username(db, username)
+        user = await get_user_by_username_async(db, username)
         if not user:
-            user = create_user(
+            # Хэширование пароля выполняется в пуле, а не в цикле событий
+            user = await create_user_async(
                 db,
                 UserCreate(
                     username=username,
@@ -60,7 +61,7 @@ async def vk_callback(code: str, db: Session):
                     role="user"
                 )
             )
-            update_user_vk_id(db, user.id, str(vk_user_id))
+            await update_user_vk_id_async(db, user.id, str(vk_user_id))
 
         # Create tokens
         access_token = create_access_token(
@@ -0,0 +1,7 @@
+"""
+Нагрузочные замеры бэкенда на заполненной базе SQLite.
+
+Заполнение базы:   python -m benchmarks.seed --scale small
+Замеры:            python -m benchmarks.run --scale small --output results.json
+Сравнение прогонов: python -m benchmarks.compare old.json new.json
+"""
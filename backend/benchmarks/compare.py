@@ -0,0 +1,67 @@
+"""
+Сравнение двух файлов результатов benchmarks.run.
+
+Регрессией считается рост p50 или p95 либо падение пропускной способности
+больше чем на --threshold (доля, по умолчанию 0.15). При регрессии код
+завершения 1, что позволяет использовать сравнение в CI.
+
+Запуск: python -m benchmarks.compare baseline.json current.json [--threshold 0.15]
+"""
+import argparse
+import json
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+# Метрика и знак: +1 - больше хуже, -1 - меньше хуже
+METRICS = [("p50_ms", 1), ("p95_ms", 1), ("throughput_rps", -1)]
+
+
+def compare(baseline: Dict, current: Dict, threshold: float) -> Tuple[List[str], List[str]]:
+    """Строки отчета и список регрессий"""
+    lines, regressions = [], []
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            lines.append(f"{name:28} новый сценарий")
+            continue
+        cells = []
+        for metric, direction in METRICS:
+            old, new = base.get(metric), result.get(metric)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            cells.append(f"{metric} {old:.2f} -> {new:.2f} ({change:+.1%})")
+            if change * direction > threshold:
+                regressions.append(f"{name}: {metric} {change:+.1%}")
+        if result.get("queries") is not None and base.get("queries") is not None \
+                and result["queries"] > base["queries"]:
+            cells.append(f"queries {base['queries']} -> {result['queries']}")
+            regressions.append(f"{name}: queries {base['queries']} -> {result['queries']}")
+        lines.append(f"{name:28} " + "  ".join(cells))
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Сравнение результатов замеров")
+    parser.add_argument("baseline", type=Path)
+    parser.add_argument("current", type=Path)
+    parser.add_argument("--threshold", type=float, default=0.15)
+    args = parser.parse_args()
+
+    baseline = json.loads(args.baseline.read_text())
+    current = json.loads(args.current.read_text())
+    if baseline["meta"]["dataset"].get("parameters") != current["meta"]["dataset"].get("parameters"):
+        print("Внимание: прогоны выполнены на разных наборах данных")
+
+    lines, regressions = compare(baseline, current, args.threshold)
+    print("\n".join(lines))
+    if regressions:
+        print("\nРегрессии:")
+        print("\n".join(f"  {item}" for item in regressions))
+        sys.exit(1)
+    print("\nРегрессий нет")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+"""
+Замеры задержки и пропускной способности эндпоинтов на заполненной базе.
+
+Приложение запускается в том же процессе (httpx.ASGITransport), поэтому
+в замеры не попадают сеть и HTTP-сервер. Каждый сценарий сначала
+прогревается, затем выполняется последовательно для расчета перцентилей
+задержки и параллельно для расчета пропускной способности. Результаты
+записываются в JSON для сравнения прогонов: python -m benchmarks.compare
+
+Запуск: python -m benchmarks.run --scale small [--output results.json]
+"""
+import argparse
+import asyncio
+import json
+import platform
+import subprocess
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from benchmarks.seed import seed, load_meta
+from benchmarks.settings import (
+    SCALES, DEFAULT_WORKDIR, BENCH_USERNAME, BENCH_PASSWORD, configure_environment
+)
+
+
+@dataclass
+class Scenario:
+    name: str
+    path: str
+    params: Dict = field(default_factory=dict)
+    method: str = "GET"
+    auth: bool = False
+    form: Optional[Dict] = None
+    # Переопределяют общие --requests и --concurrency для дорогих сценариев
+    requests: Optional[int] = None
+    concurrency: Optional[int] = None
+
+
+SCENARIOS = [
+    Scenario("courses_default", "/courses"),
+    Scenario("courses_page_50", "/courses", {"page": 50}),
+    Scenario("courses_category", "/courses", {"category_id": 3}),
+    Scenario("courses_category_names", "/courses", {"category_names": ["Категория 5", "Категория 7"]}),
+    Scenario("courses_difficulties", "/courses", {"difficulties": ["начинающий", "средний"]}),
+    Scenario("courses_author", "/courses", {"author": "user5"}),
+    Scenario("courses_search", "/courses", {"search": "python"}),
+    Scenario("courses_search_relevance", "/courses", {"search": "основы python", "sort_by": "relevance"}),
+    Scenario("courses_sort_title_asc", "/courses", {"sort_by": "title", "sort_order": "asc"}),
+    Scenario("courses_sort_students", "/courses", {"sort_by": "students_count"}),
+    Scenario("courses_cursor", "/courses", {"cursor": ""}),
+    Scenario("courses_cursor_total", "/courses", {"cursor": "", "include_total": "true"}),
+    Scenario("courses_popular", "/courses/popular"),
+    Scenario("courses_recent", "/courses/recent"),
+    Scenario("course_with_lessons", "/courses/1/with-lessons"),
+    Scenario("course_syllabus", "/courses/1/with-lessons", {"summary": "true"}),
+    Scenario("files_with_thumbnails", "/files", auth=True),
+    Scenario("files_tree", "/files/tree", auth=True),
+    Scenario("token", "/token", method="POST", form={"username": BENCH_USERNAME, "password": BENCH_PASSWORD},
+             requests=20, concurrency=4),
+]
+
+
+def summarize(latencies: List[float]) -> Dict[str, float]:
+    values = np.array(latencies) * 1000
+    p50, p90, p95, p99 = np.percentile(values, [50, 90, 95, 99])
+    return {
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(p50), 3),
+        "p90_ms": round(float(p90), 3),
+        "p95_ms": round(float(p95), 3),
+        "p99_ms": round(float(p99), 3),
+        "max_ms": round(float(values.max()), 3),
+    }
+
+
+async def measure(client, scenario: Scenario, headers: Dict[str, str],
+                  requests: int, concurrency: int, warmup: int) -> Dict:
+    requests = scenario.requests or requests
+    concurrency = scenario.concurrency or concurrency
+    errors = 0
+    query_counts = []
+
+    async def call() -> float:
+        nonlocal errors
+        started = time.perf_counter()
+        response = await client.request(
+            scenario.method, scenario.path, params=scenario.params, data=scenario.form,
+            headers=headers if scenario.auth else None)
+        elapsed = time.perf_counter() - started
+        if response.status_code >= 400:
+            errors += 1
+        if "x-query-count" in response.headers:
+            query_counts.append(int(response.headers["x-query-count"]))
+        return elapsed
+
+    for _ in range(warmup):
+        await call()
+    errors = 0
+    query_counts.clear()
+
+    latencies = [await call() for _ in range(requests)]
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def limited():
+        async with semaphore:
+            return await call()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(limited() for _ in range(requests)))
+    wall = time.perf_counter() - started
+
+    return dict(
+        summarize(latencies),
+        requests=requests,
+        concurrency=concurrency,
+        errors=errors,
+        throughput_rps=round(requests / wall, 2),
+        queries=max(query_counts) if query_counts else None,
+    )
+
+
+async def run_scenarios(scenarios: List[Scenario], requests: int, concurrency: int, warmup: int) -> Dict:
+    import httpx
+    from app.core.database import async_engine
+    from main import app
+
+    results = {}
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench/api") as client:
+            response = await client.post("/token", data={"username": BENCH_USERNAME, "password": BENCH_PASSWORD})
+            response.raise_for_status()
+            headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+            for scenario in scenarios:
+                results[scenario.name] = await measure(client, scenario, headers, requests, concurrency, warmup)
+                result = results[scenario.name]
+                print(f"{scenario.name:28} p50 {result['p50_ms']:9.2f} ms  p95 {result['p95_ms']:9.2f} ms  "
+                      f"{result['throughput_rps']:9.1f} req/s  queries {result['queries']}  errors {result['errors']}")
+    await async_engine.dispose()
+    return results
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замеры эндпоинтов на заполненной базе")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--workdir", type=Path, default=DEFAULT_WORKDIR)
+    parser.add_argument("--output", type=Path, help="Файл результатов JSON")
+    parser.add_argument("--requests", type=int, default=200, help="Запросов на сценарий")
+    parser.add_argument("--concurrency", type=int, default=8, help="Параллельных запросов при замере пропускной способности")
+    parser.add_argument("--warmup", type=int, default=5)
+    parser.add_argument("--scenario", action="append", help="Подстрока имени сценария, можно указать несколько")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--reseed", action="store_true", help="Пересоздать базу перед замерами")
+    args = parser.parse_args()
+
+    dataset = load_meta(args.workdir, args.scale)
+    if args.reseed or dataset.get("seed") != args.seed:
+        print(f"Заполнение базы {args.scale}...")
+        dataset = seed(args.scale, args.workdir, args.seed)
+    else:
+        configure_environment(args.workdir, args.scale)
+
+    scenarios = [s for s in SCENARIOS if not args.scenario or any(part in s.name for part in args.scenario)]
+    results = asyncio.run(run_scenarios(scenarios, args.requests, args.concurrency, args.warmup))
+
+    import sqlalchemy
+    report = {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sqlalchemy": sqlalchemy.__version__,
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "warmup": args.warmup,
+            "dataset": dataset,
+        },
+        "results": results,
+    }
+    output = args.output or args.workdir / f"results-{args.scale}-{datetime.now():%Y%m%d-%H%M%S}.json"
+    output.write_text(json.dumps(report, ensure_ascii=False, indent=2))
+    print(f"Результаты записаны в {output}")
+
+
+if __name__ == "__main__":
+    main()
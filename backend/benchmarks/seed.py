@@ -0,0 +1,277 @@
+"""
+Заполнение базы SQLite синтетическими данными для замеров.
+
+Строки вставляются пакетами через executemany с отключенной синхронизацией
+журнала, данные генерируются numpy из фиксированного зерна, поэтому
+одинаковые масштаб и зерно всегда дают одинаковую базу.
+Популярность курсов распределена по степенному закону: несколько курсов
+собирают большую часть записей, как и в реальном каталоге.
+
+Запуск: python -m benchmarks.seed --scale small [--seed 42] [--workdir DIR]
+"""
+import argparse
+import asyncio
+import io
+import json
+import shutil
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Iterable, Iterator, List
+
+import numpy as np
+
+from benchmarks.settings import (
+    SCALES, Scale, DEFAULT_WORKDIR, BENCH_USERNAME, BENCH_PASSWORD,
+    configure_environment, database_path
+)
+
+BATCH_SIZE = 10_000
+
+TOPICS = [
+    "Python", "JavaScript", "SQL", "Алгоритмы", "Физика", "Химия", "Биология",
+    "Математика", "История", "Rust", "Go", "Docker", "Linux", "Статистика",
+    "Машинное обучение", "Три.js", "React", "FastAPI", "Геометрия", "Экономика",
+]
+KINDS = ["Основы", "Практикум", "Интенсив", "Введение в", "Продвинутый курс", "Задачи по"]
+DIFFICULTIES = ["начинающий", "средний", "продвинутый"]
+PARAGRAPH = (
+    "<p>В этом уроке разбираются ключевые понятия темы, приводятся примеры "
+    "и задачи для самостоятельной работы. Материал сопровождается интерактивной "
+    "сценой, которую можно вращать и масштабировать.</p>\n"
+)
+
+
+def meta_path(workdir: Path, scale: str) -> Path:
+    return workdir / f"bench-{scale}.json"
+
+
+def load_meta(workdir: Path, scale: str) -> dict:
+    path = meta_path(workdir, scale)
+    return json.loads(path.read_text()) if path.exists() else {}
+
+
+def batches(rows: Iterable[dict], size: int = BATCH_SIZE) -> Iterator[List[dict]]:
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def enrollment_pairs(rng: np.random.Generator, scale: Scale, course_order: np.ndarray) -> np.ndarray:
+    """
+    Уникальные пары (user_id, course_id). Ранг популярности курса выбирается
+    по закону Ципфа, course_order переводит ранг в ID курса, чтобы популярные
+    курсы не совпадали с первыми ID
+    """
+    total = min(scale.enrollments, scale.users * scale.courses)
+    found = np.empty(0, dtype=np.int64)
+    while found.size < total:
+        draw = int((total - found.size) * 1.3) + 1000
+        ranks = rng.zipf(1.3, draw)
+        ranks = ranks[ranks <= scale.courses]
+        users = rng.integers(1, scale.users + 1, ranks.size, dtype=np.int64)
+        courses = course_order[ranks - 1] + 1
+        found = np.unique(np.concatenate([found, users * (scale.courses + 1) + courses]))
+    found = rng.permutation(found)[:total]
+    return np.stack([found // (scale.courses + 1), found % (scale.courses + 1)], axis=1)
+
+
+def seed(scale_name: str, workdir: Path = DEFAULT_WORKDIR, random_seed: int = 42) -> dict:
+    scale = SCALES[scale_name]
+    workdir = Path(workdir)
+    db_path = database_path(workdir, scale_name)
+    for path in (db_path, Path(f"{db_path}-wal"), Path(f"{db_path}-shm"), meta_path(workdir, scale_name)):
+        path.unlink(missing_ok=True)
+    for name in (f"storage-{scale_name}", f"thumbnails-{scale_name}"):
+        shutil.rmtree(workdir / name, ignore_errors=True)
+
+    configure_environment(workdir, scale_name)
+    # Модули приложения читают настройки окружения при импорте
+    from sqlalchemy import text
+    from app.core.migrate import upgrade_database
+    from app.core.database import engine
+    from app.core.models import (
+        User, Category, Course, CourseEnrollment, Lesson, course_categories
+    )
+    from app.utils.auth import get_password_hash
+    from app.core.config import SEARCH_BACKEND
+
+    started = time.perf_counter()
+    rng = np.random.default_rng(random_seed)
+    upgrade_database()
+
+    now = datetime(2026, 1, 1)
+    hashed_password = get_password_hash(BENCH_PASSWORD)
+    teachers = max(1, scale.users // 100)
+
+    pairs = enrollment_pairs(rng, scale, rng.permutation(scale.courses).astype(np.int64))
+    students_count = np.bincount(pairs[:, 1], minlength=scale.courses + 1)
+
+    difficulty = rng.integers(0, len(DIFFICULTIES), scale.courses)
+    topic = rng.integers(0, len(TOPICS), scale.courses)
+    kind = rng.integers(0, len(KINDS), scale.courses)
+    course_age = rng.integers(0, 365 * 24 * 3600, scale.courses)
+    lesson_courses = min(scale.lesson_courses, scale.courses)
+
+    def users():
+        for i in range(1, scale.users + 1):
+            username = BENCH_USERNAME if i == 1 else f"user{i}"
+            yield {
+                "id": i, "username": username, "email": f"{username}@bench.local",
+                "hashed_password": hashed_password,
+                "role": "teacher" if 1 < i <= teachers + 1 else "user", "disabled": False,
+            }
+
+    def categories():
+        for i in range(1, scale.categories + 1):
+            yield {"id": i, "name": f"Категория {i}", "slug": f"category-{i}",
+                   "description": f"Курсы категории {i}"}
+
+    def course_title(i: int) -> str:
+        return f"{KINDS[kind[i - 1]]} {TOPICS[topic[i - 1]]} {i}"
+
+    def courses():
+        for i in range(1, scale.courses + 1):
+            created = now - timedelta(seconds=int(course_age[i - 1]))
+            yield {
+                "id": i, "title": course_title(i),
+                "description": f"Курс по теме {TOPICS[topic[i - 1]]} для уровня {DIFFICULTIES[difficulty[i - 1]]}",
+                "longdescription": PARAGRAPH,
+                "difficulty": DIFFICULTIES[difficulty[i - 1]],
+                "author": f"user{2 + i % teachers}",
+                "lessons_count": scale.lessons_per_course if i <= lesson_courses else 0,
+                "students_count": int(students_count[i]),
+                "created_at": created, "updated_at": created,
+            }
+
+    def course_category_links():
+        per_course = rng.integers(1, 4, scale.courses)
+        for i in range(1, scale.courses + 1):
+            for category_id in rng.choice(scale.categories, per_course[i - 1], replace=False):
+                yield {"course_id": i, "category_id": int(category_id) + 1}
+
+    def enrollments():
+        progress = rng.integers(0, 101, len(pairs))
+        age = rng.integers(0, 180 * 24 * 3600, len(pairs))
+        for n, (user_id, course_id) in enumerate(pairs):
+            enrolled = now - timedelta(seconds=int(age[n]))
+            yield {
+                "user_id": int(user_id), "course_id": int(course_id),
+                "progress": float(progress[n]), "completed": bool(progress[n] == 100),
+                "enrolled_at": enrolled, "last_accessed_at": enrolled,
+            }
+
+    content = PARAGRAPH * 12
+    scene = json.dumps({"objects": [{"type": "box", "position": [i, 0, 0]} for i in range(20)]})
+
+    def lessons():
+        for course_id in range(1, lesson_courses + 1):
+            for order in range(1, scale.lessons_per_course + 1):
+                has_scene = order % 3 == 0
+                yield {
+                    "course_id": course_id, "title": f"Урок {order}. {TOPICS[topic[course_id - 1]]}",
+                    "content": content, "order": order,
+                    "scene_data": scene if has_scene else None,
+                    "content_size": len(content.encode("utf-8")),
+                    "scene_size": len(scene) if has_scene else 0,
+                    "created_at": now, "updated_at": now,
+                }
+
+    counts = {}
+    with engine.begin() as connection:
+        connection.exec_driver_sql("PRAGMA synchronous=OFF")
+        for name, table, rows in (
+            ("users", User.__table__, users()),
+            ("categories", Category.__table__, categories()),
+            ("courses", Course.__table__, courses()),
+            ("course_categories", course_categories, course_category_links()),
+            ("enrollments", CourseEnrollment.__table__, enrollments()),
+            ("lessons", Lesson.__table__, lessons()),
+        ):
+            counts[name] = 0
+            for batch in batches(rows):
+                connection.execute(table.insert(), batch)
+                counts[name] += len(batch)
+
+        # Индекс поиска заполняется одной вставкой вместо rebuild_search_index по курсу
+        if engine.dialect.name == "sqlite" and SEARCH_BACKEND == "fts":
+            lesson_titles = "\n".join(
+                f"Урок {order}. {{topic}}" for order in range(1, scale.lessons_per_course + 1))
+            connection.execute(text("DELETE FROM courses_fts"))
+            connection.execute(text(
+                "INSERT INTO courses_fts (rowid, title, description, longdescription, lesson_titles) "
+                "VALUES (:id, :title, :description, :longdescription, :lesson_titles)"
+            ), [
+                {"id": row["id"], "title": row["title"], "description": row["description"],
+                 "longdescription": row["longdescription"],
+                 "lesson_titles": lesson_titles.format(topic=TOPICS[topic[row["id"] - 1]])
+                 if row["id"] <= lesson_courses else ""}
+                for row in courses()
+            ])
+        connection.exec_driver_sql("ANALYZE")
+
+    counts["files"] = asyncio.run(upload_files(scale, rng))
+
+    meta = {
+        "scale": scale_name,
+        "seed": random_seed,
+        "parameters": scale.as_dict(),
+        "counts": counts,
+        "seed_seconds": round(time.perf_counter() - started, 2),
+        "database_bytes": db_path.stat().st_size,
+    }
+    meta_path(workdir, scale_name).write_text(json.dumps(meta, ensure_ascii=False, indent=2))
+    return meta
+
+
+def _image(rng: np.random.Generator, size=(640, 480)) -> bytes:
+    from PIL import Image
+    pixels = rng.integers(0, 256, (size[1] // 16, size[0] // 16, 3), dtype=np.uint8)
+    image = Image.fromarray(pixels).resize(size)
+    buffer = io.BytesIO()
+    image.save(buffer, "JPEG", quality=85)
+    return buffer.getvalue()
+
+
+async def upload_files(scale: Scale, rng: np.random.Generator) -> int:
+    """Файлы пользователя bench загружаются через API, как это делает клиент"""
+    import httpx
+    from app.core.database import async_engine
+    from main import app
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench/api") as client:
+        response = await client.post("/token", data={"username": BENCH_USERNAME, "password": BENCH_PASSWORD})
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        # Каждое четвертое изображение повторяет содержимое предыдущего
+        images = [_image(rng) for _ in range(max(1, scale.files * 3 // 4))]
+        for i in range(scale.files):
+            if i % 5 == 4:
+                name, data, media_type = f"notes-{i}.txt", (PARAGRAPH * 20).encode(), "text/plain"
+            else:
+                name, data, media_type = f"photo-{i}.jpg", images[i % len(images)], "image/jpeg"
+            response = await client.post("/files", files={"file": (name, data, media_type)}, headers=headers)
+            response.raise_for_status()
+    # Соединения aiosqlite держат потоки, которые не дают процессу завершиться
+    await async_engine.dispose()
+    return scale.files
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Заполнение базы для замеров")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--workdir", type=Path, default=DEFAULT_WORKDIR)
+    args = parser.parse_args()
+    meta = seed(args.scale, args.workdir, args.seed)
+    print(json.dumps(meta, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
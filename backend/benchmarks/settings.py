@@ -0,0 +1,51 @@
+"""
+Масштабы наборов данных и окружение приложения для замеров.
+Переменные окружения должны быть заданы до импорта app.core.config,
+поэтому модули приложения импортируются только после configure_environment().
+"""
+import os
+from dataclasses import dataclass, asdict
+from pathlib import Path
+
+
+@dataclass(frozen=True)
+class Scale:
+    users: int
+    courses: int
+    enrollments: int
+    categories: int = 20
+    # Уроки создаются только для первых lesson_courses курсов
+    lesson_courses: int = 1000
+    lessons_per_course: int = 10
+    files: int = 50
+
+    def as_dict(self) -> dict:
+        return asdict(self)
+
+
+SCALES = {
+    "small": Scale(users=1_000, courses=1_000, enrollments=10_000),
+    "medium": Scale(users=10_000, courses=10_000, enrollments=100_000),
+    "large": Scale(users=50_000, courses=100_000, enrollments=1_000_000),
+}
+
+DEFAULT_WORKDIR = Path(os.getenv("BENCHMARK_DIR", Path(__file__).resolve().parent / ".data"))
+
+# Пользователь для замеров /token и /files
+BENCH_USERNAME = "bench"
+BENCH_PASSWORD = "bench-password"
+
+
+def database_path(workdir: Path, scale: str) -> Path:
+    return workdir / f"bench-{scale}.db"
+
+
+def configure_environment(workdir: Path, scale: str):
+    """Направляет приложение в отдельную базу и каталоги файлов для масштаба"""
+    workdir.mkdir(parents=True, exist_ok=True)
+    os.environ["DATABASE_URL"] = f"sqlite:///{database_path(workdir, scale)}"
+    os.environ.pop("ASYNC_DATABASE_URL", None)
+    os.environ["BASE_FOLDER_DIR"] = str(workdir / f"storage-{scale}")
+    os.environ["THUMBNAIL_DIR"] = str(workdir / f"thumbnails-{scale}")
+    # Заголовок X-Query-Count нужен для записи числа запросов к базе
+    os.environ.setdefault("QUERY_COUNT_HEADER", "true")
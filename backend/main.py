@@ -3,17 +3,36 @@ FastAPI application entry point
 """
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 import os
 
-from app.core.config import CORS_ORIGINS, THUMBNAIL_DIR, ENVIRONMENT
-from app.core.create_tables import create_tables
-from app.api import auth, files, users, courses
+from app.core.config import (
+    CORS_ORIGINS, THUMBNAIL_DIR, ENVIRONMENT, METRICS_ENABLED, MIGRATE_ON_STARTUP,
+    STATIC_CACHE_CONTROL, THUMBNAIL_CACHE_CONTROL
+)
+from app.core.migrate import upgrade_database
+from app.api import auth, files, users, courses, metrics
+from app.core.database import engine, async_engine
+from app.utils.uploads import UploadSizeLimitMiddleware
+from app.utils.http_cache import CachedStaticFiles
+from app.utils.compression import CompressionMiddleware
+from app.utils.metrics import MetricsMiddleware
+from app.utils.queries import QueryCounterMiddleware, instrument_queries
+from app.utils.access_times import access_time_buffer
+from app.utils.recommendations import recommendation_engine
 
 
 async def lifespan(app: FastAPI):
-    create_tables()
+    if MIGRATE_ON_STARTUP:
+        upgrade_database()
+    # Build the recommendation index in the background so the first requests don't wait for it
+    recommendation_engine.refresh_if_stale()
+    access_time_buffer.start()
     yield
+    # Buffered course access times are written before the process exits
+    await access_time_buffer.stop()
+    # Close pooled connections; aiosqlite worker threads otherwise keep the process alive
+    await async_engine.dispose()
+    engine.dispose()
 
 # Disable OpenAPI docs in production
 docs_url = None if ENVIRONMENT == "production" else "/docs"
@@ -36,22 +55,42 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Reject oversized uploads before the multipart body is parsed
+app.add_middleware(UploadSizeLimitMiddleware, paths=["/files"])
+
+# Compress large text responses (brotli or gzip)
+app.add_middleware(CompressionMiddleware)
+
+# Request latency and SQL statement metrics, exposed at /metrics
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# Count SQL statements per request, log N+1 patterns and exceeded query budgets
+instrument_queries(engine)
+instrument_queries(async_engine.sync_engine)
+app.add_middleware(QueryCounterMiddleware)
+
 # Define uploads directory path
-UPLOADS_DIR = os.path.join(os.getcwd(), "static", "uploads")
+STATIC_DIR = os.path.join(os.getcwd(), "static")
+UPLOADS_DIR = os.path.join(STATIC_DIR, "uploads")
 COURSE_IMAGES_DIR = os.path.join(UPLOADS_DIR, "course_images")
 
 # Static files for thumbnails
-app.mount("/thumbnails", StaticFiles(directory=THUMBNAIL_DIR), name="thumbnails")
+app.mount("/thumbnails", CachedStaticFiles(directory=THUMBNAIL_DIR,
+          cache_control=THUMBNAIL_CACHE_CONTROL), name="thumbnails")
 
 # Static files for course images
-app.mount("/static", StaticFiles(directory=os.path.join(os.getcwd(),
-          "static")), name="static")
+# (.br/.gz siblings made by python -m app.core.precompress_static are preferred)
+app.mount("/static", CachedStaticFiles(directory=STATIC_DIR,
+          cache_control=STATIC_CACHE_CONTROL, precompressed=True), name="static")
 
 # Include routers
 app.include_router(auth.router, tags=["auth"])
 app.include_router(files.router, tags=["files"])
 app.include_router(users.router, tags=["users"])
 app.include_router(courses.router, tags=["courses"])
+if METRICS_ENABLED:
+    app.include_router(metrics.router, tags=["metrics"])
 
 if __name__ == "__main__":
     import uvicorn
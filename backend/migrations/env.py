@@ -0,0 +1,55 @@
+"""
+Окружение Alembic: URL и метаданные берутся из приложения
+"""
+from logging.config import fileConfig
+
+from alembic import context
+
+from app.core.database import Base, engine
+import app.core.models  # noqa: F401 - регистрация моделей в метаданных
+
+config = context.config
+
+if config.config_file_name is not None and config.attributes.get("configure_logger", True):
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+
+def include_object(obj, name, type_, reflected, compare_to):
+    """Таблицы вне моделей (индекс поиска, служебные таблицы) не сравниваются"""
+    if type_ == "table" and reflected and compare_to is None:
+        return False
+    return True
+
+
+def configure(**kwargs):
+    context.configure(
+        target_metadata=target_metadata,
+        include_object=include_object,
+        # SQLite не умеет ALTER большинства конструкций, изменения идут через копию таблицы
+        render_as_batch=True,
+        # Каждая миграция в своей транзакции: CREATE INDEX CONCURRENTLY
+        # выполняется в autocommit_block между ними
+        transaction_per_migration=True,
+        **kwargs
+    )
+
+
+def run_migrations_offline():
+    configure(url=str(engine.url), literal_binds=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    with engine.connect() as connection:
+        configure(connection=connection)
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,237 @@
+"""Baseline schema
+
+Создает таблицы новой базы. База, созданная до перехода на миграции
+функцией create_tables(), доводится до той же схемы: добавляются колонки,
+появившиеся в моделях позже, недостающие индексы, а на PostgreSQL колонки
+CompressedText переводятся из TEXT в BYTEA.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# Колонки, появившиеся в моделях после создания таблиц: (таблица, колонка, DDL)
+MISSING_COLUMNS = [
+    ("courses", "students_count",
+     "ALTER TABLE courses ADD COLUMN students_count INTEGER NOT NULL DEFAULT 0"),
+    ("user_files", "size", "ALTER TABLE user_files ADD COLUMN size BIGINT"),
+    ("user_files", "checksum", "ALTER TABLE user_files ADD COLUMN checksum VARCHAR(64)"),
+    ("user_files", "blob_id",
+     "ALTER TABLE user_files ADD COLUMN blob_id INTEGER REFERENCES file_blobs(id)"),
+    ("lessons", "content_size", "ALTER TABLE lessons ADD COLUMN content_size INTEGER"),
+    ("lessons", "scene_size", "ALTER TABLE lessons ADD COLUMN scene_size INTEGER"),
+]
+
+# Текстовые колонки, перешедшие на CompressedText: (таблица, колонка)
+COMPRESSED_COLUMNS = [
+    ("lessons", "content"),
+    ("lessons", "scene_data"),
+]
+
+# (имя, таблица, колонки, уникальный)
+INDEXES = [
+    ("ix_users_id", "users", ["id"], False),
+    ("ix_users_username", "users", ["username"], True),
+    ("ix_users_email", "users", ["email"], True),
+    ("ix_file_blobs_id", "file_blobs", ["id"], False),
+    ("ix_file_blobs_checksum", "file_blobs", ["checksum"], True),
+    ("ix_categories_id", "categories", ["id"], False),
+    ("ix_categories_name", "categories", ["name"], True),
+    ("ix_categories_slug", "categories", ["slug"], True),
+    ("ix_courses_id", "courses", ["id"], False),
+    ("ix_courses_title", "courses", ["title"], False),
+    ("ix_courses_students_count", "courses", ["students_count"], False),
+    ("ix_refresh_tokens_id", "refresh_tokens", ["id"], False),
+    ("ix_refresh_tokens_token", "refresh_tokens", ["token"], True),
+    ("ix_user_files_id", "user_files", ["id"], False),
+    ("ix_user_files_blob_id", "user_files", ["blob_id"], False),
+    ("ix_course_enrollments_id", "course_enrollments", ["id"], False),
+    ("ix_lessons_id", "lessons", ["id"], False),
+]
+
+
+def create_missing_tables(existing):
+    if "users" not in existing:
+        op.create_table(
+            "users",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("username", sa.String(), nullable=False),
+            sa.Column("email", sa.String(), nullable=False),
+            sa.Column("hashed_password", sa.String(), nullable=False),
+            sa.Column("role", sa.Enum("admin", "teacher", "user", name="userrole"), nullable=False),
+            sa.Column("disabled", sa.Boolean(), nullable=False),
+            sa.Column("vk_id", sa.String(), nullable=True),
+            sa.PrimaryKeyConstraint("id"),
+            sa.UniqueConstraint("vk_id"),
+        )
+    if "file_blobs" not in existing:
+        op.create_table(
+            "file_blobs",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("checksum", sa.String(length=64), nullable=False),
+            sa.Column("size", sa.BigInteger(), nullable=False),
+            sa.Column("ref_count", sa.Integer(), nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint("id"),
+        )
+    if "categories" not in existing:
+        op.create_table(
+            "categories",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("name", sa.String(), nullable=False),
+            sa.Column("slug", sa.String(), nullable=False),
+            sa.Column("description", sa.Text(), nullable=True),
+            sa.PrimaryKeyConstraint("id"),
+        )
+    if "courses" not in existing:
+        op.create_table(
+            "courses",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("title", sa.String(), nullable=False),
+            sa.Column("description", sa.Text(), nullable=False),
+            sa.Column("longdescription", sa.Text(), nullable=True),
+            sa.Column("difficulty", sa.Enum("начинающий", "средний", "продвинутый",
+                                            name="coursedifficulty"), nullable=False),
+            sa.Column("author", sa.String(), nullable=False),
+            sa.Column("image_url", sa.String(), nullable=True),
+            sa.Column("lessons_count", sa.Integer(), nullable=False),
+            sa.Column("students_count", sa.Integer(), server_default="0", nullable=False),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+            sa.Column("updated_at", sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint("id"),
+        )
+    if "refresh_tokens" not in existing:
+        op.create_table(
+            "refresh_tokens",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("token", sa.String(), nullable=False),
+            sa.Column("expires_at", sa.DateTime(), nullable=False),
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("id"),
+        )
+    if "user_files" not in existing:
+        op.create_table(
+            "user_files",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.Column("filename", sa.String(), nullable=False),
+            sa.Column("relative_path", sa.String(), nullable=False),
+            sa.Column("is_folder", sa.Boolean(), nullable=False),
+            sa.Column("parent_id", sa.Integer(), nullable=True),
+            sa.Column("size", sa.BigInteger(), nullable=True),
+            sa.Column("checksum", sa.String(length=64), nullable=True),
+            sa.Column("blob_id", sa.Integer(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+            sa.Column("updated_at", sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+            sa.ForeignKeyConstraint(["parent_id"], ["user_files.id"], ondelete="CASCADE"),
+            sa.ForeignKeyConstraint(["blob_id"], ["file_blobs.id"]),
+            sa.PrimaryKeyConstraint("id"),
+        )
+    if "course_categories" not in existing:
+        op.create_table(
+            "course_categories",
+            sa.Column("course_id", sa.Integer(), nullable=False),
+            sa.Column("category_id", sa.Integer(), nullable=False),
+            sa.ForeignKeyConstraint(["course_id"], ["courses.id"], ondelete="CASCADE"),
+            sa.ForeignKeyConstraint(["category_id"], ["categories.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("course_id", "category_id"),
+        )
+    if "course_enrollments" not in existing:
+        op.create_table(
+            "course_enrollments",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("user_id", sa.Integer(), nullable=False),
+            sa.Column("course_id", sa.Integer(), nullable=False),
+            sa.Column("progress", sa.Float(), nullable=False),
+            sa.Column("completed", sa.Boolean(), nullable=False),
+            sa.Column("enrolled_at", sa.DateTime(), nullable=True),
+            sa.Column("last_accessed_at", sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+            sa.ForeignKeyConstraint(["course_id"], ["courses.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("id"),
+        )
+    if "lessons" not in existing:
+        op.create_table(
+            "lessons",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("course_id", sa.Integer(), nullable=False),
+            sa.Column("title", sa.String(), nullable=False),
+            sa.Column("content", sa.LargeBinary(), nullable=False),
+            sa.Column("order", sa.Integer(), nullable=False),
+            sa.Column("scene_data", sa.LargeBinary(), nullable=True),
+            sa.Column("content_size", sa.Integer(), nullable=True),
+            sa.Column("scene_size", sa.Integer(), nullable=True),
+            sa.Column("created_at", sa.DateTime(), nullable=True),
+            sa.Column("updated_at", sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(["course_id"], ["courses.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("id"),
+        )
+
+
+def add_missing_columns(existing):
+    """Колонки, которых нет в таблицах, созданных старыми версиями моделей"""
+    inspector = sa.inspect(op.get_bind())
+    columns = {}
+    added = set()
+    for table, column, ddl in MISSING_COLUMNS:
+        if table not in existing:
+            continue
+        if table not in columns:
+            columns[table] = {c["name"] for c in inspector.get_columns(table)}
+        if column not in columns[table]:
+            op.execute(ddl)
+            added.add((table, column))
+
+    if ("courses", "students_count") in added:
+        # Заполняем новый счетчик по существующим записям на курсы
+        op.execute(
+            "UPDATE courses SET students_count = ("
+            "SELECT COUNT(*) FROM course_enrollments WHERE course_enrollments.course_id = courses.id)"
+        )
+
+
+def convert_compressed_columns(existing):
+    """
+    Перевод колонок CompressedText из TEXT в BYTEA на PostgreSQL.
+    SQLite хранит байты в колонке TEXT без изменения схемы.
+    Сжатие существующих строк: python -m app.core.compress_lessons
+    """
+    bind = op.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    inspector = sa.inspect(bind)
+    for table, column in COMPRESSED_COLUMNS:
+        if table not in existing:
+            continue
+        columns = {c["name"]: c for c in inspector.get_columns(table)}
+        if column in columns and str(columns[column]["type"]).upper() == "TEXT":
+            op.execute(
+                f"ALTER TABLE {table} ALTER COLUMN {column} TYPE BYTEA "
+                f"USING convert_to({column}, 'UTF8')"
+            )
+
+
+def upgrade():
+    existing = set(sa.inspect(op.get_bind()).get_table_names())
+    create_missing_tables(existing)
+    add_missing_columns(existing)
+    convert_compressed_columns(existing)
+    for name, table, columns, unique in INDEXES:
+        op.create_index(name, table, columns, unique=unique, if_not_exists=True)
+
+
+def downgrade():
+    for table in ("lessons", "course_enrollments", "course_categories", "user_files",
+                  "refresh_tokens", "courses", "categories", "file_blobs", "users"):
+        op.drop_table(table)
+    sa.Enum(name="coursedifficulty").drop(op.get_bind(), checkfirst=True)
+    sa.Enum(name="userrole").drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,57 @@
+"""Full-text search index structures
+
+SQLite: виртуальная таблица FTS5 courses_fts, PostgreSQL: таблица course_search
+с tsvector и GIN-индексом. Индекс заполняется при запуске приложения
+(app.utils.search.ensure_search_index), если в нем не хватает курсов.
+Если FTS недоступен (SQLite без FTS5), миграция проходит без индекса,
+а поиск работает через LIKE.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+SQLITE_SCHEMA = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS courses_fts USING fts5(
+        title, description, longdescription, lesson_titles,
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+]
+
+POSTGRES_SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS course_search (
+        course_id INTEGER PRIMARY KEY REFERENCES courses(id) ON DELETE CASCADE,
+        document TSVECTOR NOT NULL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_course_search_document ON course_search USING GIN (document)",
+]
+
+
+def upgrade():
+    bind = op.get_bind()
+    statements = {"sqlite": SQLITE_SCHEMA, "postgresql": POSTGRES_SCHEMA}.get(bind.dialect.name, [])
+    try:
+        with bind.begin_nested():
+            for statement in statements:
+                op.execute(statement)
+    except sa.exc.DBAPIError as e:
+        print(f"Search index is unavailable, falling back to LIKE: {str(e)}")
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == "sqlite":
+        op.execute("DROP TABLE IF EXISTS courses_fts")
+    elif bind.dialect.name == "postgresql":
+        op.execute("DROP TABLE IF EXISTS course_search")
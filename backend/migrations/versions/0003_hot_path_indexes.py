@@ -0,0 +1,88 @@
+"""Composite indexes for hot lookups, unique enrollment per user and course
+
+- course_enrollments(user_id, course_id), уникальный: проверка записи на курс
+  и запись. Перед созданием повторные записи сливаются в самую раннюю
+  (прогресс, завершение и последний доступ берутся максимальными), затем
+  пересчитывается courses.students_count.
+- lessons(course_id, order): списки уроков курса.
+- user_files(user_id, parent_id, is_folder): содержимое папки.
+- courses(created_at): /recent и сортировка каталога по умолчанию.
+
+На PostgreSQL индексы строятся CREATE INDEX CONCURRENTLY вне транзакции и
+не блокируют запись. Недостроенный (INVALID) индекс прошлой попытки
+удаляется и строится заново.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18
+"""
+from alembic import op
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+# (имя, таблица, колонки, уникальный)
+INDEXES = [
+    ("uq_course_enrollments_user_course", "course_enrollments", ["user_id", "course_id"], True),
+    ("ix_lessons_course_id_order", "lessons", ["course_id", "order"], False),
+    ("ix_user_files_user_id_parent_id_is_folder", "user_files", ["user_id", "parent_id", "is_folder"], False),
+    ("ix_courses_created_at", "courses", ["created_at"], False),
+]
+
+
+def merge_duplicate_enrollments():
+    duplicates = (
+        "SELECT MIN(id) FROM course_enrollments GROUP BY user_id, course_id HAVING COUNT(*) > 1"
+    )
+    same_pair = (
+        "FROM course_enrollments d WHERE d.user_id = course_enrollments.user_id "
+        "AND d.course_id = course_enrollments.course_id"
+    )
+    result = op.get_bind().exec_driver_sql(
+        f"SELECT COUNT(*) FROM ({duplicates}) AS duplicates").scalar()
+    if not result:
+        return
+    op.execute(
+        "UPDATE course_enrollments SET "
+        f"progress = (SELECT MAX(d.progress) {same_pair}), "
+        f"completed = (SELECT MAX(CASE WHEN d.completed THEN 1 ELSE 0 END) {same_pair}) = 1, "
+        f"last_accessed_at = (SELECT MAX(d.last_accessed_at) {same_pair}) "
+        f"WHERE id IN ({duplicates})"
+    )
+    op.execute(
+        "DELETE FROM course_enrollments WHERE id NOT IN "
+        "(SELECT keep_id FROM (SELECT MIN(id) AS keep_id FROM course_enrollments "
+        "GROUP BY user_id, course_id) AS keep)"
+    )
+    op.execute(
+        "UPDATE courses SET students_count = ("
+        "SELECT COUNT(*) FROM course_enrollments WHERE course_enrollments.course_id = courses.id)"
+    )
+    print(f"Merged duplicate enrollments of {result} user/course pairs")
+
+
+def upgrade():
+    merge_duplicate_enrollments()
+
+    if op.get_bind().dialect.name != "postgresql":
+        for name, table, columns, unique in INDEXES:
+            op.create_index(name, table, columns, unique=unique, if_not_exists=True)
+        return
+
+    with op.get_context().autocommit_block():
+        for name, table, columns, unique in INDEXES:
+            op.execute(
+                "DO $$ BEGIN "
+                "IF EXISTS (SELECT 1 FROM pg_class c JOIN pg_index i ON i.indexrelid = c.oid "
+                f"WHERE c.relname = '{name}' AND NOT i.indisvalid) "
+                f"THEN DROP INDEX {name}; END IF; END $$"
+            )
+            op.create_index(name, table, columns, unique=unique, if_not_exists=True,
+                            postgresql_concurrently=True)
+
+
+def downgrade():
+    for name, table, columns, unique in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
@@ -0,0 +1,50 @@
+"""Lesson completions and completed lessons counter
+
+- lesson_completions: пройденные уроки записи на курс, по одной строке
+  на пару (запись, урок).
+- course_enrollments.completed_lessons: число пройденных уроков, из которого
+  пересчитываются progress и completed. У существующих записей счетчик 0,
+  прогресс, выставленный клиентом, сохраняется до первой отметки урока.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = "0004"
+down_revision = "0003"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    columns = {c["name"] for c in inspector.get_columns("course_enrollments")}
+    if "completed_lessons" not in columns:
+        op.add_column("course_enrollments", sa.Column(
+            "completed_lessons", sa.Integer(), server_default="0", nullable=False))
+
+    if "lesson_completions" not in inspector.get_table_names():
+        op.create_table(
+            "lesson_completions",
+            sa.Column("id", sa.Integer(), nullable=False),
+            sa.Column("enrollment_id", sa.Integer(), nullable=False),
+            sa.Column("lesson_id", sa.Integer(), nullable=False),
+            sa.Column("completed_at", sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(["enrollment_id"], ["course_enrollments.id"], ondelete="CASCADE"),
+            sa.ForeignKeyConstraint(["lesson_id"], ["lessons.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("id"),
+        )
+    op.create_index("ix_lesson_completions_id", "lesson_completions", ["id"], if_not_exists=True)
+    op.create_index("uq_lesson_completions_enrollment_lesson", "lesson_completions",
+                    ["enrollment_id", "lesson_id"], unique=True, if_not_exists=True)
+    op.create_index("ix_lesson_completions_lesson_id", "lesson_completions", ["lesson_id"],
+                    if_not_exists=True)
+
+
+def downgrade():
+    op.drop_table("lesson_completions")
+    with op.batch_alter_table("course_enrollments") as batch_op:
+        batch_op.drop_column("completed_lessons")
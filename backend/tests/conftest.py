@@ -0,0 +1,92 @@
+"""
+Test setup: the app runs against a throwaway SQLite database and storage
+directory, and every test fails if a request it made ran more SQL
+statements than its route allows with @query_budget.
+
+The query_log fixture lists the requests made during a test for finer
+assertions:
+
+    def test_recent(client, query_log):
+        client.get("/courses/recent")
+        method, route, log = query_log[-1]
+        assert log.count <= 2 and not log.repeated(2)
+"""
+import os
+import sys
+import tempfile
+
+import pytest
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORK_DIR = tempfile.mkdtemp(prefix="backend-tests-")
+
+# Configuration is read at import time, so it has to be set before the app is imported
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{WORK_DIR}/test.db")
+os.environ.setdefault("BASE_FOLDER_DIR", os.path.join(WORK_DIR, "storage"))
+os.environ.setdefault("THUMBNAIL_DIR", os.path.join(WORK_DIR, "thumbnails"))
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("QUERY_LOG_THRESHOLD", "0")
+
+# main.py serves ./static, so run from a directory that has one
+os.makedirs(os.path.join(WORK_DIR, "static"), exist_ok=True)
+os.chdir(WORK_DIR)
+sys.path.insert(0, BACKEND_DIR)
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app.utils.queries import request_listeners  # noqa: E402
+from main import app  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def client():
+    """TestClient with the app lifespan (migrations, background workers) running"""
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture(scope="session")
+def register(client):
+    """Create a user and return Authorization headers for it"""
+    def register_user(username: str, role: str = "user") -> dict:
+        response = client.post("/users", data={
+            "username": username, "email": f"{username}@example.com",
+            "password": "password", "role": role,
+        })
+        assert response.status_code == 201, response.text
+        response = client.post("/token", data={"username": username, "password": "password"})
+        assert response.status_code == 200, response.text
+        return {"Authorization": f"Bearer {response.json()['access_token']}"}
+    return register_user
+
+
+@pytest.fixture(autouse=True)
+def query_budgets():
+    """Fail the test when a route exceeds its declared query budget"""
+    violations = []
+
+    def listener(method, route, log, budget):
+        if budget is not None and log.count > budget:
+            repeated = "".join(f"\n  {n}x {shape[:300]}" for shape, n in log.repeated(2))
+            violations.append(f"{method} {route}: {log.count} queries, budget {budget}{repeated}")
+
+    request_listeners.append(listener)
+    try:
+        yield violations
+    finally:
+        request_listeners.remove(listener)
+    if violations:
+        pytest.fail("Query budget exceeded:\n" + "\n".join(violations), pytrace=False)
+
+
+@pytest.fixture
+def query_log():
+    """(method, route, QueryLog) of every request made during the test"""
+    requests = []
+
+    def listener(method, route, log, budget):
+        requests.append((method, route, log))
+
+    request_listeners.append(listener)
+    yield requests
+    request_listeners.remove(listener)
@@ -0,0 +1,88 @@
+"""Budgeted routes stay within their @query_budget on realistic data"""
+import pytest
+
+
+@pytest.fixture(scope="module")
+def course_data(client, register):
+    admin = register("budget_admin", "admin")
+    teacher = register("budget_teacher", "teacher")
+    student = register("budget_student")
+
+    response = client.post("/courses/categories", json={"name": "Budgets", "slug": "budgets"}, headers=admin)
+    assert response.status_code == 201, response.text
+    category = response.json()
+
+    response = client.post("/courses", json={
+        "title": "Query budgets", "description": "Counting statements",
+        "author": "budget_teacher", "category_ids": [category["id"]],
+    }, headers=teacher)
+    assert response.status_code == 201, response.text
+    course = response.json()
+
+    lessons = []
+    for order in range(1, 6):
+        response = client.post(f"/courses/{course['id']}/lessons", json={
+            "title": f"Lesson {order}", "content": "text " * 100,
+            "order": order, "course_id": course["id"],
+        }, headers=teacher)
+        assert response.status_code == 201, response.text
+        lessons.append(response.json())
+
+    response = client.post("/courses/enroll", json={"course_id": course["id"]}, headers=student)
+    assert response.status_code == 201, response.text
+    return {"course": course, "lessons": lessons, "student": student}
+
+
+def budgeted(query_log, method, route):
+    """QueryLogs of the requests made to one route during the test"""
+    logs = [log for m, r, log in query_log if m == method and r == route]
+    assert logs, f"no {method} {route} request was recorded"
+    return logs
+
+
+def test_get_course(client, course_data, query_log):
+    course_id = course_data["course"]["id"]
+    for headers in ({}, course_data["student"]):
+        response = client.get(f"/courses/{course_id}", headers=headers)
+        assert response.status_code == 200, response.text
+
+    for log in budgeted(query_log, "GET", "/courses/{course_id}"):
+        assert not log.repeated(2)
+
+
+def test_get_course_with_lessons(client, course_data, query_log):
+    course_id = course_data["course"]["id"]
+    response = client.get(f"/courses/{course_id}/with-lessons", headers=course_data["student"])
+    assert response.status_code == 200, response.text
+    assert len(response.json()["lessons"]) == len(course_data["lessons"])
+
+    [log] = budgeted(query_log, "GET", "/courses/{course_id}/with-lessons")
+    assert not log.repeated(2)
+
+
+def test_complete_lesson(client, course_data, query_log):
+    course_id = course_data["course"]["id"]
+    for lesson in course_data["lessons"][:3]:
+        response = client.post(f"/courses/{course_id}/lessons/{lesson['id']}/complete",
+                               headers=course_data["student"])
+        assert response.status_code == 200, response.text
+
+    assert len(budgeted(query_log, "POST", "/courses/{course_id}/lessons/{lesson_id}/complete")) == 3
+
+
+def test_file_tree(client, register, query_log):
+    headers = register("budget_files")
+    parent = None
+    for depth in range(3):
+        response = client.post("/folders", json={"name": f"folder{depth}", "parent": parent}, headers=headers)
+        assert response.status_code == 201, response.text
+        parent = response.json()["id"]
+        response = client.post("/files", files={"file": (f"note{depth}.txt", b"x" * (depth + 1))},
+                               data={"folder": str(parent)}, headers=headers)
+        assert response.status_code == 200, response.text
+
+    response = client.get("/files/tree", headers=headers)
+    assert response.status_code == 200, response.text
+
+    [log] = budgeted(query_log, "GET", "/files/tree")
+    assert not log.repeated(2)
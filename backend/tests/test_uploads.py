@@ -0,0 +1,56 @@
+"""Uploads are parsed from the request stream into a single temp file"""
+import hashlib
+import os
+
+import pytest
+
+from app.utils.uploads import UPLOAD_TMP_DIR
+
+
+@pytest.fixture(scope="module")
+def headers(register):
+    return register("upload_user")
+
+
+def temp_files():
+    return list(UPLOAD_TMP_DIR.glob("*"))
+
+
+def test_large_upload_round_trip(client, headers):
+    # Several UPLOAD_CHUNK_SIZE writes and well past Starlette's 1 MB spool threshold
+    data = os.urandom(3 * 1024 * 1024 + 17)
+    response = client.post("/files", files={"file": ("large.bin", data)}, headers=headers)
+    assert response.status_code == 200, response.text
+    uploaded = response.json()
+    assert uploaded["size"] == len(data)
+    assert uploaded["checksum"] == hashlib.sha256(data).hexdigest()
+
+    response = client.get(f"/files/{uploaded['id']}/download", headers=headers)
+    assert response.content == data
+    assert temp_files() == []
+
+
+def test_upload_into_folder(client, headers):
+    response = client.post("/folders", json={"name": "uploads"}, headers=headers)
+    assert response.status_code == 201, response.text
+    folder = response.json()["id"]
+
+    response = client.post("/files", files={"file": ("нота.txt", "привет".encode())},
+                           data={"folder": str(folder)}, headers=headers)
+    assert response.status_code == 200, response.text
+    assert response.json()["name"] == "нота.txt"
+
+    response = client.post("/files", files={"file": ("x.txt", b"x")},
+                           data={"folder": "not-a-number"}, headers=headers)
+    assert response.status_code == 422
+
+
+@pytest.mark.parametrize("content_type, body, status_code", [
+    ("application/json", b"{}", 400),
+    ("multipart/form-data; boundary=b", b"--b\r\nContent-Disposition: form-data; name=\"folder\"\r\n\r\n1\r\n--b--\r\n", 422),
+    ("multipart/form-data; boundary=b", b"--b\r\nContent-Disposition: form-data; name=\"file\"; filename=\"a\"\r\n\r\ncut", 400),
+])
+def test_rejected_bodies_leave_no_temp_files(client, headers, content_type, body, status_code):
+    response = client.post("/files", content=body, headers={**headers, "Content-Type": content_type})
+    assert response.status_code == status_code, response.text
+    assert temp_files() == []
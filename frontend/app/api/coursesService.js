@@ -115,9 +115,30 @@ export const coursesApi = {
     },
 
     // Получение данных о курсе вместе с уроками
-    getCourseWithLessons: async (courseId) => {
+    // summary = true - только программа курса, без содержимого уроков
+    getCourseWithLessons: async (courseId, summary = false) => {
         try {
-            const response = await apiClient.get(`/courses/${courseId}/with-lessons`);
+            const response = await apiClient.get(`/courses/${courseId}/with-lessons`, { params: { summary } });
+            return response.data;
+        } catch (error) {
+            handleError(error);
+        }
+    },
+
+    // Получение урока со всем содержимым
+    getLesson: async (courseId, lessonId) => {
+        try {
+            const response = await apiClient.get(`/courses/${courseId}/lessons/${lessonId}`);
+            return response.data;
+        } catch (error) {
+            handleError(error);
+        }
+    },
+
+    // Получение только текста урока (HTML)
+    getLessonContent: async (courseId, lessonId) => {
+        try {
+            const response = await apiClient.get(`/courses/${courseId}/lessons/${lessonId}/content`, { responseType: 'text' });
             return response.data;
         } catch (error) {
             handleError(error);
@@ -315,6 +336,26 @@ export const coursesApi = {
         }
     },
 
+    // Отметка урока пройденным
+    completeLesson: async (courseId, lessonId) => {
+        try {
+            const response = await apiClient.post(`/courses/${courseId}/lessons/${lessonId}/complete`);
+            return response.data;
+        } catch (error) {
+            handleError(error);
+        }
+    },
+
+    // Снятие отметки о прохождении урока
+    uncompleteLesson: async (courseId, lessonId) => {
+        try {
+            const response = await apiClient.delete(`/courses/${courseId}/lessons/${lessonId}/complete`);
+            return response.data;
+        } catch (error) {
+            handleError(error);
+        }
+    },
+
     // Создание нового урока
     createLesson: async (courseId, lessonData) => {
         try {
@@ -28,6 +28,14 @@ const fileService = {
         await api.delete(`/folders/${folderId}`);
     },
 
+    // Whole folder tree with subtree sizes and counts
+    getTree: async ({ root = null, depth = null, includeFiles = true } = {}) => {
+        const response = await api.get('/files/tree', {
+            params: { root, depth, include_files: includeFiles }
+        });
+        return response.data;
+    },
+
     // Files operations
     getFiles: async (folderId = null) => {
         const response = await api.get('/files', { 
@@ -33,7 +33,7 @@ export function CourseDetailPage({ courseId }) {
 
                 // Получение курса с уроками если они есть
                 try {
-                    const courseWithLessons = await coursesApi.getCourseWithLessons(currentCourseId);
+                    const courseWithLessons = await coursesApi.getCourseWithLessons(currentCourseId, true);
                     // Если успешно получили детальную информацию с уроками, используем её
                     setCourse({
                         ...courseWithLessons,
@@ -1,8 +1,28 @@
 import { useState } from 'react';
 import { EyeIcon, ChevronDownIcon } from '@heroicons/react/24/outline';
+import { coursesApi } from '../api/coursesService';
 
 export function SyllabusAccordion({ lessons }) {
     const [activeLesson, setActiveLesson] = useState(null);
+    // Текст уроков, загруженный при раскрытии (программа курса приходит без содержимого)
+    const [lessonContents, setLessonContents] = useState({});
+
+    const toggleLesson = async (lesson, index) => {
+        if (activeLesson === index) {
+            setActiveLesson(null);
+            return;
+        }
+        setActiveLesson(index);
+
+        if (lesson.content === undefined && lessonContents[lesson.id] === undefined) {
+            try {
+                const content = await coursesApi.getLessonContent(lesson.course_id, lesson.id);
+                setLessonContents(prev => ({ ...prev, [lesson.id]: content || '' }));
+            } catch (error) {
+                console.warn('Failed to load lesson content:', error);
+            }
+        }
+    };
 
     // Если нет уроков, выводим сообщение
     if (!lessons || lessons.length === 0) {
@@ -15,6 +35,9 @@ export function SyllabusAccordion({ lessons }) {
 
     // Проверяем, имеет ли урок интерактивную сцену
     const hasInteractiveScene = (lesson) => {
+        if (lesson.has_scene !== undefined) {
+            return lesson.has_scene;
+        }
         return lesson.scene_data && lesson.scene_data !== 'null';
     };
 
@@ -26,7 +49,7 @@ export function SyllabusAccordion({ lessons }) {
                 {lessons.map((lesson, index) => (
                     <div key={lesson.id || index} className={`border-b border-gray-200 dark:border-gray-700 ${index === lessons.length - 1 ? 'border-b-0' : ''}`}>
                         <div
-                            onClick={() => setActiveLesson(activeLesson === index ? null : index)}
+                            onClick={() => toggleLesson(lesson, index)}
                             className={`flex items-center justify-between p-4 cursor-pointer transition-colors ${activeLesson === index
                                     ? 'bg-blue-50 dark:bg-blue-900/30'
                                     : 'hover:bg-gray-50 dark:hover:bg-gray-700'
@@ -65,7 +88,7 @@ export function SyllabusAccordion({ lessons }) {
                                                 WebkitMaskImage: 'linear-gradient(to bottom, black 60%, transparent 100%)'
                                             }}
                                         >
-                                            <div dangerouslySetInnerHTML={{ __html: lesson.content }} />
+                                            <div dangerouslySetInnerHTML={{ __html: lesson.content ?? lessonContents[lesson.id] ?? '' }} />
                                         </div>
                                     </>
 